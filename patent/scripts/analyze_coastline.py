@@ -5,45 +5,54 @@ analyze_coastline.py
 OSM海岸線データを航空写真に描画し、釣り座・テトラ帯を自動判定する。
 
 判定ロジック:
+  - 公園ポリゴンがある場合の分類は coastline_store（way ごとの分類済みストア）から引く
+  - ない場合は OSM海岸線のwayを連結・簡略化してから分類（coastline_geometry）
   - OSM公園ポリゴン範囲内の海岸線 → 釣り座（緑）
   - 範囲外で短いセグメント密集 → テトラ帯（赤）
   - 範囲外で長い直線 → 立入禁止（赤太）
   - その他 → 港湾施設等（黄）
 
 使用方法:
-    python analyze_coastline.py <slug>
+    python analyze_coastline.py <slug> [--scale 2|4|8] [--offline] [--overlay] [--mvt]
+        --scale:   縮小デコードでプレビュー
+        --overlay: 航空写真を読み直さず、透明PNGのオーバーレイ（{slug}_analyzed_overlay.png）だけを出力
+        --mvt:     分類結果をベクタータイル（satellite/coastline.mbtiles, z12〜z18）にも反映（coastline_tiles）
+
+    python analyze_coastline.py <slug> <slug> ... | --all [--workers N] [--scale ...] [--offline] [--overlay] [--mvt]
+        複数スポット（--all は航空写真のある全スポット）をプロセスプールで並列に分析し、
+        釣り座・テトラ帯の長さを satellite/coastline_summary.csv にまとめる。
+        --workers: プロセス数（既定はCPUコア数）。各ワーカーは osm_cache を1回だけ開いて使い回す
+        --offline: Overpassに問い合わせず osm_cache（osm_ingest.py で取り込んだ範囲）だけで答える
 """
 
+import io
+import os
+import csv
 import sys
 import json
 import math
+import time
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from urllib.request import urlopen, Request
+
+import numpy as np
 from PIL import Image, ImageDraw
 
+from mosaic import aerial_size, load_aerial
+from coastline_geometry import simplify_coastlines
+from coastline_segments import PLATFORM, SEGMENT_TYPES, TETRAPOD, classify_array, to_segment_dicts, type_lengths
+from coastline_store import ClassifiedCoastline
+from coastline_tiles import CoastlineTiles
+from osm_cache import OverpassCache
+from projection import MosaicTransform
+
 
 STRUCTURES_DIR = Path(__file__).parent.parent / "data" / "structures"
 SATELLITE_DIR = Path(__file__).parent / "satellite"
-CACHE_DIR = Path(__file__).parent / "satellite" / "cache"
-
-
-def latlng_to_tile_float(lat: float, lng: float, zoom: int) -> tuple[float, float]:
-    """緯度経度 → タイル座標（小数付き）"""
-    n = 2 ** zoom
-    x = (lng + 180.0) / 360.0 * n
-    lat_rad = math.radians(lat)
-    y = (1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * n
-    return x, y
-
-
-def latlng_to_pixel(
-    lat: float, lng: float, zoom: int, tile_x_min: int, tile_y_min: int
-) -> tuple[int, int]:
-    """緯度経度 → 画像上のピクセル座標"""
-    tx, ty = latlng_to_tile_float(lat, lng, zoom)
-    px = int((tx - tile_x_min) * 256)
-    py = int((ty - tile_y_min) * 256)
-    return px, py
+SUMMARY_PATH = SATELLITE_DIR / "coastline_summary.csv"
+# サマリー表に出す種別
+SUMMARY_TYPES = ("platform", "tetrapod", "restricted", "port")
 
 
 def haversine(lat1, lon1, lat2, lon2):
@@ -57,147 +66,67 @@ def haversine(lat1, lon1, lat2, lon2):
     return R * 2 * math.asin(math.sqrt(a))
 
 
-def point_in_polygon(lat: float, lon: float, polygon: list[tuple[float, float]]) -> bool:
-    """Ray casting法で点がポリゴン内かを判定"""
-    n = len(polygon)
-    inside = False
-    j = n - 1
-    for i in range(n):
-        yi, xi = polygon[i]
-        yj, xj = polygon[j]
-        if ((yi > lon) != (yj > lon)) and (lat < (xj - xi) * (lon - yi) / (yj - yi) + xi):
-            inside = not inside
-        j = i
-    return inside
-
-
-def point_near_polygon(lat: float, lon: float, polygon: list[tuple[float, float]], threshold_m: float = 30) -> bool:
-    """点がポリゴンの辺から threshold_m 以内か、またはポリゴン内かを判定"""
-    if point_in_polygon(lat, lon, polygon):
-        return True
-    # 各辺との最短距離を計算
-    for i in range(len(polygon) - 1):
-        d = _point_to_segment_distance(lat, lon, polygon[i], polygon[i + 1])
-        if d < threshold_m:
-            return True
-    return False
-
-
-def _point_to_segment_distance(lat, lon, p1, p2):
-    """点から線分への最短距離（メートル）"""
-    lat1, lon1 = p1
-    lat2, lon2 = p2
-    dx = (lon2 - lon1) * math.cos(math.radians(lat1))
-    dy = lat2 - lat1
-    line_len_sq = dx * dx + dy * dy
-    if line_len_sq < 1e-12:
-        return haversine(lat, lon, lat1, lon1)
-    px = (lon - lon1) * math.cos(math.radians(lat1))
-    py = lat - lat1
-    t = max(0, min(1, (px * dx + py * dy) / line_len_sq))
-    proj_lon = lon1 + t * (lon2 - lon1)
-    proj_lat = lat1 + t * (lat2 - lat1)
-    return haversine(lat, lon, proj_lat, proj_lon)
-
-
-def overpass_query(query_body: str, cache_key: str) -> dict:
-    """Overpass APIクエリ実行（キャッシュ付き）"""
-    CACHE_DIR.mkdir(parents=True, exist_ok=True)
-    cache_file = CACHE_DIR / f"{cache_key}.json"
-    if cache_file.exists():
-        print(f"  キャッシュ使用: {cache_file.name}")
-        with open(cache_file, "r", encoding="utf-8") as f:
-            return json.load(f)
-
-    query = f'[out:json][timeout:30];{query_body}'
-    url = 'https://overpass-api.de/api/interpreter'
-    req = Request(url, data=f'data={query}'.encode(), method='POST')
-    with urlopen(req, timeout=40) as resp:
-        data = json.loads(resp.read())
-    with open(cache_file, "w", encoding="utf-8") as f:
-        json.dump(data, f)
-    print(f"  キャッシュ保存: {cache_file.name}")
-    return data
-
-
-def parse_ways(data: dict) -> tuple[dict, list]:
-    """Overpassレスポンスからノードとwayを抽出"""
-    nodes = {}
-    ways = []
-    for e in data['elements']:
-        if e['type'] == 'node':
-            nodes[e['id']] = (e['lat'], e['lon'])
-        elif e['type'] == 'way':
-            ways.append(e)
-    return nodes, ways
-
-
-def fetch_coastline(bbox: tuple[float, float, float, float], slug: str = "") -> list[list[tuple[float, float]]]:
-    """Overpass APIで海岸線のノード座標列を取得"""
-    south, west, north, east = bbox
-    query_body = (
-        f'way["natural"="coastline"]({south},{west},{north},{east});'
-        f'(._;>;);out body;'
-    )
-    data = overpass_query(query_body, f"{slug}_coastline")
-
-    nodes, ways = parse_ways(data)
-    coastlines = []
-    for w in ways:
-        coords = [nodes[nid] for nid in w.get('nodes', []) if nid in nodes]
-        if coords:
-            coastlines.append(coords)
-    return coastlines
-
-
-def fetch_park_polygon(park_name: str, bbox: tuple[float, float, float, float], slug: str = "", center: tuple[float, float] | None = None) -> list[tuple[float, float]] | None:
-    """OSMから公園ポリゴンを取得（釣り関連のleisure=parkを検索）"""
-    south, west, north, east = bbox
-    # 釣り関連の名前パターンで検索
-    query_body = (
-        f'('
-        f'way["leisure"~"park|fishing"]["name"~"釣|つり|フィッシング|海づり"]'
-        f'({south},{west},{north},{east});'
-        f'way["leisure"~"park|fishing"]["url"]'
-        f'({south},{west},{north},{east});'
-        f');'
-        f'(._;>;);out body;'
-    )
-    data = overpass_query(query_body, f"{slug}_park")
-
-    nodes, ways = parse_ways(data)
-    if not ways:
+def fetch_coastline(
+    bbox: tuple[float, float, float, float], slug: str = "", cache: OverpassCache | None = None
+) -> list[list[tuple[float, float]]]:
+    """海岸線のノード座標列を取得（osm_cache 経由。未取得範囲だけOverpassに問い合わせ）"""
+    cache = cache or OverpassCache()
+    return cache.query("coastline", bbox, f"{slug}_coastline" if slug else None).coastlines()
+
+
+def fetch_park(
+    bbox: tuple[float, float, float, float],
+    slug: str = "",
+    center: tuple[float, float] | None = None,
+    cache: OverpassCache | None = None,
+) -> tuple[int, list[tuple[float, float]]] | None:
+    """OSMから公園を選ぶ（釣り関連のleisure=park、osm_cache.LAYERS["park"] で検索）。(way ID, ノード座標列)"""
+    cache = cache or OverpassCache()
+    parks = cache.query("park", bbox, f"{slug}_park" if slug else None)
+    if not len(parks):
         return None
 
     # スポット中心座標に最も近いwayを選択
-    best_way = None
+    best = None
     best_dist = float('inf')
-    for w in ways:
-        way_coords = [nodes[nid] for nid in w.get('nodes', []) if nid in nodes]
-        if not way_coords:
+    for i in range(len(parks)):
+        _, lat, lon = parks.way_coords(i)
+        if not len(lat):
             continue
         # ポリゴン重心
-        avg_lat = sum(c[0] for c in way_coords) / len(way_coords)
-        avg_lon = sum(c[1] for c in way_coords) / len(way_coords)
+        avg_lat = float(lat.mean())
+        avg_lon = float(lon.mean())
         if center:
             d = haversine(center[0], center[1], avg_lat, avg_lon)
         else:
             d = 0
-        tags = w.get('tags', {})
+        tags = parks.way_tags[i]
         # URL付き（公式サイト持ち）はボーナス
         if tags.get('url') or tags.get('website'):
             d -= 10000
         if d < best_dist:
             best_dist = d
-            best_way = w
+            best = i
 
-    if not best_way:
+    if best is None:
         return None
 
-    coords = [nodes[nid] for nid in best_way.get('nodes', []) if nid in nodes]
-    tags = best_way.get('tags', {})
-    print(f"  公園ポリゴン: way/{best_way['id']} ({tags.get('name', '?')}) {len(coords)}ノード")
-    return coords
+    coords = parks.coord_list(best)
+    tags = parks.way_tags[best]
+    print(f"  公園ポリゴン: way/{parks.way_ids[best]} ({tags.get('name', '?')}) {len(coords)}ノード")
+    return int(parks.way_ids[best]), coords
+
+
+def fetch_park_polygon(
+    park_name: str,
+    bbox: tuple[float, float, float, float],
+    slug: str = "",
+    center: tuple[float, float] | None = None,
+    cache: OverpassCache | None = None,
+) -> list[tuple[float, float]] | None:
+    """OSMから公園ポリゴンを取得（fetch_park の座標列だけ）"""
+    park = fetch_park(bbox, slug, center, cache)
+    return park[1] if park else None
 
 
 def classify_segments(
@@ -210,63 +139,36 @@ def classify_segments(
     海岸線セグメントを分類:
       - 'platform':   公園ポリゴン内 → 釣り座（コンクリ護岸）
       - 'tetrapod':   ノード密度高い → テトラ帯
-      - 'restricted': 範囲外の大きな構造物 → 立入禁止
-      - 'port':       その他 → 港湾施設等
+      - 'outside':    範囲外
+
+    計算は coastline_segments.classify_array（一括版）で行い、従来の dict のリストで返す。
     """
-    segments = []
-    for i in range(len(coords) - 1):
-        lat1, lon1 = coords[i]
-        lat2, lon2 = coords[i + 1]
-        dist = haversine(lat1, lon1, lat2, lon2)
-        segments.append({
-            "start": coords[i],
-            "end": coords[i + 1],
-            "dist": dist,
-            "type": "unknown",
-        })
-
-    # 分類: 公園ポリゴンがある場合はポリゴン内判定
-    if park_polygon:
-        for seg in segments:
-            mid_lat = (seg["start"][0] + seg["end"][0]) / 2
-            mid_lon = (seg["start"][1] + seg["end"][1]) / 2
-            if point_near_polygon(mid_lat, mid_lon, park_polygon, 30):
-                seg["type"] = "platform"
-            else:
-                seg["type"] = "outside"
-    elif fishing_west and fishing_east:
-        # フォールバック: structureEndpointsからの距離判定
-        for seg in segments:
-            mid_lat = (seg["start"][0] + seg["end"][0]) / 2
-            mid_lon = (seg["start"][1] + seg["end"][1]) / 2
-            dist_w = haversine(mid_lat, mid_lon, fishing_west[0], fishing_west[1])
-            dist_e = haversine(mid_lat, mid_lon, fishing_east[0], fishing_east[1])
-            total_len = haversine(fishing_west[0], fishing_west[1], fishing_east[0], fishing_east[1])
-            if dist_w < total_len * 1.1 and dist_e < total_len * 1.1:
-                seg["type"] = "platform"
-            else:
-                seg["type"] = "outside"
-    else:
-        for seg in segments:
-            seg["type"] = "outside"
+    return to_segment_dicts(classify_array([coords], park_polygon, fishing_west, fishing_east))
 
-    # 公園内セグメントのうち、テトラ帯を細分（短いセグメント密集）
-    for i in range(len(segments)):
-        if segments[i]["type"] != "platform":
-            continue
-        if segments[i]["dist"] < 30:
-            short_count = 0
-            for j in range(max(0, i - 3), min(len(segments), i + 4)):
-                if segments[j]["dist"] < 50:
-                    short_count += 1
-            if short_count >= 3:
-                segments[i]["type"] = "tetrapod"
 
-    return segments
+def segment_runs(segments: np.ndarray, visible: np.ndarray | None = None) -> list[tuple[int, int]]:
+    """
+    同じway・同じ種別が続くセグメントの区間 [start, end) のリスト。
+    visible を渡すと、見えないセグメントで区間を切り、見えない区間は返さない。
+    """
+    n = len(segments)
+    if n == 0:
+        return []
+    breaks = np.zeros(n, dtype=bool)
+    breaks[0] = True
+    breaks[1:] = (segments["way"][1:] != segments["way"][:-1]) | (segments["type"][1:] != segments["type"][:-1])
+    if visible is not None:
+        breaks[1:] |= visible[1:] != visible[:-1]
+    starts = np.flatnonzero(breaks)
+    ends = np.append(starts[1:], n)
+    if visible is not None:
+        keep = visible[starts]
+        starts, ends = starts[keep], ends[keep]
+    return list(zip(starts.tolist(), ends.tolist()))
 
 
 def draw_on_image(
-    image_path: str,
+    image: str | Image.Image,
     coastlines: list[list[tuple[float, float]]],
     zoom: int,
     tile_x_min: int,
@@ -275,10 +177,20 @@ def draw_on_image(
     park_polygon: list[tuple[float, float]] | None = None,
     fishing_west: tuple[float, float] | None = None,
     fishing_east: tuple[float, float] | None = None,
+    scale: int = 1,
+    segments: np.ndarray | None = None,
 ):
-    """航空写真に海岸線セグメントを色分けして描画"""
-    img = Image.open(image_path).convert("RGB")
+    """
+    航空写真（パスまたは読み込み済み画像）に海岸線セグメントを色分けして描画。
+    scale=2/4/8 は1/scaleで縮小デコードした画像（プレビュー）への描画。
+
+    全wayを1回で分類・投影し、同じ種別が続く区間を1本のポリラインとして描く。
+    画像の外にあるセグメントは描かない。RGBA の透明画像を渡すとオーバーレイだけを PNG で保存する。
+    segments（classify_array の結果）を渡すと分類をやり直さない。
+    """
+    img = Image.open(image).convert("RGB") if isinstance(image, str) else image
     draw = ImageDraw.Draw(img)
+    transform = MosaicTransform(zoom, tile_x_min, tile_y_min, scale=scale)
 
     colors = {
         "platform": (0, 255, 0),      # 緑 = 釣り座
@@ -286,48 +198,43 @@ def draw_on_image(
         "restricted": (255, 0, 0),     # 赤太 = 立入禁止
         "port": (255, 255, 0),         # 黄 = 港湾施設
     }
+    widths = {"platform": 6, "tetrapod": 4}
 
     legend_labels = {
         "platform": "釣り座（コンクリ護岸）",
         "tetrapod": "テトラ帯（立入困難）",
     }
 
-    stats = {"platform": 0, "tetrapod": 0, "restricted": 0, "port": 0}
-
-    for coords in coastlines:
-        segments = classify_segments(coords, park_polygon, fishing_west, fishing_east)
-
-        for seg in segments:
-            # 公園範囲内のセグメントのみ描画（範囲外はスキップ）
-            if seg["type"] not in ("platform", "tetrapod"):
-                continue
-
-            lat1, lon1 = seg["start"]
-            lat2, lon2 = seg["end"]
-            px1, py1 = latlng_to_pixel(lat1, lon1, zoom, tile_x_min, tile_y_min)
-            px2, py2 = latlng_to_pixel(lat2, lon2, zoom, tile_x_min, tile_y_min)
-
-            color = colors.get(seg["type"], (128, 128, 128))
-            width = 6 if seg["type"] == "platform" else 4
-
-            draw.line([(px1, py1), (px2, py2)], fill=color, width=width)
-
-            r = 4
-            draw.ellipse([px1 - r, py1 - r, px1 + r, py1 + r], fill=color)
-            draw.ellipse([px2 - r, py2 - r, px2 + r, py2 + r], fill=color)
-
-            stats[seg["type"]] += seg["dist"]
+    if segments is None:
+        segments = classify_array(coastlines, park_polygon, fishing_west, fishing_east)
+    lengths = type_lengths(segments)
+    stats = {name: lengths[name] for name in ("platform", "tetrapod", "restricted", "port")}
+
+    # 公園範囲内のセグメントのみ描画（範囲外はスキップ）
+    segments = segments[np.isin(segments["type"], (PLATFORM, TETRAPOD))]
+    if len(segments):
+        x1, y1 = transform.to_pixel_array(segments["start_lat"], segments["start_lng"])
+        x2, y2 = transform.to_pixel_array(segments["end_lat"], segments["end_lng"])
+        # 見える範囲（線幅ぶんの余白込み）に掛かるセグメントだけ描く
+        r = 4
+        margin = max(widths.values()) + r
+        visible = (
+            (np.maximum(x1, x2) >= -margin) & (np.minimum(x1, x2) <= img.width + margin)
+            & (np.maximum(y1, y2) >= -margin) & (np.minimum(y1, y2) <= img.height + margin)
+        )
+        for a, b in segment_runs(segments, visible):
+            seg_type = SEGMENT_TYPES[segments["type"][a]]
+            color = colors[seg_type]
+            points = list(zip(x1[a:b].tolist(), y1[a:b].tolist())) + [(float(x2[b - 1]), float(y2[b - 1]))]
+            draw.line(points, fill=color, width=widths[seg_type], joint="curve")
+            for px, py in (points[0], points[-1]):
+                draw.ellipse([px - r, py - r, px + r, py + r], fill=color)
 
     # 公園ポリゴンの境界を半透明で描画
     if park_polygon:
-        poly_pixels = [
-            latlng_to_pixel(lat, lon, zoom, tile_x_min, tile_y_min)
-            for lat, lon in park_polygon
-        ]
+        poly_pixels = [tuple(p) for p in transform.coords_to_pixels(park_polygon).tolist()]
         # ポリゴン境界線（シアン破線風）
-        for i in range(len(poly_pixels) - 1):
-            draw.line([poly_pixels[i], poly_pixels[i + 1]],
-                      fill=(0, 200, 255), width=2)
+        draw.line(poly_pixels, fill=(0, 200, 255), width=2)
 
     # 凡例を描画
     legend_y = 30
@@ -343,62 +250,77 @@ def draw_on_image(
         draw.rectangle([30, legend_y, 60, legend_y + 20], fill=(0, 200, 255), outline=(255, 255, 255))
         draw.text((70, legend_y + 2), "OSM park boundary", fill=(255, 255, 255))
 
-    img.save(output_path, "JPEG", quality=95)
+    if img.mode == "RGBA":
+        img.save(output_path, "PNG")
+    else:
+        img.save(output_path, "JPEG", quality=95)
     return stats
 
 
-def main():
-    if len(sys.argv) < 2:
-        print("使用方法: python analyze_coastline.py <slug>")
-        sys.exit(1)
-
-    slug = sys.argv[1]
-
-    # 構造JSONから情報を読み込み
+def load_structure(slug: str) -> dict:
+    """構造JSONを読み込む（structureEndpoints がなければ ValueError）"""
     json_path = STRUCTURES_DIR / f"{slug}.json"
     if not json_path.exists():
-        print(f"エラー: {json_path} が見つかりません")
-        sys.exit(1)
+        raise FileNotFoundError(f"{json_path} が見つかりません")
 
     with open(json_path, "r", encoding="utf-8") as f:
         structure = json.load(f)
 
     endpoints = structure.get("structureEndpoints", {})
-    west = endpoints.get("west", {})
-    east = endpoints.get("east", {})
+    if not endpoints.get("west") or not endpoints.get("east"):
+        raise ValueError("structureEndpointsが見つかりません")
+    return structure
 
-    if not west or not east:
-        print("エラー: structureEndpointsが見つかりません")
-        sys.exit(1)
+
+def spot_bbox(structure: dict, margin: float = 0.005) -> tuple[float, float, float, float]:
+    """OSMを取得する範囲（structureEndpoints + マージン）"""
+    west = structure["structureEndpoints"]["west"]
+    east = structure["structureEndpoints"]["east"]
+    return (
+        min(west["lat"], east["lat"]) - margin,
+        min(west["lng"], east["lng"]) - margin,
+        max(west["lat"], east["lat"]) + margin,
+        max(west["lng"], east["lng"]) + margin,
+    )
+
+
+def analyze_spot(
+    slug: str,
+    scale: int = 1,
+    offline: bool = False,
+    overlay: bool = False,
+    osm: OverpassCache | None = None,
+    mvt: bool = False,
+) -> dict:
+    """
+    1スポットを分析して描画し、種別ごとの長さ（m）・出力パス・分類結果（segments）を返す。
+    osm を渡すとその OverpassCache を使う（バッチのワーカーで使い回す）。
+    mvt=True なら分類結果をベクタータイル（coastline_tiles）にも反映する。
+    """
+    # 構造JSONから情報を読み込み
+    structure = load_structure(slug)
+    west = structure["structureEndpoints"]["west"]
+    east = structure["structureEndpoints"]["east"]
 
     # メタデータから画像情報を取得
     meta_path = SATELLITE_DIR / f"{slug}.meta.json"
     with open(meta_path, "r", encoding="utf-8") as f:
         meta = json.load(f)
 
-    zoom = meta["zoom"]
-    grid_size = meta["gridSize"]
-    tile_center_x = meta["tileCenter"]["x"]
-    tile_center_y = meta["tileCenter"]["y"]
-    half = grid_size // 2
-    tile_x_min = tile_center_x - half
-    tile_y_min = tile_center_y - half
+    transform = MosaicTransform.from_meta(meta)
 
     # 範囲（structureEndpoints + マージン）
-    margin = 0.005
-    bbox = (
-        min(west["lat"], east["lat"]) - margin,
-        min(west["lng"], east["lng"]) - margin,
-        max(west["lat"], east["lat"]) + margin,
-        max(west["lng"], east["lng"]) + margin,
-    )
+    bbox = spot_bbox(structure)
 
     print(f"=== 海岸線分析: {slug} ===")
 
     # OSM公園ポリゴンを取得
     center = (structure["coordinates"]["lat"], structure["coordinates"]["lng"])
     print(f"公園ポリゴン取得中...")
-    park_polygon = fetch_park_polygon("", bbox, slug, center)
+    if osm is None:
+        osm = OverpassCache(offline=offline)
+    park = fetch_park(bbox, slug, center, osm)
+    park_id, park_polygon = park if park else (None, None)
 
     if park_polygon:
         print(f"  → 公園ポリゴンで分類します")
@@ -407,23 +329,48 @@ def main():
 
     # OSM海岸線を取得
     print(f"OSM海岸線取得中... bbox={bbox}")
-    coastlines = fetch_coastline(bbox, slug)
+    coastlines = fetch_coastline(bbox, slug, osm)
     total_nodes = sum(len(c) for c in coastlines)
     print(f"  {len(coastlines)} ways, {total_nodes} nodes")
 
     # 航空写真に描画
-    image_path = str(SATELLITE_DIR / f"{slug}.jpg")
-    output_path = str(SATELLITE_DIR / f"{slug}_analyzed.jpg")
+    # --scale 指定時は縮小デコードした画像に描画（プレビュー）
+    # --overlay 指定時は写真をデコードせず、同じサイズの透明画像に描く
+    suffix = f"_analyzed_s{scale}" if scale > 1 else "_analyzed"
+    if overlay:
+        width, height = aerial_size(slug, SATELLITE_DIR)
+        image = Image.new("RGBA", (-(-width // scale), -(-height // scale)), (0, 0, 0, 0))
+        output_path = str(SATELLITE_DIR / f"{slug}{suffix}_overlay.png")
+    else:
+        image = load_aerial(slug, satellite_dir=SATELLITE_DIR, scale=scale)
+        output_path = str(SATELLITE_DIR / f"{slug}{suffix}.jpg")
 
     fishing_west = (west["lat"], west["lng"])
     fishing_east = (east["lat"], east["lng"])
 
+    if park_polygon:
+        # 選んだ公園による分類は分類ストアから引く（変化した way だけ再分類）。
+        # ストアは way ごとに公園まわりを固定して簡略化してから分類する。公園による分類は
+        # structureEndpoints を使わないので fishing_west/east は渡さない（classify_array と同じ結果）
+        with ClassifiedCoastline(osm=osm) as store:
+            segments = store.query(park_id, bbox)
+    else:
+        # wayを連結して簡略化（テトラ帯候補の頂点は固定）してから分類
+        coastlines = simplify_coastlines(coastlines)
+        print(f"  連結・簡略化 → {len(coastlines)} lines, {sum(len(c) for c in coastlines)} nodes")
+        segments = classify_array(coastlines, None, fishing_west, fishing_east)
+
     print(f"描画中...")
     stats = draw_on_image(
-        image_path, coastlines, zoom, tile_x_min, tile_y_min, output_path,
-        park_polygon, fishing_west, fishing_east,
+        image, coastlines, transform.zoom, transform.tile_x_min, transform.tile_y_min, output_path,
+        park_polygon, fishing_west, fishing_east, scale, segments,
     )
 
+    if mvt:
+        with CoastlineTiles() as tiles:
+            result = tiles.update({slug: segments})
+        print(f"ベクタータイル: {result['written']}タイル更新 → {tiles.path}")
+
     print(f"\n=== 結果 ===")
     print(f"  釣り座（緑）:     {stats['platform']:.0f}m")
     print(f"  テトラ帯（赤）:   {stats['tetrapod']:.0f}m")
@@ -443,6 +390,169 @@ def main():
         print(f"    東端: ({east_node[0]:.7f}, {east_node[1]:.7f})")
         print(f"    距離: {ep_dist:.0f}m")
 
+    return {
+        "slug": slug,
+        **{key: stats[key] for key in SUMMARY_TYPES},
+        "park": bool(park_polygon),
+        "nodes": total_nodes,
+        "output": output_path,
+        "segments": segments,
+    }
+
+
+# ---------------------------------------------------------------------------
+# バッチ（プロセスプール）
+# ---------------------------------------------------------------------------
+
+# ワーカープロセスごとに1つ開く OverpassCache（SQLite接続・R-tree）
+_worker_osm: OverpassCache | None = None
+
+
+def _init_worker(offline: bool):
+    global _worker_osm
+    _worker_osm = OverpassCache(offline=offline)
+
+
+def _analyze_worker(slug: str, scale: int, overlay: bool, mvt: bool) -> dict:
+    """
+    ワーカーで1スポットを分析。ログは捨て、失敗は error に入れて返す。
+    ベクタータイルは親プロセスでまとめて更新するので、mvt なら分類結果だけ持ち帰る。
+    """
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = analyze_spot(slug, scale, overlay=overlay, osm=_worker_osm)
+        if not mvt:
+            del result["segments"]
+    except Exception as e:
+        result = {"slug": slug, "error": f"{type(e).__name__}: {e}"}
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def batch_slugs() -> list[str]:
+    """航空写真（meta.json）がある全スポット"""
+    return [p.stem for p in sorted(STRUCTURES_DIR.glob("*.json"))
+            if (SATELLITE_DIR / f"{p.stem}.meta.json").exists()]
+
+
+def analyze_batch(
+    slugs: list[str],
+    workers: int | None = None,
+    scale: int = 1,
+    offline: bool = False,
+    overlay: bool = False,
+    summary_path: str | Path = SUMMARY_PATH,
+    mvt: bool = False,
+) -> list[dict]:
+    """
+    複数スポットをプロセスプールで分析し、サマリー表（CSV）を書き出す。
+    workers を省略するとCPUコア数（スポット数が少なければその数）。
+    mvt=True なら全スポットの分類結果でベクタータイルを1回で更新する（重なるタイルの作り直しも1回）。
+    """
+    workers = max(1, min(workers or os.cpu_count() or 1, len(slugs)))
+    print(f"=== 海岸線分析（バッチ）: {len(slugs)}件, {workers}プロセス ===")
+
+    # 未取得のOSMは近いスポットごとにまとめて取得しておく（ワーカーはキャッシュから読むだけになる）
+    if not offline:
+        bboxes = {}
+        for slug in slugs:
+            try:
+                bboxes[slug] = spot_bbox(load_structure(slug))
+            except (FileNotFoundError, ValueError):
+                pass  # ワーカー側でエラーとして記録される
+        with OverpassCache() as osm:
+            requests = osm.prefetch(bboxes)
+        print(f"  OSM事前取得: {len(bboxes)}スポット, Overpass {requests}回")
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(offline,)) as pool:
+        futures = [pool.submit(_analyze_worker, slug, scale, overlay, mvt) for slug in slugs]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            if "error" in result:
+                status = f"エラー: {result['error']}"
+            else:
+                status = f"釣り座 {result['platform']:.0f}m, テトラ帯 {result['tetrapod']:.0f}m"
+            print(f"  [{done}/{len(slugs)}] {result['slug']}: {status} ({result['seconds']:.1f}s)")
+
+    results.sort(key=lambda r: r["slug"])
+    if mvt:
+        spots = {r["slug"]: r.pop("segments") for r in results if "segments" in r}
+        if spots:
+            with CoastlineTiles() as tiles:
+                updated = tiles.update(spots)
+            print(f"  ベクタータイル: {len(spots)}スポット, {updated['written']}タイル更新 → {tiles.path}")
+    write_summary(results, summary_path)
+    return results
+
+
+def write_summary(results: list[dict], path: str | Path = SUMMARY_PATH):
+    """スポットごとの長さをCSVに書き出し、表として表示"""
+    fields = ["slug", *SUMMARY_TYPES, "park", "nodes", "seconds", "output", "error"]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fields, extrasaction="ignore")
+        writer.writeheader()
+        for r in results:
+            row = dict(r)
+            for key in (*SUMMARY_TYPES, "seconds"):
+                if key in row:
+                    row[key] = f"{row[key]:.1f}"
+            writer.writerow(row)
+
+    width = max([len(r["slug"]) for r in results] + [4])
+    print(f"\n{'slug':<{width}}  {'釣り座(m)':>9}  {'テトラ帯(m)':>10}  公園")
+    for r in results:
+        if "error" in r:
+            print(f"{r['slug']:<{width}}  {'-':>9}  {'-':>10}  {r['error']}")
+        else:
+            print(f"{r['slug']:<{width}}  {r['platform']:>9.0f}  {r['tetrapod']:>10.0f}  "
+                  f"{'あり' if r['park'] else 'なし'}")
+    failed = sum(1 for r in results if "error" in r)
+    print(f"\n  {len(results) - failed}件成功, {failed}件失敗 → {path}")
+
+
+def main():
+    args = sys.argv[1:]
+    offline = "--offline" in args
+    if offline:
+        args.remove("--offline")
+    overlay = "--overlay" in args
+    if overlay:
+        args.remove("--overlay")
+    scale = 1
+    if "--scale" in args:
+        i = args.index("--scale")
+        scale = int(args[i + 1])
+        del args[i:i + 2]
+    mvt = "--mvt" in args
+    if mvt:
+        args.remove("--mvt")
+    workers = None
+    if "--workers" in args:
+        i = args.index("--workers")
+        workers = int(args[i + 1])
+        del args[i:i + 2]
+    if len(args) < 1:
+        print("使用方法:")
+        print("  python analyze_coastline.py <slug> [--scale 2|4|8] [--offline] [--overlay] [--mvt]")
+        print("  python analyze_coastline.py <slug> <slug> ... | --all [--workers N] [...]")
+        sys.exit(1)
+
+    if args == ["--all"] or len(args) > 1:
+        slugs = batch_slugs() if args == ["--all"] else args
+        if not slugs:
+            print("エラー: 分析できるスポットがありません")
+            sys.exit(1)
+        results = analyze_batch(slugs, workers, scale, offline, overlay, mvt=mvt)
+        sys.exit(1 if any("error" in r for r in results) else 0)
+
+    try:
+        analyze_spot(args[0], scale, offline, overlay, mvt=mvt)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"エラー: {e}")
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+coastline_geometry.py
+
+分類前の海岸線の前処理: way の連結と、テトラ帯の手がかりを残した簡略化。
+
+OSMの海岸線は細切れのwayで返り、下流（分類・描画・合成マップの距離計算）は
+生のノードを全部なめていた。ここでは
+  - stitch_coastlines: 端点を共有するwayを1本のポリラインに連結
+    （海岸線は「陸が左」の向きで揃っているので、終点→始点の向きだけでつなぐ）
+  - simplify_coastlines: 局所平面（メートル）での Douglas–Peucker 簡略化
+を行う。
+
+テトラ帯の判定（coastline_segments）は「短いセグメントの密集」、つまりノード密度そのもの
+なので、密な区間を間引くと判定が変わる。そこで分類に効く頂点は固定（削除しない）する:
+  - 公園ポリゴン（PolygonIndex）を渡した場合: 公園の判定範囲に掛かるセグメントの頂点
+  - 渡さない場合: テトラ帯候補（短いセグメントの密集）の頂点
+固定範囲は判定窓（前後 SHORT_WINDOW 本）の分だけ広げるので、固定範囲内の分類結果は
+簡略化前と同じになる。間引くのは公園から離れた区間・まばらな区間だけ。
+
+使用方法:
+    python coastline_geometry.py check     # 連結・簡略化と分類結果の保持を確認
+"""
+
+import sys
+import math
+import time
+
+import numpy as np
+
+from coastline_segments import (
+    SHORT_MIN_COUNT,
+    SHORT_WINDOW,
+    TETRAPOD_MAX_M,
+    build_segments,
+    classify_array,
+    midpoints,
+    short_window_counts,
+    type_lengths,
+)
+from polygon_index import PolygonIndex
+from projection import split_latlng
+
+
+EARTH_RADIUS_M = 6371000
+# 簡略化の許容誤差（m）。z18 の1ピクセル（約0.5m）の数倍
+DEFAULT_TOLERANCE_M = 2.0
+
+
+def stitch_coastlines(coastlines: list[list[tuple[float, float]]]) -> list[list[tuple[float, float]]]:
+    """終点と始点が一致するwayをつないで連続したポリラインにする"""
+    coastlines = [c for c in coastlines if c]
+    by_start: dict[tuple[float, float], list[int]] = {}
+    by_end: dict[tuple[float, float], list[int]] = {}
+    for i, coords in enumerate(coastlines):
+        by_start.setdefault(tuple(coords[0]), []).append(i)
+        by_end.setdefault(tuple(coords[-1]), []).append(i)
+
+    used = [False] * len(coastlines)
+
+    def take(index: dict, point: tuple[float, float]) -> int | None:
+        for j in index.get(point, []):
+            if not used[j]:
+                used[j] = True
+                return j
+        return None
+
+    stitched = []
+    for i, coords in enumerate(coastlines):
+        if used[i]:
+            continue
+        used[i] = True
+        line = list(coords)
+        # 前方へ延長
+        while tuple(line[-1]) != tuple(line[0]):
+            j = take(by_start, tuple(line[-1]))
+            if j is None:
+                break
+            line.extend(coastlines[j][1:])
+        # 後方へ延長（閉じていなければ）
+        while tuple(line[-1]) != tuple(line[0]):
+            j = take(by_end, tuple(line[0]))
+            if j is None:
+                break
+            line[:0] = coastlines[j][:-1]
+        stitched.append(line)
+    return stitched
+
+
+def _local_xy(lat: np.ndarray, lng: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    k = EARTH_RADIUS_M * math.pi / 180
+    return lng * k * math.cos(math.radians(float(lat.mean()))), lat * k
+
+
+def douglas_peucker(x: np.ndarray, y: np.ndarray, tolerance_m: float, keep: np.ndarray | None = None) -> np.ndarray:
+    """
+    Douglas–Peucker で残す頂点の bool 配列を返す。
+    keep が True の頂点は必ず残し、その間の区間ごとに簡略化する。
+    """
+    n = len(x)
+    mask = np.zeros(n, dtype=bool)
+    if n <= 2:
+        mask[:] = True
+        return mask
+    anchors = np.flatnonzero(keep) if keep is not None else np.zeros(0, dtype=np.int64)
+    anchors = np.union1d(anchors, [0, n - 1])
+    mask[anchors] = True
+
+    stack = [(a, b) for a, b in zip(anchors[:-1], anchors[1:]) if b - a > 1]
+    while stack:
+        a, b = stack.pop()
+        px, py = x[a + 1:b], y[a + 1:b]
+        dx, dy = x[b] - x[a], y[b] - y[a]
+        len_sq = dx * dx + dy * dy
+        if len_sq > 0:
+            t = np.clip(((px - x[a]) * dx + (py - y[a]) * dy) / len_sq, 0.0, 1.0)
+            d = np.hypot(px - (x[a] + t * dx), py - (y[a] + t * dy))
+        else:
+            d = np.hypot(px - x[a], py - y[a])
+        i = int(np.argmax(d))
+        if d[i] > tolerance_m:
+            m = a + 1 + i
+            mask[m] = True
+            if m - a > 1:
+                stack.append((a, m))
+            if b - m > 1:
+                stack.append((m, b))
+    return mask
+
+
+def protected_vertices(coords, park_index: PolygonIndex | None = None) -> np.ndarray:
+    """
+    分類結果に効くので削除しない頂点（bool配列）。
+    セグメント単位の対象を判定窓の分だけ広げ、その両端の頂点を固定する。
+    """
+    segments = build_segments([coords])
+    n = len(segments)
+    if n == 0:
+        return np.ones(len(coords), dtype=bool)
+    if park_index is not None:
+        relevant = park_index.near_array(*midpoints(segments))
+    else:
+        relevant = (segments["dist"] < TETRAPOD_MAX_M) & (short_window_counts(segments) >= SHORT_MIN_COUNT)
+    # 窓の分だけ広げる（窓内の短いセグメントの本数を変えない）
+    if relevant.any():
+        csum = np.concatenate(([0], np.cumsum(relevant)))
+        idx = np.arange(n)
+        lo = np.maximum(idx - SHORT_WINDOW, 0)
+        hi = np.minimum(idx + SHORT_WINDOW + 1, n)
+        relevant = csum[hi] - csum[lo] > 0
+    keep = np.zeros(n + 1, dtype=bool)
+    keep[:-1] |= relevant
+    keep[1:] |= relevant
+    return keep
+
+
+def simplify_coastline(
+    coords, tolerance_m: float = DEFAULT_TOLERANCE_M, park_index: PolygonIndex | None = None
+) -> list[tuple[float, float]]:
+    """1本のポリラインを簡略化（分類に効く頂点は固定）"""
+    if len(coords) <= 2:
+        return list(coords)
+    lat, lng = split_latlng(coords)
+    x, y = _local_xy(lat, lng)
+    mask = douglas_peucker(x, y, tolerance_m, protected_vertices(coords, park_index))
+    return list(zip(lat[mask].tolist(), lng[mask].tolist()))
+
+
+def simplify_coastlines(
+    coastlines,
+    tolerance_m: float = DEFAULT_TOLERANCE_M,
+    park_polygon: list[tuple[float, float]] | PolygonIndex | None = None,
+) -> list[list[tuple[float, float]]]:
+    """連結 → 簡略化。park_polygon を渡すと公園まわりの頂点を固定して、それ以外を間引く"""
+    park_index = park_polygon
+    if park_polygon is not None and not isinstance(park_polygon, PolygonIndex):
+        park_index = PolygonIndex(park_polygon) if len(park_polygon) else None
+    return [simplify_coastline(c, tolerance_m, park_index) for c in stitch_coastlines(coastlines)]
+
+
+# ---------------------------------------------------------------------------
+# 検証
+# ---------------------------------------------------------------------------
+
+def check_geometry(seed: int = 0) -> bool:
+    """細切れの合成海岸線で、連結・頂点削減・公園内の分類結果の保持を確認"""
+    rng = np.random.default_rng(seed)
+    lat0, lng0 = 36.39, 140.62
+    # 緩やかにうねる海岸線（公園の西半分は密なテトラ帯、東半分は約60m間隔の護岸、
+    # 公園の外はやや密な OSM 風）
+    n = 6000
+    t = np.linspace(0, 1, n)
+    lng = lng0 - 0.05 + 0.1 * t
+    lat = lat0 + 0.002 * np.sin(t * 40) + rng.normal(0, 2e-6, n)
+    in_park = np.abs(lng - lng0) < 0.004
+    step = np.arange(n)
+    keep = np.where(in_park, (lng < lng0) | (step % 40 == 0), step % 3 == 0)
+    coords = list(zip(lat[keep].tolist(), lng[keep].tolist()))
+    # 60ノードごとのwayに切り、順番を混ぜる
+    pieces = [coords[i:i + 61] for i in range(0, len(coords) - 1, 60)]
+    rng.shuffle(pieces)
+    park = [(lat0 - 0.004, lng0 - 0.004), (lat0 + 0.004, lng0 - 0.004),
+            (lat0 + 0.004, lng0 + 0.004), (lat0 - 0.004, lng0 + 0.004)]
+    index = PolygonIndex(park)
+
+    print("=== 海岸線前処理チェック ===")
+    stitched = stitch_coastlines(pieces)
+    ok_stitch = len(stitched) == 1 and stitched[0] == coords
+    print(f"  連結: {len(pieces)} way → {len(stitched)} 本  {'OK' if ok_stitch else 'NG'}")
+
+    start = time.perf_counter()
+    simplified = simplify_coastlines(pieces, park_polygon=index)
+    elapsed = time.perf_counter() - start
+    before = type_lengths(classify_array(stitched, index))
+    after = type_lengths(classify_array(simplified, index))
+    ok_class = (
+        before["platform"] > 0 and before["tetrapod"] > 0
+        and all(abs(before[k] - after[k]) < 1e-3 for k in ("platform", "tetrapod"))
+    )
+    print(f"  簡略化: {len(coords)} → {sum(len(c) for c in simplified)} 頂点 ({elapsed * 1000:.0f}ms)")
+    print(f"  公園内の分類: platform {before['platform']:.1f}m → {after['platform']:.1f}m, "
+          f"tetrapod {before['tetrapod']:.1f}m → {after['tetrapod']:.1f}m  {'OK' if ok_class else 'NG'}")
+    return ok_stitch and ok_class
+
+
+def main():
+    args = sys.argv[1:]
+    if args == ["check"]:
+        ok = check_geometry()
+        print("=== OK ===" if ok else "=== NG ===")
+        sys.exit(0 if ok else 1)
+    print("使用方法:")
+    print("  python coastline_geometry.py check")
+
+
+if __name__ == "__main__":
+    main()
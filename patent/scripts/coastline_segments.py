@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+coastline_segments.py
+
+海岸線セグメント分類のベクトル化エンジン（NumPy）。
+
+analyze_coastline.classify_segments / generate_combined_map.classify_coastline は
+セグメントごとに dict を作り、haversine を1本ずつ呼び、テトラ帯判定で ±3 の窓を
+毎回数え直していた。ここでは複数wayの座標を1本の配列にまとめ、
+  - 距離: haversine_array で一括
+  - 公園判定: PolygonIndex.near_array で中点を一括
+  - テトラ帯（短いセグメントの密集）: 累積和で窓内の本数を一括（way境界は跨がない）
+として、構造化配列（SEGMENT_DTYPE）で返す。
+
+分類規則は従来と同じ:
+  - 'platform': 公園ポリゴン内または境界から30m以内（公園がなければ
+                structureEndpoints 両端からの距離で判定）
+  - 'tetrapod': platform のうち長さ30m未満で、前後3本の窓に50m未満が3本以上
+  - 'outside':  それ以外
+ただし従来の内部判定は座標の組を取り違えていて効いておらず、公園の内部で境界から
+30m を超えて離れたセグメントは従来 outside だった（ここでは platform / tetrapod）。
+
+使用方法:
+    python coastline_segments.py check [--nodes N]   # 従来ループとの比較・速度
+"""
+
+import sys
+import math
+import time
+
+import numpy as np
+
+from polygon_index import PolygonIndex
+from projection import split_latlng
+
+
+EARTH_RADIUS_M = 6371000
+PARK_BUFFER_M = 30
+
+# テトラ帯判定（短いセグメントの密集）
+TETRAPOD_MAX_M = 30
+SHORT_SEGMENT_M = 50
+SHORT_WINDOW = 3
+SHORT_MIN_COUNT = 3
+
+# type 列のコード → 名前
+SEGMENT_TYPES = ("outside", "platform", "tetrapod", "restricted", "port", "unknown")
+OUTSIDE, PLATFORM, TETRAPOD, RESTRICTED, PORT, UNKNOWN = range(len(SEGMENT_TYPES))
+
+SEGMENT_DTYPE = np.dtype([
+    ("way", np.int32),
+    ("start_lat", np.float64),
+    ("start_lng", np.float64),
+    ("end_lat", np.float64),
+    ("end_lng", np.float64),
+    ("dist", np.float32),
+    ("type", np.uint8),
+])
+
+
+def haversine_array(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """2点間の距離（m）の配列版"""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lng1, lat2, lng2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return EARTH_RADIUS_M * 2 * np.arcsin(np.sqrt(a))
+
+
+def build_segments(ways) -> np.ndarray:
+    """way（[(lat, lng), ...] のリスト）を隣接ノード間のセグメント配列にする（type は outside）"""
+    parts = []
+    for i, coords in enumerate(ways):
+        lat, lng = split_latlng(coords)
+        if len(lat) < 2:
+            continue
+        part = np.zeros(len(lat) - 1, dtype=SEGMENT_DTYPE)
+        part["way"] = i
+        part["start_lat"], part["start_lng"] = lat[:-1], lng[:-1]
+        part["end_lat"], part["end_lng"] = lat[1:], lng[1:]
+        parts.append(part)
+    if not parts:
+        return np.zeros(0, dtype=SEGMENT_DTYPE)
+    segments = np.concatenate(parts)
+    segments["dist"] = haversine_array(
+        segments["start_lat"], segments["start_lng"], segments["end_lat"], segments["end_lng"]
+    )
+    return segments
+
+
+def midpoints(segments: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    return (
+        (segments["start_lat"] + segments["end_lat"]) / 2,
+        (segments["start_lng"] + segments["end_lng"]) / 2,
+    )
+
+
+def short_window_counts(segments: np.ndarray, window: int = SHORT_WINDOW,
+                        short_m: float = SHORT_SEGMENT_M) -> np.ndarray:
+    """各セグメントの前後 window 本（同じway内）に含まれる短いセグメントの本数"""
+    n = len(segments)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    csum = np.concatenate(([0], np.cumsum(segments["dist"] < short_m)))
+    idx = np.arange(n)
+    way = segments["way"]
+    # way の先頭・末尾インデックス（way は連続して並んでいる前提）
+    starts = np.flatnonzero(np.concatenate(([True], way[1:] != way[:-1])))
+    ends = np.append(starts[1:], n)
+    group = np.cumsum(np.concatenate(([False], way[1:] != way[:-1])))
+    lo = np.maximum(idx - window, starts[group])
+    hi = np.minimum(idx + window + 1, ends[group])
+    return csum[hi] - csum[lo]
+
+
+def classify_array(
+    ways,
+    park_polygon: list[tuple[float, float]] | PolygonIndex | None = None,
+    fishing_west: tuple[float, float] | None = None,
+    fishing_east: tuple[float, float] | None = None,
+) -> np.ndarray:
+    """
+    海岸線（wayのリスト）を一括分類して SEGMENT_DTYPE の構造化配列を返す。
+    park_polygon は座標リストまたは作成済みの PolygonIndex。
+    """
+    segments = build_segments(ways)
+    if len(segments) == 0:
+        return segments
+    mid_lat, mid_lng = midpoints(segments)
+
+    if park_polygon is not None and (isinstance(park_polygon, PolygonIndex) or len(park_polygon)):
+        index = park_polygon if isinstance(park_polygon, PolygonIndex) else PolygonIndex(park_polygon, PARK_BUFFER_M)
+        in_park = index.near_array(mid_lat, mid_lng)
+    elif fishing_west and fishing_east:
+        # フォールバック: structureEndpointsからの距離判定
+        total_len = haversine_array(*fishing_west, *fishing_east)
+        dist_w = haversine_array(mid_lat, mid_lng, *fishing_west)
+        dist_e = haversine_array(mid_lat, mid_lng, *fishing_east)
+        in_park = (dist_w < total_len * 1.1) & (dist_e < total_len * 1.1)
+    else:
+        in_park = np.zeros(len(segments), dtype=bool)
+
+    types = np.where(in_park, PLATFORM, OUTSIDE).astype(np.uint8)
+    # 公園内セグメントのうち、テトラ帯を細分（短いセグメント密集）
+    tetrapod = (
+        in_park
+        & (segments["dist"] < TETRAPOD_MAX_M)
+        & (short_window_counts(segments) >= SHORT_MIN_COUNT)
+    )
+    types[tetrapod] = TETRAPOD
+    segments["type"] = types
+    return segments
+
+
+def type_lengths(segments: np.ndarray) -> dict[str, float]:
+    """種別ごとの合計長（m）"""
+    totals = np.bincount(segments["type"], weights=segments["dist"], minlength=len(SEGMENT_TYPES))
+    return {name: float(totals[i]) for i, name in enumerate(SEGMENT_TYPES)}
+
+
+def to_segment_dicts(segments: np.ndarray) -> list[dict]:
+    """従来形式（{"start", "end", "dist", "type"} のリスト）に変換"""
+    return [
+        {
+            "start": (float(s["start_lat"]), float(s["start_lng"])),
+            "end": (float(s["end_lat"]), float(s["end_lng"])),
+            "dist": float(s["dist"]),
+            "type": SEGMENT_TYPES[s["type"]],
+        }
+        for s in segments
+    ]
+
+
+# ---------------------------------------------------------------------------
+# 検証
+# ---------------------------------------------------------------------------
+
+def _baseline_point_in_polygon(lat, lon, polygon) -> bool:
+    """従来（analyze_coastline）の Ray casting をそのまま再現（比較用）"""
+    n = len(polygon)
+    inside = False
+    j = n - 1
+    for i in range(n):
+        yi, xi = polygon[i]
+        yj, xj = polygon[j]
+        if ((yi > lon) != (yj > lon)) and (lat < (xj - xi) * (lon - yi) / (yj - yi) + xi):
+            inside = not inside
+        j = i
+    return inside
+
+
+def _baseline_edge_distance(lat, lon, polygon) -> float:
+    """従来の辺までの最短距離（m、比較用）"""
+    from analyze_coastline import haversine
+
+    best = float("inf")
+    for (lat1, lon1), (lat2, lon2) in zip(polygon[:-1], polygon[1:]):
+        dx = (lon2 - lon1) * math.cos(math.radians(lat1))
+        dy = lat2 - lat1
+        line_len_sq = dx * dx + dy * dy
+        if line_len_sq < 1e-12:
+            best = min(best, haversine(lat, lon, lat1, lon1))
+            continue
+        px = (lon - lon1) * math.cos(math.radians(lat1))
+        py = lat - lat1
+        t = max(0, min(1, (px * dx + py * dy) / line_len_sq))
+        best = min(best, haversine(lat, lon, lat1 + t * (lat2 - lat1), lon1 + t * (lon2 - lon1)))
+    return best
+
+
+def _classify_loop(coords, polygon, threshold_m: float = PARK_BUFFER_M) -> list[tuple[str, float]]:
+    """従来のセグメントごとのループ実装（比較用）。(種別, 中点から辺までの距離) のリスト"""
+    from analyze_coastline import haversine
+
+    segments = []
+    for i in range(len(coords) - 1):
+        (lat1, lng1), (lat2, lng2) = coords[i], coords[i + 1]
+        dist = haversine(lat1, lng1, lat2, lng2)
+        mid_lat, mid_lng = (lat1 + lat2) / 2, (lng1 + lng2) / 2
+        edge = _baseline_edge_distance(mid_lat, mid_lng, polygon)
+        in_park = _baseline_point_in_polygon(mid_lat, mid_lng, polygon) or edge < threshold_m
+        segments.append({"dist": dist, "edge": edge, "type": "platform" if in_park else "outside"})
+    for i in range(len(segments)):
+        if segments[i]["type"] != "platform" or segments[i]["dist"] >= TETRAPOD_MAX_M:
+            continue
+        short_count = sum(1 for j in range(max(0, i - 3), min(len(segments), i + 4))
+                          if segments[j]["dist"] < SHORT_SEGMENT_M)
+        if short_count >= SHORT_MIN_COUNT:
+            segments[i]["type"] = "tetrapod"
+    return [(s["type"], s["edge"]) for s in segments]
+
+
+def check_classify(nodes: int = 1_000_000, seed: int = 0) -> bool:
+    """
+    ランダムウォークの海岸線で、従来ループとの比較と一括分類の速度を確認。
+
+    従来の point_in_polygon は (lat, lon) の組を取り違えていてポリゴン内部を判定できず、
+    「辺から30m以内」だけが効いていた（PolygonIndex は内部も含める）。そのため
+    公園の内部で辺から PARK_BUFFER_M を超えて離れたセグメントだけは、従来 outside・
+    新実装 platform / tetrapod と分かれる。それ以外は一致すること、分かれた所が
+    すべてこの場合であることを確認する。
+    """
+    rng = np.random.default_rng(seed)
+    lat0, lng0 = 36.39, 140.62
+    # OSM の閉じた way と同じく始点を末尾に繰り返す
+    park = [(lat0 - 0.01, lng0 - 0.02), (lat0 + 0.01, lng0 - 0.02),
+            (lat0 + 0.01, lng0 + 0.02), (lat0 - 0.01, lng0 + 0.02), (lat0 - 0.01, lng0 - 0.02)]
+    index = PolygonIndex(park, PARK_BUFFER_M)
+
+    def random_way(n):
+        # 短い区間（テトラ帯相当）と長い区間が混ざった歩み
+        step = np.where(rng.random(n) < 0.3, 1e-4, 5e-4) * rng.uniform(0.2, 1.5, n)
+        angle = np.cumsum(rng.normal(0, 0.3, n))
+        lat = lat0 + rng.uniform(-0.012, 0.012) + np.cumsum(step * np.sin(angle)) * 0.05
+        lng = lng0 - 0.04 + np.cumsum(step * np.abs(np.cos(angle)))
+        return list(zip(lat.tolist(), lng.tolist()))
+
+    print("=== 海岸線分類チェック ===")
+    sample = [random_way(400) for _ in range(5)]
+    vector = [SEGMENT_TYPES[t] for t in classify_array(sample, index)["type"]]
+    loop = [r for way in sample for r in _classify_loop(way, park)]
+    lat, lng = midpoints(build_segments(sample))
+    inside = [
+        lat0 - 0.01 < la < lat0 + 0.01 and lng0 - 0.02 < ln < lng0 + 0.02
+        for la, ln in zip(lat.tolist(), lng.tolist())
+    ]
+    differ = [i for i, (v, (t, _)) in enumerate(zip(vector, loop)) if v != t]
+    expected = [
+        i for i in differ
+        if inside[i] and loop[i][1] >= PARK_BUFFER_M and loop[i][0] == "outside" and vector[i] != "outside"
+    ]
+    ok = len(differ) == len(expected)
+    print(f"  従来ループと比較: 一致 {len(loop) - len(differ)}/{len(loop)}セグメント、"
+          f"相違 {len(differ)}（うち公園内部・辺から{PARK_BUFFER_M:.0f}m超 {len(expected)}）  "
+          f"{'OK' if ok else 'NG'}")
+
+    ways = [random_way(nodes // 100) for _ in range(100)]
+    start = time.perf_counter()
+    result = classify_array(ways, index)
+    elapsed = time.perf_counter() - start
+    lengths = type_lengths(result)
+    print(f"  {len(result)}セグメント: {elapsed:.2f}s "
+          f"(platform {lengths['platform'] / 1000:.1f}km, tetrapod {lengths['tetrapod'] / 1000:.1f}km)")
+    print(f"  配列サイズ: {result.nbytes / 1024 ** 2:.1f}MB")
+    return ok
+
+
+def main():
+    args = sys.argv[1:]
+    nodes = 1_000_000
+    if "--nodes" in args:
+        i = args.index("--nodes")
+        nodes = int(args[i + 1])
+        del args[i:i + 2]
+    if args == ["check"]:
+        ok = check_classify(nodes)
+        print("=== OK ===" if ok else "=== NG ===")
+        sys.exit(0 if ok else 1)
+    print("使用方法:")
+    print("  python coastline_segments.py check [--nodes N]")
+
+
+if __name__ == "__main__":
+    main()
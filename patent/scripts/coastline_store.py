@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+coastline_store.py
+
+分類済み海岸線セグメントの永続ストア（SQLite + R-tree）。
+
+analyze_coastline / generate_combined_map はスポットを開くたびに生のOSMから分類し直していた
+（generate_combined_map は1枚の地図で2回）。ここでは osm_cache の海岸線 way ごと・公園ポリゴン
+（park レイヤーの way）ごとに分類結果（SEGMENT_DTYPE）を1回だけ計算して保存し、
+スポットからは「bbox + スポットが選んだ公園の way ID」の引き当てだけで返す。
+
+  - 分類: スポットが選んだ公園1つに対する classify_array（従来の classify_segments と同じ）。
+          同じ海岸線でも公園が違えば別の行になる
+  - 形状: way ごとに公園まわりの頂点を固定して簡略化（coastline_geometry.simplify_coastline）
+          してから分類するので、公園まわりの分類は簡略化前と同じ
+  - キー: (way ID, 公園 way ID)。値の有効性は way の形状ハッシュ（ノードID + 座標）と
+          公園の形状ハッシュ + 分類ルール（OSMの out body は version を返さないので形状で代用）
+  - 無効化: refresh は範囲内の way のハッシュを比べ、変わった way（OSMで形状が変わった・
+          公園の形が変わった・ルールを変えた）だけを分類し直す。OSMから消えた way は削除
+  - 照会: query(park_id, bbox) は範囲を refresh（ハッシュ比較のみ）してから引く
+
+analyze_coastline の公園なしの経路（structureEndpoints からの距離）との違い:
+  - structureEndpoints はスポットごとに変わるので保存しない。公園がある場合は従来から
+    classify_array が structureEndpoints を使わないので、渡さなくても結果は同じ
+  - way の連結（stitch_coastlines）はしない。行が OSM way 単位なので、テトラ帯の窓は
+    way の境界を跨がない（従来の classify_segments を way ごとに呼ぶのと同じ）
+
+使用方法:
+    python coastline_store.py refresh <park_way_id> [--bbox S,W,N,E]
+    python coastline_store.py query <park_way_id> <s> <w> <n> <e>   # 範囲の種別ごとの長さ
+    python coastline_store.py stats
+"""
+
+import sys
+import time
+import hashlib
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+
+from coastline_segments import (
+    PARK_BUFFER_M,
+    SEGMENT_DTYPE,
+    SHORT_MIN_COUNT,
+    SHORT_SEGMENT_M,
+    SHORT_WINDOW,
+    TETRAPOD_MAX_M,
+    classify_array,
+    type_lengths,
+)
+from coastline_geometry import DEFAULT_TOLERANCE_M, simplify_coastline
+from osm_cache import OverpassCache
+from polygon_index import PolygonIndex
+
+
+DEFAULT_STORE_PATH = Path(__file__).parent / "satellite" / "cache" / "coastline_classified.sqlite"
+
+# 分類ルール（変えると全 way が再分類される）
+RULES_KEY = (f"{PARK_BUFFER_M}/{TETRAPOD_MAX_M}/{SHORT_SEGMENT_M}/{SHORT_WINDOW}/{SHORT_MIN_COUNT}"
+             f"/{DEFAULT_TOLERANCE_M}")
+# 公園を探す範囲の余白（bbox の外の公園でも判定範囲 PARK_BUFFER_M が掛かる分）
+PARK_MARGIN_DEG = 0.002
+WORLD_BBOX = (-90.0, -180.0, 90.0, 180.0)
+
+
+def _geometry_hash(refs: np.ndarray, lat: np.ndarray, lon: np.ndarray) -> str:
+    h = hashlib.sha1(np.ascontiguousarray(refs, dtype=np.int64).tobytes())
+    h.update(np.ascontiguousarray(lat, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(lon, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+class ClassifiedCoastline:
+    """(海岸線 way, 公園 way) ごとの分類結果のストア。osm_cache の手元のジオメトリだけから計算する（ネットワークなし）"""
+
+    def __init__(self, path: str | Path = DEFAULT_STORE_PATH, osm: OverpassCache | None = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._own_osm = osm is None
+        self.osm = osm or OverpassCache(offline=True)
+        self._db = sqlite3.connect(str(self.path), timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS park_segments (
+                rid INTEGER PRIMARY KEY,
+                way_id INTEGER NOT NULL,
+                park_id INTEGER NOT NULL,
+                way_hash TEXT NOT NULL,
+                context_hash TEXT NOT NULL,
+                data BLOB NOT NULL,
+                classified_at REAL NOT NULL,
+                UNIQUE (way_id, park_id)
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS park_segment_bounds USING rtree(
+                rid, min_lat, max_lat, min_lon, max_lon
+            );
+            """
+        )
+
+    # ------------------------------------------------------------------
+    # 計算・無効化
+    # ------------------------------------------------------------------
+
+    def park_polygon(self, park_id: int, bbox: tuple[float, float, float, float]) -> tuple[str, list] | None:
+        """osm_cache の park レイヤーから公園 way の (形状ハッシュ, 座標列)。bbox 付近になければ None"""
+        south, west, north, east = bbox
+        m = PARK_MARGIN_DEG
+        parks = self.osm.lookup("park", (south - m, west - m, north + m, east + m))
+        found = np.flatnonzero(parks.way_ids == park_id)
+        if not len(found):
+            return None
+        refs, lat, lon = parks.way_coords(int(found[0]))
+        if len(lat) < 3:
+            return None
+        return _geometry_hash(refs, lat, lon), list(zip(lat.tolist(), lon.tolist()))
+
+    def refresh(self, park_id: int, bbox: tuple[float, float, float, float] = WORLD_BBOX) -> dict:
+        """
+        bbox に掛かる海岸線 way の、公園 park_id に対する分類を最新にする。
+        返り値は {"checked", "updated", "removed"}（way 数）。公園が osm_cache になければ KeyError。
+        """
+        park = self.park_polygon(park_id, bbox)
+        if park is None:
+            raise KeyError(f"公園 way/{park_id} が osm_cache にありません")
+        park_hash, polygon = park
+        context_hash = hashlib.sha1(f"{RULES_KEY}|{park_hash}".encode()).hexdigest()
+        index = PolygonIndex(polygon, PARK_BUFFER_M)
+
+        coast = self.osm.lookup("coastline", bbox)
+        bounds = coast.way_bounds()
+        stored = {
+            way_id: (rid, f"{way_hash}:{ctx}")
+            for rid, way_id, way_hash, ctx in self._db.execute(
+                "SELECT s.rid, s.way_id, s.way_hash, s.context_hash FROM park_segments s"
+                " JOIN park_segment_bounds b ON b.rid = s.rid"
+                " WHERE s.park_id = ? AND b.min_lat <= ? AND b.max_lat >= ? AND b.min_lon <= ? AND b.max_lon >= ?",
+                (park_id, bbox[2], bbox[0], bbox[3], bbox[1]),
+            )
+        }
+
+        now = time.time()
+        updated = 0
+        present = set()
+        for i in np.flatnonzero(~np.isnan(bounds[:, 0])).tolist():
+            way_id = int(coast.way_ids[i])
+            present.add(way_id)
+            refs, lat, lon = coast.way_coords(i)
+            way_hash = _geometry_hash(refs, lat, lon)
+            if way_id in stored and stored[way_id][1] == f"{way_hash}:{context_hash}":
+                continue
+
+            # 公園まわりの頂点を固定して簡略化してから分類（analyze_coastline の公園なしの経路と同じ前処理）
+            coords = simplify_coastline(list(zip(lat.tolist(), lon.tolist())), park_index=index)
+            segments = classify_array([coords], index)
+            rid = self._db.execute(
+                "INSERT INTO park_segments (way_id, park_id, way_hash, context_hash, data, classified_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (way_id, park_id) DO UPDATE SET way_hash = excluded.way_hash,"
+                " context_hash = excluded.context_hash, data = excluded.data, classified_at = excluded.classified_at"
+                " RETURNING rid",
+                (way_id, park_id, way_hash, context_hash, sqlite3.Binary(segments.tobytes()), now),
+            ).fetchone()[0]
+            self._db.execute("DELETE FROM park_segment_bounds WHERE rid = ?", (rid,))
+            self._db.execute(
+                "INSERT INTO park_segment_bounds (rid, min_lat, max_lat, min_lon, max_lon) VALUES (?, ?, ?, ?, ?)",
+                (rid,) + tuple(bounds[i].tolist()),
+            )
+            updated += 1
+
+        # osm_cache から消えた way（範囲内に収まっていたもの）
+        gone = [
+            rid for rid, way_id in self._db.execute(
+                "SELECT s.rid, s.way_id FROM park_segments s JOIN park_segment_bounds b ON b.rid = s.rid"
+                " WHERE s.park_id = ? AND b.min_lat >= ? AND b.max_lat <= ? AND b.min_lon >= ? AND b.max_lon <= ?",
+                (park_id, bbox[0], bbox[2], bbox[1], bbox[3]),
+            ).fetchall()
+            if way_id not in present
+        ]
+        for rid in gone:
+            self._db.execute("DELETE FROM park_segments WHERE rid = ?", (rid,))
+            self._db.execute("DELETE FROM park_segment_bounds WHERE rid = ?", (rid,))
+        self._db.commit()
+        return {"checked": len(present), "updated": updated, "removed": len(gone)}
+
+    # ------------------------------------------------------------------
+    # 照会
+    # ------------------------------------------------------------------
+
+    def lookup(self, park_id: int, bbox: tuple[float, float, float, float]) -> np.ndarray:
+        """保存済みの分類結果だけで、公園 park_id に対する bbox 内のセグメントを返す（way 列は way の通し番号）"""
+        south, west, north, east = bbox
+        rows = self._db.execute(
+            "SELECT s.data FROM park_segment_bounds b JOIN park_segments s ON s.rid = b.rid"
+            " WHERE s.park_id = ? AND b.min_lat <= ? AND b.max_lat >= ? AND b.min_lon <= ? AND b.max_lon >= ?"
+            " ORDER BY s.way_id",
+            (park_id, north, south, east, west),
+        ).fetchall()
+        if not rows:
+            return np.zeros(0, dtype=SEGMENT_DTYPE)
+        parts = [np.frombuffer(data, dtype=SEGMENT_DTYPE) for (data,) in rows]
+        segments = np.concatenate(parts)
+        segments["way"] = np.repeat(np.arange(len(parts), dtype=np.int32), [len(p) for p in parts])
+        return segments
+
+    def query(self, park_id: int, bbox: tuple[float, float, float, float]) -> np.ndarray:
+        """bbox を refresh（変化した way だけ再分類）してから引く"""
+        self.refresh(park_id, bbox)
+        return self.lookup(park_id, bbox)
+
+    def stats(self) -> dict:
+        rows, parks, size = self._db.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT park_id), COALESCE(SUM(LENGTH(data)), 0) FROM park_segments"
+        ).fetchone()
+        return {"rows": rows, "parks": parks, "segment_bytes": size}
+
+    def close(self):
+        self._db.close()
+        if self._own_osm:
+            self.osm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    args = sys.argv[1:]
+    bbox = WORLD_BBOX
+    if "--bbox" in args:
+        i = args.index("--bbox")
+        bbox = tuple(float(v) for v in args[i + 1].split(","))
+        del args[i:i + 2]
+
+    if len(args) == 2 and args[0] == "refresh":
+        start = time.perf_counter()
+        with ClassifiedCoastline() as store:
+            result = store.refresh(int(args[1]), bbox)
+        print(f"海岸線 {result['checked']} way: 再分類 {result['updated']}, 削除 {result['removed']} "
+              f"({time.perf_counter() - start:.1f}s)")
+    elif len(args) == 6 and args[0] == "query":
+        bbox = tuple(float(v) for v in args[2:])
+        start = time.perf_counter()
+        with ClassifiedCoastline() as store:
+            segments = store.query(int(args[1]), bbox)
+        lengths = type_lengths(segments)
+        print(f"{len(segments)} セグメント ({(time.perf_counter() - start) * 1000:.0f}ms)")
+        for name in ("platform", "tetrapod", "outside"):
+            print(f"  {name:<9} {lengths[name]:.0f}m")
+    elif args == ["stats"]:
+        with ClassifiedCoastline() as store:
+            s = store.stats()
+        print(f"分類済み: {s['rows']} 行（公園 {s['parks']}）  セグメント {s['segment_bytes'] / 1024 ** 2:.1f}MB")
+    else:
+        print("使用方法:")
+        print("  python coastline_store.py refresh <park_way_id> [--bbox S,W,N,E]")
+        print("  python coastline_store.py query <park_way_id> <south> <west> <north> <east>")
+        print("  python coastline_store.py stats")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+"""
+coastline_tiles.py
+
+分類済み海岸線（釣り座 / テトラ帯 / 範囲外）を Mapbox Vector Tile（z12〜z18）に書き出す。
+
+analyze_coastline の出力はフルサイズの {slug}_analyzed.jpg だけで、配信には重く、
+サイト側で色や太さを変えられなかった。ここではスポットごとの分類結果（SEGMENT_DTYPE）を
+MBTiles（format=pbf, 1ファイル）に保存し、そこからタイルを事前生成する。
+
+  - タイル: レイヤー "coastline"、同じ種別が続く区間を1本の LineString にまとめ、
+            属性は type（platform / tetrapod / outside）と length_m（区間の長さ）
+  - スポット間の重複: 隣のスポットと範囲が重なると同じOSMセグメントが両方に入るので、
+            端点が一致するセグメントは1本にまとめる（種別は platform / tetrapod を優先）
+  - 更新: スポットの分類結果を入れ替えると、そのスポットの新旧セグメントが掛かるタイルだけを
+            周辺スポットの結果と合わせて作り直す
+  - 形式: MBTiles の慣例どおりタイルは gzip 圧縮。tile_row は TMS（y反転）
+
+protobuf のエンコードは仕様（vector-tile-spec 2.1）の必要な部分だけを標準ライブラリで実装している。
+
+使用方法:
+    python coastline_tiles.py info [--mbtiles PATH]
+    python coastline_tiles.py export-dir <DIR> [--mbtiles PATH]   # {z}/{x}/{y}.pbf（非圧縮）に展開
+    python coastline_tiles.py check                               # エンコード・デコードの往復確認
+"""
+
+import sys
+import gzip
+import time
+import struct
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+
+from coastline_segments import OUTSIDE, PLATFORM, SEGMENT_DTYPE, SEGMENT_TYPES, TETRAPOD, classify_array
+from projection import latlng_to_tile_array, tile_to_latlng
+
+
+SATELLITE_DIR = Path(__file__).parent / "satellite"
+DEFAULT_TILES_PATH = SATELLITE_DIR / "coastline.mbtiles"
+
+MIN_ZOOM = 12
+MAX_ZOOM = 18
+LAYER_NAME = "coastline"
+EXTENT = 4096
+# タイルに書き出す種別（restricted / port は現在の分類では出ない）
+TILE_TYPES = (OUTSIDE, PLATFORM, TETRAPOD)
+# 重複判定の座標の丸め（度）。約1cm
+DEDUP_PRECISION = 1e-7
+
+
+# ---------------------------------------------------------------------------
+# MVT エンコード / デコード
+# ---------------------------------------------------------------------------
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 31)
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    """length-delimited（wire type 2）のフィールド"""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _packed(number: int, values: list[int]) -> bytes:
+    return _field(number, b"".join(_varint(v) for v in values))
+
+
+def _value(value) -> bytes:
+    if isinstance(value, str):
+        return _field(1, value.encode("utf-8"))
+    return _varint(3 << 3 | 1) + struct.pack("<d", float(value))  # double_value
+
+
+def line_geometry(points: list[tuple[int, int]]) -> list[int]:
+    """LineString のジオメトリコマンド列（MoveTo 1点 + LineTo 残り、座標は差分の zigzag）"""
+    commands = [(1 & 0x7) | (1 << 3)]
+    x0, y0 = points[0]
+    commands += [_zigzag(x0), _zigzag(y0)]
+    commands.append((2 & 0x7) | ((len(points) - 1) << 3))
+    for x, y in points[1:]:
+        commands += [_zigzag(x - x0), _zigzag(y - y0)]
+        x0, y0 = x, y
+    return commands
+
+
+def encode_layer(name: str, features: list[tuple[list[tuple[int, int]], dict]], extent: int = EXTENT) -> bytes:
+    """(タイル内座標の点列, 属性) のリストを LineString レイヤーにエンコード"""
+    keys: dict[str, int] = {}
+    values: dict = {}
+    body = bytearray()
+    for points, props in features:
+        tags = []
+        for k, v in props.items():
+            tags.append(keys.setdefault(k, len(keys)))
+            tags.append(values.setdefault((type(v), v), len(values)))
+        feature = _packed(2, tags) + _varint(3 << 3) + _varint(2) + _packed(4, line_geometry(points))
+        body += _field(2, feature)
+    layer = _varint(15 << 3) + _varint(2) + _field(1, name.encode("utf-8")) + bytes(body)
+    layer += b"".join(_field(3, k.encode("utf-8")) for k in keys)
+    layer += b"".join(_field(4, _value(v)) for (_, v) in values)
+    layer += _varint(5 << 3) + _varint(extent)
+    return _field(3, layer)
+
+
+def _read_varint(buf: bytes, pos: int) -> tuple[int, int]:
+    result = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _iter_fields(buf: bytes):
+    pos = 0
+    while pos < len(buf):
+        key, pos = _read_varint(buf, pos)
+        number, wire = key >> 3, key & 7
+        if wire == 0:
+            value, pos = _read_varint(buf, pos)
+        elif wire == 1:
+            value, pos = buf[pos:pos + 8], pos + 8
+        elif wire == 2:
+            length, pos = _read_varint(buf, pos)
+            value, pos = buf[pos:pos + length], pos + length
+        elif wire == 5:
+            value, pos = buf[pos:pos + 4], pos + 4
+        else:
+            raise ValueError(f"未対応の wire type: {wire}")
+        yield number, wire, value
+
+
+def _unpack(buf: bytes) -> list[int]:
+    out, pos = [], 0
+    while pos < len(buf):
+        v, pos = _read_varint(buf, pos)
+        out.append(v)
+    return out
+
+
+def decode_tile(data: bytes) -> dict[str, list[tuple[list[tuple[int, int]], dict]]]:
+    """エンコードしたタイル（gzip可）を {レイヤー名: [(点列, 属性)]} に戻す（確認・info 用）"""
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+    layers = {}
+    for number, _, layer_buf in _iter_fields(data):
+        if number != 3:
+            continue
+        name, raw_features, keys, values = "", [], [], []
+        for n, wire, v in _iter_fields(layer_buf):
+            if n == 1:
+                name = v.decode("utf-8")
+            elif n == 2:
+                raw_features.append(v)
+            elif n == 3:
+                keys.append(v.decode("utf-8"))
+            elif n == 4:
+                for vn, vw, vv in _iter_fields(v):
+                    values.append(vv.decode("utf-8") if vn == 1 else struct.unpack("<d", vv)[0])
+        features = []
+        for raw in raw_features:
+            tags, geometry = [], []
+            for n, _, v in _iter_fields(raw):
+                if n == 2:
+                    tags = _unpack(v)
+                elif n == 4:
+                    geometry = _unpack(v)
+            points, x, y, i = [], 0, 0, 0
+            while i < len(geometry):
+                count = geometry[i] >> 3
+                i += 1
+                for _ in range(count):
+                    dx, dy = geometry[i], geometry[i + 1]
+                    x += (dx >> 1) ^ -(dx & 1)
+                    y += (dy >> 1) ^ -(dy & 1)
+                    points.append((x, y))
+                    i += 2
+            props = {keys[tags[j]]: values[tags[j + 1]] for j in range(0, len(tags), 2)}
+            features.append((points, props))
+        layers[name] = features
+    return layers
+
+
+# ---------------------------------------------------------------------------
+# セグメント → タイル
+# ---------------------------------------------------------------------------
+
+def dedupe_segments(segments: np.ndarray) -> np.ndarray:
+    """
+    端点が一致するセグメントを1本にまとめる（種別コードの大きいもの = テトラ帯 > 釣り座 > 範囲外を残す）。
+    並び順（way 内の連続）は保つ。
+    """
+    if len(segments) == 0:
+        return segments
+    q = np.stack([
+        np.round(segments[name] / DEDUP_PRECISION).astype(np.int64)
+        for name in ("start_lat", "start_lng", "end_lat", "end_lng")
+    ], axis=1)
+    # 優先度の高いものが先頭に来る順で unique を取り、元の順に戻す
+    order = np.argsort(-segments["type"].astype(np.int64), kind="stable")
+    _, first = np.unique(q[order], axis=0, return_index=True)
+    return segments[np.sort(order[first])]
+
+
+def assign_tiles(segments: np.ndarray, zoom: int) -> dict[tuple[int, int], np.ndarray]:
+    """各セグメントが掛かるタイル（外接矩形で判定）→ セグメント番号（昇順）"""
+    if len(segments) == 0:
+        return {}
+    x1, y1 = latlng_to_tile_array(segments["start_lat"], segments["start_lng"], zoom)
+    x2, y2 = latlng_to_tile_array(segments["end_lat"], segments["end_lng"], zoom)
+    x_lo, x_hi = np.floor(np.minimum(x1, x2)).astype(np.int64), np.floor(np.maximum(x1, x2)).astype(np.int64)
+    y_lo, y_hi = np.floor(np.minimum(y1, y2)).astype(np.int64), np.floor(np.maximum(y1, y2)).astype(np.int64)
+
+    # ほとんどのセグメントは1タイルに収まる。跨ぐものだけ展開
+    single = (x_lo == x_hi) & (y_lo == y_hi)
+    idx = [np.flatnonzero(single)]
+    tx, ty = [x_lo[single]], [y_lo[single]]
+    for i in np.flatnonzero(~single):
+        for x in range(x_lo[i], x_hi[i] + 1):
+            for y in range(y_lo[i], y_hi[i] + 1):
+                idx.append(np.array([i]))
+                tx.append(np.array([x]))
+                ty.append(np.array([y]))
+    idx, tx, ty = np.concatenate(idx), np.concatenate(tx), np.concatenate(ty)
+
+    key = tx * (1 << zoom) + ty
+    order = np.lexsort((idx, key))
+    key, idx = key[order], idx[order]
+    bounds = np.flatnonzero(np.concatenate(([True], key[1:] != key[:-1], [True])))
+    return {
+        (int(key[a]) >> zoom, int(key[a]) & ((1 << zoom) - 1)): idx[a:b]
+        for a, b in zip(bounds[:-1], bounds[1:])
+    }
+
+
+def tile_features(segments: np.ndarray, zoom: int, x: int, y: int, extent: int = EXTENT) -> list:
+    """タイル内のセグメント（並び順どおり）を、同じ種別が連続する区間ごとの LineString にする"""
+    if len(segments) == 0:
+        return []
+    sx, sy = latlng_to_tile_array(segments["start_lat"], segments["start_lng"], zoom)
+    ex, ey = latlng_to_tile_array(segments["end_lat"], segments["end_lng"], zoom)
+    sx, sy = np.round((sx - x) * extent).astype(np.int64), np.round((sy - y) * extent).astype(np.int64)
+    ex, ey = np.round((ex - x) * extent).astype(np.int64), np.round((ey - y) * extent).astype(np.int64)
+
+    # 種別が変わる所・前のセグメントの終点から続いていない所で区切る
+    n = len(segments)
+    breaks = np.ones(n, dtype=bool)
+    breaks[1:] = (
+        (segments["type"][1:] != segments["type"][:-1])
+        | (segments["start_lat"][1:] != segments["end_lat"][:-1])
+        | (segments["start_lng"][1:] != segments["end_lng"][:-1])
+    )
+    starts = np.flatnonzero(breaks)
+    ends = np.append(starts[1:], n)
+
+    features = []
+    for a, b in zip(starts.tolist(), ends.tolist()):
+        xs = np.append(sx[a:b], ex[b - 1])
+        ys = np.append(sy[a:b], ey[b - 1])
+        # 量子化で重なった点を落とす（低ズームでの間引きを兼ねる）
+        keep = np.ones(len(xs), dtype=bool)
+        keep[1:] = (xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1])
+        if keep.sum() < 2:
+            continue
+        points = list(zip(xs[keep].tolist(), ys[keep].tolist()))
+        props = {
+            "type": SEGMENT_TYPES[segments["type"][a]],
+            "length_m": round(float(segments["dist"][a:b].sum()), 1),
+        }
+        features.append((points, props))
+    return features
+
+
+def encode_tile(segments: np.ndarray, zoom: int, x: int, y: int) -> bytes | None:
+    """タイル1枚分（gzip済み）。描くものがなければ None"""
+    features = tile_features(segments, zoom, x, y)
+    if not features:
+        return None
+    return gzip.compress(encode_layer(LAYER_NAME, features), mtime=0)
+
+
+def _segments_bbox(segments: np.ndarray) -> tuple[float, float, float, float]:
+    lat = np.concatenate((segments["start_lat"], segments["end_lat"]))
+    lng = np.concatenate((segments["start_lng"], segments["end_lng"]))
+    return float(lat.min()), float(lng.min()), float(lat.max()), float(lng.max())
+
+
+# ---------------------------------------------------------------------------
+# MBTiles ストア
+# ---------------------------------------------------------------------------
+
+class CoastlineTiles:
+    """
+    分類済み海岸線のベクタータイル（MBTiles）。
+    スポットごとのセグメント配列も同じファイルに持ち、更新時の作り直しに使う。
+    """
+
+    def __init__(self, path: str | Path = DEFAULT_TILES_PATH, min_zoom: int = MIN_ZOOM, max_zoom: int = MAX_ZOOM):
+        self.path = Path(path)
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), timeout=30)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS tiles (
+                zoom_level INTEGER NOT NULL,
+                tile_column INTEGER NOT NULL,
+                tile_row INTEGER NOT NULL,
+                tile_data BLOB NOT NULL
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS tile_index
+                ON tiles (zoom_level, tile_column, tile_row);
+            CREATE TABLE IF NOT EXISTS spot_segments (
+                slug TEXT PRIMARY KEY,
+                south REAL NOT NULL, west REAL NOT NULL, north REAL NOT NULL, east REAL NOT NULL,
+                data BLOB NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            """
+        )
+        metadata = {
+            "name": self.path.stem,
+            "format": "pbf",
+            "type": "overlay",
+            "minzoom": str(min_zoom),
+            "maxzoom": str(max_zoom),
+            "json": (
+                '{"vector_layers": [{"id": "%s", "minzoom": %d, "maxzoom": %d,'
+                ' "fields": {"type": "String", "length_m": "Number"}}]}' % (LAYER_NAME, min_zoom, max_zoom)
+            ),
+        }
+        self._db.executemany("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)", metadata.items())
+        self._db.commit()
+
+    def spot_segments(self, slug: str) -> np.ndarray | None:
+        row = self._db.execute("SELECT data FROM spot_segments WHERE slug=?", (slug,)).fetchone()
+        return np.frombuffer(row[0], dtype=SEGMENT_DTYPE).copy() if row else None
+
+    def _segments_in(self, bbox: tuple[float, float, float, float]) -> np.ndarray:
+        """bbox に掛かる全スポットのセグメント（重複除去済み）"""
+        s, w, n, e = bbox
+        rows = self._db.execute(
+            "SELECT data FROM spot_segments WHERE north >= ? AND south <= ? AND east >= ? AND west <= ?"
+            " ORDER BY slug",
+            (s, n, w, e),
+        ).fetchall()
+        if not rows:
+            return np.zeros(0, dtype=SEGMENT_DTYPE)
+        segments = np.concatenate([np.frombuffer(r[0], dtype=SEGMENT_DTYPE) for r in rows])
+        return dedupe_segments(segments[np.isin(segments["type"], TILE_TYPES)])
+
+    def affected_tiles(self, segments: np.ndarray) -> set[tuple[int, int, int]]:
+        return {
+            (z, x, y)
+            for z in range(self.min_zoom, self.max_zoom + 1)
+            for x, y in assign_tiles(segments, z)
+        }
+
+    def update(self, spots: dict[str, np.ndarray]) -> dict:
+        """
+        スポットの分類結果（SEGMENT_DTYPE）を入れ替え、新旧のセグメントが掛かるタイルを作り直す。
+        返り値は {"written", "deleted", "tiles"}。
+        """
+        affected = set()
+        now = time.time()
+        for slug, segments in spots.items():
+            old = self.spot_segments(slug)
+            if old is not None:
+                affected |= self.affected_tiles(old)
+            segments = np.ascontiguousarray(segments, dtype=SEGMENT_DTYPE)
+            if len(segments) == 0:
+                self._db.execute("DELETE FROM spot_segments WHERE slug=?", (slug,))
+                continue
+            affected |= self.affected_tiles(segments)
+            self._db.execute(
+                "INSERT OR REPLACE INTO spot_segments (slug, south, west, north, east, data, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (slug, *_segments_bbox(segments), sqlite3.Binary(segments.tobytes()), now),
+            )
+        written = deleted = 0
+        if affected:
+            written, deleted = self._rebuild(affected)
+        self._db.commit()
+        return {"written": written, "deleted": deleted, "tiles": len(affected)}
+
+    def _rebuild(self, affected: set[tuple[int, int, int]]) -> tuple[int, int]:
+        """
+        affected のタイルを、掛かる全スポットのセグメントから作り直す。
+        離れたスポットをまとめて更新しても間の範囲を読まないよう、min_zoom の親タイルごとに
+        そのタイル範囲のセグメントだけを引いて作る。
+        """
+        clusters: dict[tuple[int, int], set[tuple[int, int, int]]] = {}
+        for z, x, y in affected:
+            shift = z - self.min_zoom
+            clusters.setdefault((x >> shift, y >> shift), set()).add((z, x, y))
+
+        written = deleted = 0
+        for (px, py), tiles in sorted(clusters.items()):
+            north, west = tile_to_latlng(px, py, self.min_zoom)
+            south, east = tile_to_latlng(px + 1, py + 1, self.min_zoom)
+            segments = self._segments_in((south, west, north, east))
+
+            for z in range(self.min_zoom, self.max_zoom + 1):
+                for (x, y), idx in assign_tiles(segments, z).items():
+                    if (z, x, y) not in tiles:
+                        continue
+                    tiles.discard((z, x, y))
+                    data = encode_tile(segments[idx], z, x, y)
+                    if data is None:
+                        continue
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data)"
+                        " VALUES (?, ?, ?, ?)",
+                        (z, x, (1 << z) - 1 - y, sqlite3.Binary(data)),
+                    )
+                    written += 1
+            # 描くものがなくなったタイル
+            for z, x, y in tiles:
+                deleted += self._db.execute(
+                    "DELETE FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                    (z, x, (1 << z) - 1 - y),
+                ).rowcount
+        return written, deleted
+
+    def read(self, z: int, x: int, y: int) -> bytes | None:
+        row = self._db.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+            (z, x, (1 << z) - 1 - y),
+        ).fetchone()
+        return bytes(row[0]) if row else None
+
+    def iter_tiles(self):
+        """全タイルを (z, x, y, data) で返す（z, x, y 順）"""
+        cursor = self._db.execute(
+            "SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles"
+            " ORDER BY zoom_level, tile_column, tile_row"
+        )
+        for z, x, row, data in cursor:
+            yield z, x, (1 << z) - 1 - row, bytes(data)
+
+    def stats(self) -> dict:
+        spots = self._db.execute("SELECT COUNT(*) FROM spot_segments").fetchone()[0]
+        levels = self._db.execute(
+            "SELECT zoom_level, COUNT(*), SUM(LENGTH(tile_data)), MAX(LENGTH(tile_data))"
+            " FROM tiles GROUP BY zoom_level ORDER BY zoom_level"
+        ).fetchall()
+        return {"spots": spots, "levels": levels}
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---------------------------------------------------------------------------
+# 検証
+# ---------------------------------------------------------------------------
+
+def check_tiles(seed: int = 0) -> bool:
+    """合成海岸線で、エンコード→デコードの往復と、重なったスポットの重複除去を確認"""
+    import tempfile
+
+    rng = np.random.default_rng(seed)
+    lat0, lng0 = 36.39, 140.62
+    n = 3000
+    lng = lng0 - 0.02 + 0.04 * np.linspace(0, 1, n)
+    lat = lat0 + 0.001 * np.sin(np.linspace(0, 30, n)) + rng.normal(0, 1e-6, n)
+    coords = list(zip(lat.tolist(), lng.tolist()))
+    park = [(lat0 - 0.004, lng0 - 0.004), (lat0 + 0.004, lng0 - 0.004),
+            (lat0 + 0.004, lng0 + 0.004), (lat0 - 0.004, lng0 + 0.004)]
+    # 2スポットが海岸線の中央部分を共有する
+    spot_a = classify_array([coords[:2000]], park)
+    spot_b = classify_array([coords[1000:]])
+
+    print("=== ベクタータイルチェック ===")
+    # 往復: z18 の1タイル分
+    segments = dedupe_segments(np.concatenate([spot_a, spot_b]))
+    ok_dedup = len(segments) == n - 1 and (segments["type"] != OUTSIDE).sum() == (spot_a["type"] != OUTSIDE).sum()
+    print(f"  重複除去: {len(spot_a) + len(spot_b)} → {len(segments)} セグメント  {'OK' if ok_dedup else 'NG'}")
+
+    (x, y), idx = max(assign_tiles(segments, 18).items(), key=lambda kv: len(kv[1]))
+    features = tile_features(segments[idx], 18, x, y)
+    decoded = decode_tile(gzip.compress(encode_layer(LAYER_NAME, features)))[LAYER_NAME]
+    ok_round = decoded == [(p, {"type": t["type"], "length_m": t["length_m"]}) for p, t in features]
+    print(f"  往復 z18/{x}/{y}: {len(features)} features  {'OK' if ok_round else 'NG'}")
+
+    # 離れたスポット（別の z12 タイル）
+    spot_c = spot_b.copy()
+    spot_c["start_lng"] += 0.5
+    spot_c["end_lng"] += 0.5
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with CoastlineTiles(Path(tmp) / "t.mbtiles") as tiles:
+            start = time.perf_counter()
+            first = tiles.update({"a": spot_a, "b": spot_b})
+            elapsed = time.perf_counter() - start
+            again = tiles.update({"b": spot_b})
+            stats = tiles.stats()
+            tiles.update({"a": spot_a, "c": spot_c})
+            incremental = list(tiles.iter_tiles())
+        with CoastlineTiles(Path(tmp) / "full.mbtiles") as tiles:
+            tiles.update({"a": spot_a, "b": spot_b, "c": spot_c})
+            full = list(tiles.iter_tiles())
+        total = sum(level[1] for level in stats["levels"])
+        size = sum(level[2] for level in stats["levels"])
+        ok_update = first["written"] == total and 0 < again["written"] < total
+        print(f"  生成: {total} タイル, {size / 1024:.1f}KB ({elapsed:.2f}s)、"
+              f"1スポット更新で {again['written']} タイル作り直し  {'OK' if ok_update else 'NG'}")
+        ok_cluster = incremental == full
+        print(f"  離れたスポットの同時更新: {len(incremental)} タイル、一括生成と一致  "
+              f"{'OK' if ok_cluster else 'NG'}")
+    return ok_dedup and ok_round and ok_update and ok_cluster
+
+
+def main():
+    args = sys.argv[1:]
+    path = DEFAULT_TILES_PATH
+    if "--mbtiles" in args:
+        i = args.index("--mbtiles")
+        path = Path(args[i + 1])
+        del args[i:i + 2]
+
+    if args == ["check"]:
+        ok = check_tiles()
+        print("=== OK ===" if ok else "=== NG ===")
+        sys.exit(0 if ok else 1)
+    elif args == ["info"]:
+        with CoastlineTiles(path) as tiles:
+            stats = tiles.stats()
+        print(f"=== {path} ===")
+        print(f"  スポット: {stats['spots']}")
+        for z, count, size, largest in stats["levels"]:
+            print(f"  z{z}: {count} タイル, 合計 {size / 1024:.1f}KB, 最大 {largest / 1024:.1f}KB")
+    elif len(args) == 2 and args[0] == "export-dir":
+        out = Path(args[1])
+        count = 0
+        with CoastlineTiles(path) as tiles:
+            for z, x, y, data in tiles.iter_tiles():
+                dest = out / str(z) / str(x) / f"{y}.pbf"
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                dest.write_bytes(gzip.decompress(data))
+                count += 1
+        print(f"{count} タイルを書き出しました → {out}")
+    else:
+        print("使用方法:")
+        print("  python coastline_tiles.py info [--mbtiles PATH]")
+        print("  python coastline_tiles.py export-dir <DIR> [--mbtiles PATH]")
+        print("  python coastline_tiles.py check")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,38 +3,92 @@
 download_aerial.py
 
 国土地理院（GSI）航空写真タイルから高解像度画像を取得。
-structureEndpoints から中心座標・グリッドサイズを自動計算。
+structureEndpoints から取得範囲を自動計算（既定は構造物の軸に沿った長方形グリッド:
+軸方向は長さの割合、軸と直交する方向は距離（m）で別々にパディング）。
+出力はタイル分割モザイク satellite/{slug}.mosaic（mosaic.py 参照）。
 
 使用方法:
     python download_aerial.py <slug>                  # JSONから自動計算
     python download_aerial.py --all                   # 全スポット自動計算
+    （サイト登録の全スポットを重複なく一括取得する場合は fleet_plan.py）
     python download_aerial.py <slug> <lat> <lng> [zoom] [grid_size]  # 手動指定
+
+オプション:
+    --workers N         タイル並列取得数（既定8、1で従来の逐次取得）
+    --cache-max-mb MB   タイルキャッシュ容量上限（既定2048MB、satellite/tiles/）
+    --no-cache          タイルキャッシュを使わず毎回取得
+    --archive PATH      タイルキャッシュの代わりに MBTiles アーカイブを読み書き（tile_archive.py）
+    --flat-jpeg         {slug}.mosaic に加えて従来の1枚JPEG {slug}.jpg も出力
+    --pyramid N         下位ズームのモザイクを N 段作成（既定2: z17, z16、0で作らない）
+    --along-padding R   構造物の軸方向のパディング（片側、長さに対する割合、既定0.3）
+    --cross-padding-m M 軸と直交する方向のパディング（片側、m、既定300）
+    --square-grid       従来の正方形グリッド（max(スパン)・偶数・最小6）で取得
+    --coast-band M      キャッシュ済みOSM海岸線から M(m) 以内のタイルだけ取得
+                        （他は中立色で埋め、meta.json の coverage に記録）
+    --tile-url URL      タイルURL（既定はGSI、環境変数 PATENT_TILE_URL でも指定可）
+                        例: http://127.0.0.1:8765/{z}/{x}/{y}.jpg（tile_server.py）
 """
 
+import os
 import sys
 import math
 import json
+import time
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from urllib.request import urlopen, Request
+from urllib.parse import urlsplit
 from io import BytesIO
 
+import numpy as np
 from PIL import Image
 
+from coastline_geometry import DEFAULT_TOLERANCE_M, simplify_coastlines
+from generate_combined_map import load_cached_coastline
+from osm_cache import OverpassCache
+from mosaic import MosaicWriter, PLACEHOLDER_COLOR, PYRAMID_LEVELS, build_pyramid, mosaic_path
+from projection import (
+    latlng_to_tile,
+    latlng_to_tile_array,
+    latlng_to_tile_float,
+    split_latlng,
+    tile_to_latlng,
+)
+from tile_archive import MBTilesArchive
+from tile_cache import TileCache, DEFAULT_MAX_BYTES
+
 
 # GSI航空写真タイルURL
 GSI_TILE_URL = "https://cyberjapandata.gsi.go.jp/xyz/seamlessphoto/{z}/{x}/{y}.jpg"
+USER_AGENT = "TsuriSpot-Patent-Pipeline/1.0"
 
-# 構造JSONディレクトリ
-STRUCTURES_DIR = Path(__file__).parent.parent / "data" / "structures"
+# 実際に使うタイルURL（ローカルのスタンドイン tile_server.py 等に差し替え可）
+TILE_URL = os.environ.get("PATENT_TILE_URL", GSI_TILE_URL)
+
+# 429/5xx 応答時の再試行回数と初回待ち時間（指数バックオフ）
+MAX_RETRIES = 3
+RETRY_BACKOFF_S = 0.5
 
+# タイルキャッシュのキー（提供元 + 撮影年）。撮影年はメタデータの "date" と同じ
+TILE_PROVIDER = "gsi-seamlessphoto"
+IMAGERY_DATE = "2024"
 
-def latlng_to_tile(lat: float, lng: float, zoom: int) -> tuple[int, int]:
-    """緯度経度 → タイル座標変換"""
-    n = 2 ** zoom
-    x = int((lng + 180.0) / 360.0 * n)
-    lat_rad = math.radians(lat)
-    y = int((1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * n)
-    return x, y
+JPEG_SOI = b"\xff\xd8"
+PNG_SIGNATURE = b"\x89PNG"
+
+# タイル並列取得数（1 = 逐次取得）
+DEFAULT_WORKERS = 8
+
+# 長方形グリッドの既定パディングと最小辺（タイル数）
+ALONG_PADDING = 0.3
+CROSS_PADDING_M = 300
+MIN_GRID_TILES = 4
+# 地球の赤道周長（m）
+EARTH_CIRCUMFERENCE_M = 40075016.686
+
+# 構造JSONディレクトリ
+STRUCTURES_DIR = Path(__file__).parent.parent / "data" / "structures"
 
 
 def load_structure_data(slug: str) -> dict | None:
@@ -84,19 +138,380 @@ def calc_params_from_endpoints(
     return center_lat, center_lng, grid_size
 
 
-def download_tile(z: int, x: int, y: int) -> Image.Image | None:
-    """GSIタイルを1枚ダウンロード"""
-    url = GSI_TILE_URL.format(z=z, x=x, y=y)
+def calc_grid_from_endpoints(
+    west: dict,
+    east: dict,
+    zoom: int = 18,
+    along_padding: float = ALONG_PADDING,
+    cross_padding_m: float = CROSS_PADDING_M,
+    min_tiles: int = MIN_GRID_TILES,
+) -> dict:
+    """
+    structureEndpointsから構造物の軸に沿った長方形グリッドを計算。
+
+    西端→東端を軸として、軸方向に長さ×along_padding、直交方向に
+    cross_padding_m（m）ずつ広げた（回転した）長方形を作り、それを覆う
+    タイル範囲を返す。東西に長い護岸なら横長、斜めの突堤なら軸方向に
+    広がった範囲になり、正方形グリッドのように内陸や沖のタイルを取らない。
+
+    Returns:
+        {"tileMin": {"x", "y"}, "cols", "rows"}
+    """
+    wx, wy = latlng_to_tile_float(west["lat"], west["lng"], zoom)
+    ex, ey = latlng_to_tile_float(east["lat"], east["lng"], zoom)
+    dx, dy = ex - wx, ey - wy
+    length = math.hypot(dx, dy)
+    ux, uy = (dx / length, dy / length) if length > 0 else (1.0, 0.0)
+    nx, ny = -uy, ux
+
+    # タイル1枚の一辺（m）は緯度で変わる
+    mid_lat = (west["lat"] + east["lat"]) / 2
+    tile_m = EARTH_CIRCUMFERENCE_M * math.cos(math.radians(mid_lat)) / 2 ** zoom
+    along = length * along_padding
+    cross = cross_padding_m / tile_m
+
+    corners = [
+        (px + ux * a + nx * c, py + uy * a + ny * c)
+        for px, py, a in ((wx, wy, -along), (ex, ey, along))
+        for c in (-cross, cross)
+    ]
+    x_min = math.floor(min(x for x, _ in corners))
+    y_min = math.floor(min(y for _, y in corners))
+    cols = math.ceil(max(x for x, _ in corners)) - x_min
+    rows = math.ceil(max(y for _, y in corners)) - y_min
+
+    # 極端に細い範囲は最小辺まで両側に広げる
+    if cols < min_tiles:
+        x_min -= (min_tiles - cols) // 2
+        cols = min_tiles
+    if rows < min_tiles:
+        y_min -= (min_tiles - rows) // 2
+        rows = min_tiles
+    return {"tileMin": {"x": x_min, "y": y_min}, "cols": cols, "rows": rows}
+
+
+def grid_origin(lat: float, lng: float, zoom: int, grid_size: int) -> tuple[int, int]:
+    """中心座標とgridSizeから、グリッド左上のタイル座標を返す"""
+    center_x, center_y = latlng_to_tile(lat, lng, zoom)
+    half = grid_size // 2
+    return center_x - half, center_y - half
+
+
+def grid_coastlines(zoom: int, x_min: int, y_min: int, cols: int, rows: int) -> list[list[tuple[float, float]]]:
+    """
+    グリッド範囲の海岸線を osm_cache から引く（ネットワークなし）。
+    範囲が取得済み・エクストラクト取り込み済みでなければ空リスト。
+    """
+    north, west = tile_to_latlng(x_min, y_min, zoom)
+    south, east = tile_to_latlng(x_min + cols, y_min + rows, zoom)
+    bbox = (south, west, north, east)
+    with OverpassCache(offline=True) as cache:
+        if cache.missing_cells("coastline", bbox):
+            return []
+        return cache.lookup("coastline", bbox).coastlines()
+
+
+def coast_band_tiles(
+    coastlines: list[list[tuple[float, float]]],
+    zoom: int,
+    coords: list[tuple[int, int]],
+    buffer_m: float,
+) -> set[tuple[int, int]]:
+    """
+    coords のうち、海岸線から buffer_m 以内に掛かるタイル。
+
+    タイル中心から海岸線の各線分への最短距離（タイル単位）を求め、
+    buffer + タイル半対角 以内なら採用する（タイルの角が帯に掛かる場合も含む）。
+    """
+    segments = []
+    for line in coastlines:
+        lat, lng = split_latlng(line)
+        tx, ty = latlng_to_tile_array(lat, lng, zoom)
+        pts = np.stack([tx, ty], axis=1)
+        if len(pts) == 1:
+            pts = np.vstack([pts, pts])
+        segments.append(np.stack([pts[:-1], pts[1:]], axis=1))
+    if not segments or not coords:
+        return set()
+    segments = np.concatenate(segments)
+
+    cells = np.asarray(coords, dtype=np.float64)
+    mid_lat, _ = tile_to_latlng(0, cells[:, 1].mean() + 0.5, zoom)
+    tile_m = EARTH_CIRCUMFERENCE_M * math.cos(math.radians(mid_lat)) / 2 ** zoom
+    limit = buffer_m / tile_m + math.sqrt(2) / 2
+
+    centers = cells + 0.5
+    nearest = np.full(len(centers), np.inf)
+    # (タイル数 x 線分数) の距離行列を線分のブロックごとに計算
+    for start in range(0, len(segments), 2048):
+        a = segments[start:start + 2048, 0]
+        d = segments[start:start + 2048, 1] - a
+        len2 = np.maximum((d ** 2).sum(axis=1), 1e-18)
+        rel = centers[:, None, :] - a[None, :, :]
+        t = np.clip((rel * d[None]).sum(axis=2) / len2[None], 0, 1)
+        diff = rel - t[..., None] * d[None]
+        nearest = np.minimum(nearest, np.hypot(diff[..., 0], diff[..., 1]).min(axis=1))
+    return {c for c, dist in zip(coords, nearest) if dist <= limit}
+
+
+def coverage_meta(
+    keep: set[tuple[int, int]], x_min: int, y_min: int, cols: int, rows: int,
+    buffer_m: float, tile_size: int = 256,
+) -> dict:
+    """meta.json の "coverage"（取得したセルのビットマップと外接矩形）"""
+    cells = [
+        "".join("1" if (x_min + dx, y_min + dy) in keep else "0" for dx in range(cols))
+        for dy in range(rows)
+    ]
+    coverage = {
+        "mode": "coast-band",
+        "bufferM": buffer_m,
+        "fetched": len(keep),
+        "skipped": cols * rows - len(keep),
+        "cells": cells,
+    }
+    if keep:
+        xs = [x - x_min for x, _ in keep]
+        ys = [y - y_min for _, y in keep]
+        coverage["bbox"] = {
+            "left": min(xs) * tile_size,
+            "top": min(ys) * tile_size,
+            "right": (max(xs) + 1) * tile_size,
+            "bottom": (max(ys) + 1) * tile_size,
+        }
+    return coverage
+
+
+def square_grid(lat: float, lng: float, zoom: int, grid_size: int) -> dict:
+    """中心座標とgridSizeの正方形グリッド（calc_grid_from_endpoints と同じ形式）"""
+    x_min, y_min = grid_origin(lat, lng, zoom, grid_size)
+    return {"tileMin": {"x": x_min, "y": y_min}, "cols": grid_size, "rows": grid_size}
+
+
+def decode_tile(data: bytes, z: int, x: int, y: int) -> Image.Image | None:
+    """タイルの生データをデコード"""
     try:
-        req = Request(url, headers={"User-Agent": "TsuriSpot-Patent-Pipeline/1.0"})
-        with urlopen(req, timeout=10) as resp:
-            data = resp.read()
-            return Image.open(BytesIO(data))
+        tile = Image.open(BytesIO(data))
+        tile.load()
+        return tile
     except Exception as e:
-        print(f"  タイル取得失敗: z={z} x={x} y={y} - {e}")
+        print(f"  タイルデコード失敗: z={z} x={x} y={y} - {e}")
         return None
 
 
+class TileSession:
+    """
+    スレッドごとにkeep-alive接続を保持するタイル取得セッション。
+
+    urlopenはリクエスト毎にTCP/TLS接続を張り直すため、タイル数に比例して
+    ハンドシェイクのRTTが積み上がる。ワーカースレッドごとにHTTP(S)接続を
+    1本だけ持ち、同一ホストへのリクエストで使い回す。
+    """
+
+    def __init__(self, url_template: str | None = None, timeout: float = 10):
+        self.url_template = url_template or TILE_URL
+        self.timeout = timeout
+        self.requests = 0
+        self.retries = 0
+        parts = urlsplit(self.url_template)
+        self._scheme = parts.scheme
+        self._host = parts.netloc
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: list[http.client.HTTPConnection] = []
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self._scheme == "https":
+                conn = http.client.HTTPSConnection(self._host, timeout=self.timeout)
+            else:
+                conn = http.client.HTTPConnection(self._host, timeout=self.timeout)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def fetch(self, z: int, x: int, y: int) -> bytes | None:
+        """タイル1枚の生データを取得（失敗時None）"""
+        result = self.fetch_validated(z, x, y)
+        return result[1] if result else None
+
+    def fetch_validated(
+        self,
+        z: int,
+        x: int,
+        y: int,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ) -> tuple[int, bytes, dict] | None:
+        """
+        タイル1枚を取得し (status, 生データ, 検証子) を返す（失敗時None）。
+
+        etag / last_modified を渡すと条件付きGET（If-None-Match / If-Modified-Since）
+        になり、変化がなければ status=304・空データが返る。
+        検証子は {"etag": ..., "last_modified": ...}（応答になければ渡した値を引き継ぐ）。
+        """
+        parts = urlsplit(self.url_template.format(z=z, x=x, y=y))
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        headers = {"User-Agent": USER_AGENT, "Connection": "keep-alive"}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        reconnected = False
+        attempt = 0
+        while True:
+            conn = self._connection()
+            try:
+                conn.request("GET", path, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.HTTPException, OSError) as e:
+                self._drop_connection()
+                # サーバー側でidle切断された接続を掴んだ場合に備えて1回だけ張り直す
+                if not reconnected:
+                    reconnected = True
+                    continue
+                print(f"  タイル取得失敗: z={z} x={x} y={y} - {e}")
+                return None
+            finally:
+                with self._lock:
+                    self.requests += 1
+
+            if resp.will_close:
+                self._drop_connection()
+            if resp.status in (200, 304):
+                validators = {
+                    "etag": resp.getheader("ETag") or etag,
+                    "last_modified": resp.getheader("Last-Modified") or last_modified,
+                }
+                return resp.status, data, validators
+            if (resp.status == 429 or resp.status >= 500) and attempt < MAX_RETRIES:
+                # 混雑・一時エラーは Retry-After（なければ指数バックオフ）だけ待って再試行
+                wait = RETRY_BACKOFF_S * 2 ** attempt
+                retry_after = resp.getheader("Retry-After")
+                if retry_after and retry_after.isdigit():
+                    wait = max(wait, min(float(retry_after), 30))
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                time.sleep(wait)
+                continue
+            print(f"  タイル取得失敗: z={z} x={x} y={y} - HTTP {resp.status}")
+            return None
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+def fetch_tiles(
+    z: int,
+    coords: list[tuple[int, int]],
+    workers: int = DEFAULT_WORKERS,
+    cache: TileCache | MBTilesArchive | None = None,
+    tile_url: str | None = None,
+    offline: bool = False,
+):
+    """
+    タイル群を取得し、coordsと同じ順序で (x, y, JPEG生データ|None) を返すジェネレータ。
+
+    cache（タイルキャッシュまたはMBTilesアーカイブ）があれば先に参照し、
+    ミスしたタイルだけをネットワークから取得して保存する。
+    workers > 1 なら keep-alive 接続を使い回すスレッドプールで並列取得、
+    workers <= 1 なら同じセッション（429/5xx の再試行も同じ）で逐次取得。
+    offline=True ならネットワークに出ず、キャッシュにないタイルは None。
+    """
+    session = TileSession(tile_url) if not offline else None
+    if session:
+        fetch = session.fetch_validated
+    else:
+        def fetch(z, x, y):
+            print(f"  キャッシュにありません: z={z} x={x} y={y}")
+            return None
+
+    def load(c: tuple[int, int]) -> bytes | None:
+        x, y = c
+        data = cache.get(TILE_PROVIDER, IMAGERY_DATE, z, x, y) if cache else None
+        if data is None:
+            result = fetch(z, x, y)
+            if result is None:
+                return None
+            _, data, validators = result
+            if not data.startswith((JPEG_SOI, PNG_SIGNATURE)):
+                print(f"  タイル取得失敗: z={z} x={x} y={y} - 画像ではありません")
+                return None
+            if cache:
+                cache.put(TILE_PROVIDER, IMAGERY_DATE, z, x, y, data, **validators)
+        return data
+
+    try:
+        if workers <= 1:
+            for x, y in coords:
+                yield x, y, load((x, y))
+            return
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # mapは投入順に結果を返すので、書き込み順序は逐次取得と一致する
+            for (x, y), data in zip(coords, pool.map(load, coords)):
+                yield x, y, data
+    finally:
+        if session:
+            session.close()
+
+
+def refresh_tiles(
+    z: int,
+    coords: list[tuple[int, int]],
+    cache: TileCache | MBTilesArchive,
+    workers: int = DEFAULT_WORKERS,
+    tile_url: str | None = None,
+):
+    """
+    キャッシュ済みタイルを条件付きGETで再検証し、(x, y, 状態) を返すジェネレータ。
+
+    状態: "unchanged"（304、または200でも内容が同じ）/ "changed"（内容が変わり
+    キャッシュを更新）/ "new"（未キャッシュで新規取得）/ "missing"（取得失敗）。
+    検証子のないタイル（本機能以前に取得したもの）は通常のGETで内容を比較する。
+    """
+    session = TileSession(tile_url)
+
+    def check(c: tuple[int, int]) -> str:
+        x, y = c
+        known = cache.validators(TILE_PROVIDER, IMAGERY_DATE, z, x, y)
+        etag, last_modified = known if known else (None, None)
+        result = session.fetch_validated(z, x, y, etag, last_modified)
+        if result is None:
+            return "missing"
+        status, data, validators = result
+        if status == 304:
+            cache.mark_validated(TILE_PROVIDER, IMAGERY_DATE, z, x, y, **validators)
+            return "unchanged"
+        if not data.startswith((JPEG_SOI, PNG_SIGNATURE)):
+            print(f"  タイル取得失敗: z={z} x={x} y={y} - 画像ではありません")
+            return "missing"
+        changed = cache.put(TILE_PROVIDER, IMAGERY_DATE, z, x, y, data, **validators)
+        if known is None:
+            return "new"
+        return "changed" if changed else "unchanged"
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for (x, y), state in zip(coords, pool.map(check, coords)):
+                yield x, y, state
+    finally:
+        session.close()
+
+
 def download_spot_image(
     slug: str,
     lat: float,
@@ -104,50 +519,134 @@ def download_spot_image(
     zoom: int = 18,
     grid_size: int = 6,
     output_dir: str = "satellite",
+    workers: int = DEFAULT_WORKERS,
+    cache: TileCache | MBTilesArchive | None = None,
+    flat_jpeg: bool = False,
+    tile_url: str | None = None,
+    pyramid_levels: int = PYRAMID_LEVELS,
+    grid: dict | None = None,
+    coast_band_m: float | None = None,
+    offline: bool = False,
 ) -> str | None:
-    """指定座標周辺のGSI航空写真タイルを取得し、1枚に結合。"""
+    """
+    指定座標周辺のGSI航空写真タイルを取得し、{slug}.mosaic に格納。
+
+    grid（calc_grid_from_endpoints の戻り値）を渡すとその長方形範囲を取得し、
+    なければ (lat, lng) を中心とする grid_size 角の正方形。
+    coast_band_m 指定時は、キャッシュ済みのOSM海岸線（analyze_coastline.py が
+    保存した satellite/cache/{slug}_coastline.json）から coast_band_m 以内の
+    タイルだけを取得し、残りのセルは中立色で埋める。海岸線のキャッシュが
+    なければ全タイルを取得する。
+    offline=True ならタイルは cache からだけ読む（ネットワークに出ない）。
+
+    タイルは再エンコードせずにタイル分割モザイクへ順次書き込む（全体キャンバスは
+    作らない）。flat_jpeg=True なら従来互換の1枚JPEG {slug}.jpg も出力する。
+    pyramid_levels 段の下位ズーム（{slug}.z17.mosaic 等）も作り、meta.json の
+    "levels" に各レベルの変換を記録する。
+    """
     Path(output_dir).mkdir(parents=True, exist_ok=True)
 
     center_x, center_y = latlng_to_tile(lat, lng, zoom)
-    half = grid_size // 2
+    if grid is None:
+        grid = square_grid(lat, lng, zoom, grid_size)
+    x_min, y_min = grid["tileMin"]["x"], grid["tileMin"]["y"]
+    cols, rows = grid["cols"], grid["rows"]
 
     print(f"  中心: ({lat}, {lng}) → タイル z={zoom} x={center_x} y={center_y}")
-    print(f"  グリッド: {grid_size}x{grid_size} ({grid_size*grid_size}タイル)")
+    print(f"  グリッド: {cols}x{rows} ({cols*rows}タイル)")
 
     tile_size = 256
-    result = Image.new("RGB", (grid_size * tile_size, grid_size * tile_size))
+    width = cols * tile_size
+    height = rows * tile_size
+    result = Image.new("RGB", (width, height)) if flat_jpeg else None
     success_count = 0
 
-    for dy in range(grid_size):
-        for dx in range(grid_size):
-            tx = center_x - half + dx
-            ty = center_y - half + dy
-            tile = download_tile(zoom, tx, ty)
-            if tile:
-                result.paste(tile, (dx * tile_size, dy * tile_size))
-                success_count += 1
+    coords = [
+        (x_min + dx, y_min + dy)
+        for dy in range(rows)
+        for dx in range(cols)
+    ]
+    keep = None
+    if coast_band_m is not None:
+        coastlines = load_cached_coastline(slug) or grid_coastlines(zoom, x_min, y_min, cols, rows)
+        # 帯の判定には細部は不要: 帯幅の1/10まで簡略化してから距離計算
+        coastlines = simplify_coastlines(coastlines, tolerance_m=max(DEFAULT_TOLERANCE_M, coast_band_m / 10))
+        if coastlines:
+            keep = coast_band_tiles(coastlines, zoom, coords, coast_band_m)
+            print(f"  海岸線帯（{coast_band_m:.0f}m）: {len(keep)}/{len(coords)}タイルを取得")
+        else:
+            print(f"  海岸線キャッシュなし → 全タイルを取得"
+                  f"（先に analyze_coastline.py {slug} か osm_ingest.py で取り込み）")
+
+    output_path = str(mosaic_path(slug, output_dir))
+    writer = MosaicWriter(output_path, zoom, x_min, y_min, cols, rows, tile_size)
+    try:
+        if keep is not None:
+            for tx, ty in coords:
+                if (tx, ty) not in keep:
+                    writer.write_placeholder(tx, ty)
+                    if result is not None:
+                        result.paste(PLACEHOLDER_COLOR, (
+                            (tx - x_min) * tile_size, (ty - y_min) * tile_size,
+                            (tx - x_min + 1) * tile_size, (ty - y_min + 1) * tile_size,
+                        ))
+            coords = [c for c in coords if c in keep]
+        for tx, ty, data in fetch_tiles(zoom, coords, workers, cache, tile_url, offline):
+            if data is None:
+                continue
+            data = writer.write_tile(tx, ty, data)
+            success_count += 1
+            if result is not None:
+                tile = decode_tile(data, zoom, tx, ty)
+                if tile:
+                    result.paste(tile, ((tx - x_min) * tile_size, (ty - y_min) * tile_size))
+    except BaseException:
+        writer.abort()
+        raise
 
     if success_count == 0:
+        writer.abort()
         print(f"  エラー: タイルが1枚も取得できませんでした")
         return None
-
-    output_path = str(Path(output_dir) / f"{slug}.jpg")
-    result.save(output_path, "JPEG", quality=95)
-
-    print(f"  取得: {success_count}/{grid_size*grid_size}タイル")
-    print(f"  画像サイズ: {result.size[0]}x{result.size[1]}px")
+    writer.close()
+
+    print(f"  取得: {success_count}/{len(coords)}タイル")
+    if writer.normalized:
+        print(f"  正規化（サイズ・形式違い）: {writer.normalized}タイル、他は無変換で格納")
+    if cache:
+        print(f"  {cache.summary()}")
+    print(f"  画像サイズ: {width}x{height}px")
     print(f"  出力: {output_path}")
 
+    if result is not None:
+        jpeg_path = str(Path(output_dir) / f"{slug}.jpg")
+        result.save(jpeg_path, "JPEG", quality=95)
+        print(f"  出力: {jpeg_path}")
+
     # メタデータ保存
     meta = {
         "source": "gsi-aerial",
-        "date": "2024",
+        "date": IMAGERY_DATE,
         "zoom": zoom,
-        "gridSize": grid_size,
+        "gridCols": cols,
+        "gridRows": rows,
         "tileCenter": {"x": center_x, "y": center_y},
+        "tileMin": {"x": x_min, "y": y_min},
         "resolution_m": 0.25,
-        "imageSize": {"width": result.size[0], "height": result.size[1]},
+        "imageSize": {"width": width, "height": height},
+        "mosaic": Path(output_path).name,
     }
+    if cols == rows:
+        # 正方形グリッドのみ従来の gridSize も残す
+        meta["gridSize"] = cols
+    if keep is not None:
+        meta["coverage"] = coverage_meta(keep, x_min, y_min, cols, rows, coast_band_m, tile_size)
+    if pyramid_levels > 0:
+        meta["levels"] = build_pyramid(output_path, pyramid_levels, meta["resolution_m"])
+        sizes = ", ".join(
+            f"z{lv['zoom']} {lv['imageSize']['width']}px" for lv in meta["levels"][1:]
+        )
+        print(f"  ピラミッド: {sizes}")
     meta_path = str(Path(output_dir) / f"{slug}.meta.json")
     with open(meta_path, "w", encoding="utf-8") as f:
         json.dump(meta, f, ensure_ascii=False, indent=2)
@@ -155,8 +654,18 @@ def download_spot_image(
     return output_path
 
 
-def download_from_json(slug: str, output_dir: str) -> str | None:
-    """構造JSONのstructureEndpointsから自動計算して取得"""
+def download_from_json(
+    slug: str,
+    output_dir: str,
+    square: bool = False,
+    along_padding: float = ALONG_PADDING,
+    cross_padding_m: float = CROSS_PADDING_M,
+    **options,
+) -> str | None:
+    """
+    構造JSONのstructureEndpointsから自動計算して取得（optionsはdownload_spot_imageへ）。
+    square=True なら従来の正方形グリッド。
+    """
     data = load_structure_data(slug)
     if not data:
         print(f"  エラー: {slug}.json が見つかりません")
@@ -172,34 +681,86 @@ def download_from_json(slug: str, output_dir: str) -> str | None:
             print(f"  エラー: {slug} に座標情報がありません")
             return None
         print(f"  structureEndpointsなし → coordinates + gridSize=6 で取得")
-        return download_spot_image(slug, lat, lng, 18, 6, output_dir)
+        return download_spot_image(slug, lat, lng, 18, 6, output_dir, **options)
 
     west = endpoints["west"]
     east = endpoints["east"]
-    lat, lng, grid = calc_params_from_endpoints(west, east)
+    lat, lng, grid_size = calc_params_from_endpoints(west, east)
 
     print(f"  西端: ({west['lat']}, {west['lng']})")
     print(f"  東端: ({east['lat']}, {east['lng']})")
-    print(f"  → 中心: ({lat:.4f}, {lng:.4f}), gridSize: {grid}")
+    if square:
+        print(f"  → 中心: ({lat:.4f}, {lng:.4f}), gridSize: {grid_size}")
+        return download_spot_image(slug, lat, lng, 18, grid_size, output_dir, **options)
+
+    grid = calc_grid_from_endpoints(west, east, 18, along_padding, cross_padding_m)
+    print(f"  → 中心: ({lat:.4f}, {lng:.4f}), グリッド: {grid['cols']}x{grid['rows']}"
+          f"（正方形なら{grid_size}x{grid_size}）")
+    return download_spot_image(slug, lat, lng, 18, grid_size, output_dir, grid=grid, **options)
+
+
+def pop_option(args: list[str], name: str, default: str | None = None) -> str | None:
+    """args から "--name value" を取り除いて値を返す（位置引数の解釈を崩さないため）"""
+    if name in args:
+        i = args.index(name)
+        if i + 1 < len(args):
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        del args[i]
+    return default
 
-    return download_spot_image(slug, lat, lng, 18, grid, output_dir)
+
+def pop_flag(args: list[str], name: str) -> bool:
+    """args から "--name" を取り除き、指定されていたかを返す"""
+    if name in args:
+        args.remove(name)
+        return True
+    return False
 
 
 def main():
     output_dir = str(Path(__file__).parent / "satellite")
 
-    if len(sys.argv) >= 4:
+    args = sys.argv[1:]
+    workers = int(pop_option(args, "--workers", str(DEFAULT_WORKERS)))
+    cache_mb = pop_option(args, "--cache-max-mb")
+    cache = None
+    archive = pop_option(args, "--archive")
+    if archive:
+        cache = MBTilesArchive(archive, TILE_PROVIDER, IMAGERY_DATE)
+    elif not pop_flag(args, "--no-cache"):
+        max_bytes = int(float(cache_mb) * 1024 ** 2) if cache_mb else DEFAULT_MAX_BYTES
+        cache = TileCache(max_bytes=max_bytes)
+    options = {
+        "workers": workers,
+        "cache": cache,
+        "flat_jpeg": pop_flag(args, "--flat-jpeg"),
+        "tile_url": pop_option(args, "--tile-url"),
+        "pyramid_levels": int(pop_option(args, "--pyramid", str(PYRAMID_LEVELS))),
+    }
+    coast_band = pop_option(args, "--coast-band")
+    if coast_band:
+        options["coast_band_m"] = float(coast_band)
+    grid_options = {
+        "square": pop_flag(args, "--square-grid"),
+        "along_padding": float(pop_option(args, "--along-padding", str(ALONG_PADDING))),
+        "cross_padding_m": float(pop_option(args, "--cross-padding-m", str(CROSS_PADDING_M))),
+    }
+    argv = [sys.argv[0]] + args
+
+    if len(argv) >= 4:
         # 手動指定モード（従来互換）
-        slug = sys.argv[1]
-        lat = float(sys.argv[2])
-        lng = float(sys.argv[3])
-        zoom = int(sys.argv[4]) if len(sys.argv) > 4 else 18
-        grid = int(sys.argv[5]) if len(sys.argv) > 5 else 6
+        slug = argv[1]
+        lat = float(argv[2])
+        lng = float(argv[3])
+        zoom = int(argv[4]) if len(argv) > 4 else 18
+        grid = int(argv[5]) if len(argv) > 5 else 6
 
         print(f"=== GSI航空写真取得（手動）: {slug} ===")
-        download_spot_image(slug, lat, lng, zoom, grid, output_dir)
+        download_spot_image(slug, lat, lng, zoom, grid, output_dir, **options)
 
-    elif len(sys.argv) == 2 and sys.argv[1] == "--all":
+    elif len(argv) == 2 and argv[1] == "--all":
         # 全スポット一括取得（JSONから自動計算）
         if not STRUCTURES_DIR.exists():
             print("エラー: structures ディレクトリが見つかりません")
@@ -211,22 +772,31 @@ def main():
         for json_file in files:
             slug = json_file.stem
             print(f"\n[{slug}]")
-            download_from_json(slug, output_dir)
+            download_from_json(slug, output_dir, **grid_options, **options)
             print()
 
         print("=== 完了 ===")
 
-    elif len(sys.argv) == 2:
+    elif len(argv) == 2:
         # slug指定 → JSONから自動計算
-        slug = sys.argv[1]
+        slug = argv[1]
         print(f"=== GSI航空写真取得（自動）: {slug} ===")
-        download_from_json(slug, output_dir)
+        download_from_json(slug, output_dir, **grid_options, **options)
 
     else:
         print("使用方法:")
         print("  自動（JSON）: python download_aerial.py <slug>")
         print("  全スポット:   python download_aerial.py --all")
         print("  手動指定:     python download_aerial.py <slug> <lat> <lng> [zoom] [grid_size]")
+        print("  オプション:   --workers N（並列取得数、1で逐次）")
+        print("                --cache-max-mb MB / --no-cache（タイルキャッシュ）")
+        print("                --archive PATH（MBTilesアーカイブをキャッシュとして使用）")
+        print("                --flat-jpeg（従来の1枚JPEGも出力）")
+        print("                --tile-url URL（タイル取得先、tile_server.py 等）")
+        print("                --pyramid N（下位ズームの段数、既定2、0で作らない）")
+        print("                --along-padding R / --cross-padding-m M（長方形グリッドのパディング）")
+        print("                --square-grid（従来の正方形グリッド）")
+        print("                --coast-band M（海岸線から M(m) 以内のタイルのみ取得）")
 
 
 if __name__ == "__main__":
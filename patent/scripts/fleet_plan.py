@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+fleet_plan.py
+
+サイトの全スポット（src/lib/data/spots*.ts）を対象にした航空写真の一括取得計画。
+
+download_aerial.py --all はスポットごとに独立してタイルを取るため、
+近接スポット間で重なるタイルを何度も取得する。ここでは全スポットの
+必要タイル（z18）の和集合を求め、各タイルを1回だけ取得してタイルキャッシュに
+入れる。各スポットのモザイクはキャッシュから組み立てる（ネットワークに出ない。
+キャッシュにないタイルがあればエラーにするので、先に fetch を完了させる）。
+
+タイルキャッシュの容量上限は manifest の見積もりから決める（--cache-max-mb で明示した
+上限が見積もりより小さければ fetch は開始しない）。上限を超えると LRU で追い出された
+タイルを build が取り直すことになり「各タイル1回」が崩れるため。見積もりが大きい場合は
+--archive（容量上限なし）を使う。
+
+進捗は satellite/fleet/done.log に追記するので、中断しても fetch を
+再実行すれば続きから再開できる。
+
+refresh はキャッシュ済みタイルを ETag / Last-Modified で条件付きGETし、
+変わったタイルだけを書き換える（変化がなければ大半が304で済む）。
+変化したタイルを含むスポットを satellite/fleet/changed.json に書き出すので、
+下流の処理（モザイク生成・解析）はそのスポットだけ再実行すればよい。
+
+使用方法:
+    python fleet_plan.py plan [--include-freshwater]   # manifest.json を作成
+    python fleet_plan.py fetch [--workers N] [--retry-missing] [--cache-max-mb MB] [--tile-url URL]
+    python fleet_plan.py build [slug ...]              # キャッシュからモザイク生成
+    python fleet_plan.py refresh [slug ...] [--workers N] [--rebuild]  # 変化したタイルのみ更新
+    python fleet_plan.py status
+
+    fetch / build / refresh に --archive PATH を付けると、タイルキャッシュの代わりに
+    MBTiles アーカイブ（tile_archive.py）を読み書きする。
+"""
+
+import re
+import sys
+import json
+from datetime import datetime
+from pathlib import Path
+
+from download_aerial import (
+    DEFAULT_WORKERS,
+    IMAGERY_DATE,
+    TILE_PROVIDER,
+    calc_grid_from_endpoints,
+    download_spot_image,
+    fetch_tiles,
+    square_grid,
+    load_structure_data,
+    pop_flag,
+    pop_option,
+    refresh_tiles,
+)
+from tile_archive import MBTilesArchive
+from tile_cache import TileCache, DEFAULT_MAX_BYTES
+
+
+SCRIPT_DIR = Path(__file__).parent
+SITE_DATA_DIR = SCRIPT_DIR.parent.parent / "src" / "lib" / "data"
+SATELLITE_DIR = SCRIPT_DIR / "satellite"
+FLEET_DIR = SATELLITE_DIR / "fleet"
+MANIFEST_PATH = FLEET_DIR / "manifest.json"
+DONE_LOG_PATH = FLEET_DIR / "done.log"
+CHANGED_PATH = FLEET_DIR / "changed.json"
+
+ZOOM = 18
+DEFAULT_GRID = 6
+FETCH_BATCH = 512
+# キャッシュ容量の見積もりに使うタイル1枚あたりの平均サイズ
+AVG_TILE_BYTES = 20 * 1024
+# manifest から決めるキャッシュ上限の余裕（平均サイズの見積もり誤差の分）
+CACHE_HEADROOM = 1.5
+
+# 海岸線・構造物解析の対象外（航空写真を取る意味が薄い）
+FRESHWATER_TYPES = {"river", "lake", "pond"}
+
+_SLUG_RE = re.compile(r'\bslug:\s*"([^"]+)"')
+_LAT_RE = re.compile(r'\blatitude:\s*(-?[0-9.]+)')
+_LNG_RE = re.compile(r'\blongitude:\s*(-?[0-9.]+)')
+_TYPE_RE = re.compile(r'\bspotType:\s*"([a-z-]+)"')
+
+
+def load_site_spots(data_dir: Path = SITE_DATA_DIR) -> list[dict]:
+    """
+    spots*.ts からスポットの slug / 座標 / spotType を抽出。
+
+    TypeScriptを評価せず、"slug:" の出現位置で区切った各チャンク内の
+    latitude / longitude を拾う（座標を持たないslug、例えば地域定義は捨てる）。
+    同じslugが複数ファイルにある場合は最初のものを採用。
+    """
+    spots = {}
+    for ts_file in sorted(data_dir.glob("spots*.ts")):
+        text = ts_file.read_text(encoding="utf-8")
+        matches = list(_SLUG_RE.finditer(text))
+        for i, m in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+            chunk = text[m.end():end]
+            lat_m = _LAT_RE.search(chunk)
+            lng_m = _LNG_RE.search(chunk)
+            if not lat_m or not lng_m:
+                continue
+            slug = m.group(1)
+            if slug in spots:
+                continue
+            type_m = _TYPE_RE.search(chunk)
+            spots[slug] = {
+                "slug": slug,
+                "lat": float(lat_m.group(1)),
+                "lng": float(lng_m.group(1)),
+                "spotType": type_m.group(1) if type_m else None,
+            }
+    return list(spots.values())
+
+
+def plan_spot(spot: dict, zoom: int = ZOOM) -> dict:
+    """
+    1スポットの取得範囲。構造JSONがあればstructureEndpointsに沿った長方形、
+    なければスポット座標中心の DEFAULT_GRID 角。
+    """
+    lat, lng = spot["lat"], spot["lng"]
+    data = load_structure_data(spot["slug"])
+    endpoints = (data or {}).get("structureEndpoints")
+    if endpoints:
+        west, east = endpoints["west"], endpoints["east"]
+        lat, lng = (west["lat"] + east["lat"]) / 2, (west["lng"] + east["lng"]) / 2
+        grid = calc_grid_from_endpoints(west, east, zoom)
+    else:
+        grid = square_grid(lat, lng, zoom, DEFAULT_GRID)
+    return {"slug": spot["slug"], "lat": lat, "lng": lng, **grid}
+
+
+def grid_shape(planned: dict) -> tuple[int, int]:
+    """(cols, rows)（gridSize のみの旧manifestにも対応）"""
+    if "cols" in planned:
+        return planned["cols"], planned["rows"]
+    return planned["gridSize"], planned["gridSize"]
+
+
+def spot_tiles(planned: dict) -> list[tuple[int, int]]:
+    x_min = planned["tileMin"]["x"]
+    y_min = planned["tileMin"]["y"]
+    cols, rows = grid_shape(planned)
+    return [(x_min + dx, y_min + dy) for dy in range(rows) for dx in range(cols)]
+
+
+def union_tiles(planned_spots: list[dict]) -> list[tuple[int, int]]:
+    """全スポットの必要タイルの和集合（行優先で並べて隣接タイルを近くに）"""
+    tiles = set()
+    for planned in planned_spots:
+        tiles.update(spot_tiles(planned))
+    return sorted(tiles, key=lambda t: (t[1], t[0]))
+
+
+def load_manifest() -> dict:
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def manifest_cache_bytes(manifest: dict) -> int:
+    """manifest の全タイルを追い出さずに保持できるキャッシュ上限"""
+    tiles = manifest.get("tileCount") or len(union_tiles(manifest["spots"]))
+    return max(DEFAULT_MAX_BYTES, int(tiles * AVG_TILE_BYTES * CACHE_HEADROOM))
+
+
+def load_done() -> dict[tuple[int, int], str]:
+    """done.log → {(x, y): "ok" | "cached" | "missing"}（後勝ち）"""
+    done = {}
+    if DONE_LOG_PATH.exists():
+        with open(DONE_LOG_PATH, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3:
+                    done[(int(parts[0]), int(parts[1]))] = parts[2]
+    return done
+
+
+def cmd_plan(include_freshwater: bool):
+    spots = load_site_spots()
+    print(f"スポット抽出: {len(spots)}件（{SITE_DATA_DIR}）")
+    if not include_freshwater:
+        spots = [s for s in spots if s["spotType"] not in FRESHWATER_TYPES]
+        print(f"  淡水スポットを除外 → {len(spots)}件")
+
+    planned = [plan_spot(s) for s in spots]
+    total = sum(cols * rows for cols, rows in map(grid_shape, planned))
+    unique = len(union_tiles(planned))
+
+    FLEET_DIR.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        "zoom": ZOOM,
+        "provider": TILE_PROVIDER,
+        "date": IMAGERY_DATE,
+        "createdAt": datetime.now().isoformat(),
+        "tileCount": unique,
+        "spots": planned,
+    }
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+    print(f"  スポット単位の合計: {total}タイル")
+    print(f"  重複排除後:         {unique}タイル ({unique / max(total, 1) * 100:.0f}%)")
+    print(f"  見積もり容量:       {unique * AVG_TILE_BYTES / 1024 ** 3:.1f}GB")
+    print(f"  出力: {MANIFEST_PATH}")
+
+
+def cmd_fetch(
+    workers: int,
+    retry_missing: bool,
+    cache: TileCache | MBTilesArchive,
+    tile_url: str | None = None,
+):
+    manifest = load_manifest()
+    zoom = manifest["zoom"]
+    tiles = union_tiles(manifest["spots"])
+    done = load_done()
+
+    skip = {"ok", "cached"} if retry_missing else {"ok", "cached", "missing"}
+    pending = [t for t in tiles if done.get(t) not in skip]
+    print(f"=== 一括取得: {len(tiles)}タイル中 残り{len(pending)} ===")
+
+    estimate = len(tiles) * AVG_TILE_BYTES
+    if estimate > cache.max_bytes:
+        # 取得したタイルが追い出され、build で取り直しになる
+        print(f"エラー: 見積もり{estimate / 1024 ** 3:.1f}GB がキャッシュ上限"
+              f"{cache.max_bytes / 1024 ** 3:.1f}GB を超えています"
+              f"（--cache-max-mb を外すか拡張する、または --archive PATH を指定）")
+        sys.exit(1)
+
+    fetched = missing = 0
+    with open(DONE_LOG_PATH, "a", encoding="utf-8") as log:
+        for start in range(0, len(pending), FETCH_BATCH):
+            batch = []
+            for x, y in pending[start:start + FETCH_BATCH]:
+                # 単体実行等で既にキャッシュ済みのタイルは取得しない
+                if cache.contains(manifest["provider"], manifest["date"], zoom, x, y):
+                    log.write(f"{x} {y} cached\n")
+                else:
+                    batch.append((x, y))
+            for x, y, data in fetch_tiles(zoom, batch, workers, cache, tile_url):
+                if data is None:
+                    missing += 1
+                    log.write(f"{x} {y} missing\n")
+                else:
+                    fetched += 1
+                    log.write(f"{x} {y} ok\n")
+            log.flush()
+            progress = min(start + FETCH_BATCH, len(pending))
+            print(f"  {progress}/{len(pending)} (取得{fetched}, 欠損{missing})")
+
+    print(f"  {cache.summary()}")
+    print("=== 完了 ===")
+
+
+def cmd_build(slugs: list[str], cache: TileCache | MBTilesArchive):
+    manifest = load_manifest()
+    spots = manifest["spots"]
+    if slugs:
+        spots = [s for s in spots if s["slug"] in set(slugs)]
+    print(f"=== モザイク生成: {len(spots)}スポット ===")
+
+    # キャッシュだけから組み立てる。足りないタイルがあれば取り直さずにエラー
+    lacking = {}
+    for planned in spots:
+        n = sum(
+            not cache.contains(manifest["provider"], manifest["date"], manifest["zoom"], x, y)
+            for x, y in spot_tiles(planned)
+        )
+        if n:
+            lacking[planned["slug"]] = n
+    if lacking:
+        print(f"エラー: キャッシュにないタイルがあります（{len(lacking)}スポット、"
+              f"計{sum(lacking.values())}タイル）。先に fetch を実行してください")
+        for slug, n in list(lacking.items())[:20]:
+            print(f"    {slug}: {n}タイル")
+        sys.exit(1)
+
+    for planned in spots:
+        print(f"\n[{planned['slug']}]")
+        cols, rows = grid_shape(planned)
+        download_spot_image(
+            planned["slug"], planned["lat"], planned["lng"], manifest["zoom"],
+            max(cols, rows), str(SATELLITE_DIR), workers=1, cache=cache,
+            grid={"tileMin": planned["tileMin"], "cols": cols, "rows": rows}, offline=True,
+        )
+    print("\n=== 完了 ===")
+
+
+def cmd_refresh(
+    slugs: list[str],
+    workers: int,
+    rebuild: bool,
+    cache: TileCache | MBTilesArchive,
+    tile_url: str | None = None,
+):
+    manifest = load_manifest()
+    zoom = manifest["zoom"]
+    spots = manifest["spots"]
+    if slugs:
+        spots = [s for s in spots if s["slug"] in set(slugs)]
+    tiles = [
+        t for t in union_tiles(spots)
+        if cache.contains(manifest["provider"], manifest["date"], zoom, *t)
+    ]
+    print(f"=== 再検証: {len(spots)}スポット, キャッシュ済み{len(tiles)}タイル ===")
+
+    counts = {"unchanged": 0, "changed": 0, "new": 0, "missing": 0}
+    changed_tiles = set()
+    for start in range(0, len(tiles), FETCH_BATCH):
+        batch = tiles[start:start + FETCH_BATCH]
+        for x, y, state in refresh_tiles(zoom, batch, cache, workers, tile_url):
+            counts[state] += 1
+            if state in ("changed", "new"):
+                changed_tiles.add((x, y))
+        print(f"  {min(start + FETCH_BATCH, len(tiles))}/{len(tiles)} "
+              f"(変化なし{counts['unchanged']}, 変化{counts['changed']}, 欠損{counts['missing']})")
+
+    changed_spots = [
+        p["slug"] for p in spots if changed_tiles.intersection(spot_tiles(p))
+    ]
+    FLEET_DIR.mkdir(parents=True, exist_ok=True)
+    with open(CHANGED_PATH, "w", encoding="utf-8") as f:
+        json.dump({
+            "checkedAt": datetime.now().isoformat(),
+            "tiles": counts,
+            "spots": changed_spots,
+        }, f, ensure_ascii=False, indent=1)
+
+    print(f"  変化したタイルを含むスポット: {len(changed_spots)}件")
+    for slug in changed_spots:
+        print(f"    {slug}")
+    print(f"  出力: {CHANGED_PATH}")
+    if rebuild and changed_spots:
+        cmd_build(changed_spots, cache)
+
+
+def cmd_status():
+    manifest = load_manifest()
+    tiles = union_tiles(manifest["spots"])
+    done = load_done()
+    counts = {"ok": 0, "cached": 0, "missing": 0}
+    for t in tiles:
+        status = done.get(t)
+        if status in counts:
+            counts[status] += 1
+    remaining = len(tiles) - sum(counts.values())
+    print(f"スポット: {len(manifest['spots'])}件, タイル: {len(tiles)}")
+    print(f"  取得済み: {counts['ok']}, キャッシュ済み: {counts['cached']}, "
+          f"欠損: {counts['missing']}, 残り: {remaining}")
+
+
+def main():
+    args = sys.argv[1:]
+    workers = int(pop_option(args, "--workers", str(DEFAULT_WORKERS)))
+    cache_mb = pop_option(args, "--cache-max-mb")
+    include_freshwater = pop_flag(args, "--include-freshwater")
+    retry_missing = pop_flag(args, "--retry-missing")
+    tile_url = pop_option(args, "--tile-url")
+    rebuild = pop_flag(args, "--rebuild")
+    archive = pop_option(args, "--archive")
+
+    def open_store():
+        if archive:
+            return MBTilesArchive(archive, TILE_PROVIDER, IMAGERY_DATE)
+        if cache_mb:
+            max_bytes = int(float(cache_mb) * 1024 ** 2)
+        else:
+            # 全タイルが収まる上限（refresh / build の put で追い出さないよう全コマンド共通）
+            max_bytes = manifest_cache_bytes(load_manifest())
+        return TileCache(max_bytes=max_bytes)
+
+    command = args[0] if args else ""
+    if command == "plan":
+        cmd_plan(include_freshwater)
+    elif command == "fetch":
+        cmd_fetch(workers, retry_missing, open_store(), tile_url)
+    elif command == "build":
+        cmd_build(args[1:], open_store())
+    elif command == "refresh":
+        cmd_refresh(args[1:], workers, rebuild, open_store(), tile_url)
+    elif command == "status":
+        cmd_status()
+    else:
+        print("使用方法:")
+        print("  python fleet_plan.py plan [--include-freshwater]")
+        print("  python fleet_plan.py fetch [--workers N] [--retry-missing] [--cache-max-mb MB]"
+              " [--tile-url URL] [--archive PATH]")
+        print("  python fleet_plan.py build [slug ...] [--archive PATH]")
+        print("  python fleet_plan.py refresh [slug ...] [--workers N] [--rebuild] [--tile-url URL]")
+        print("  python fleet_plan.py status")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,58 +11,33 @@ generate_combined_map.py
 import sys
 import json
 import math
+import urllib.parse
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
 
+from mosaic import aerial_size, load_aerial
+from coastline_geometry import simplify_coastlines
+from coastline_segments import classify_array, to_segment_dicts
+from coastline_store import ClassifiedCoastline
+from osm_cache import OverpassCache
+from osm_stream import OverpassArrays
+from projection import MosaicTransform, to_web_mercator, to_web_mercator_array
+
 STRUCTURES_DIR = Path(__file__).parent.parent / "data" / "structures"
 SATELLITE_DIR = Path(__file__).parent / "satellite"
 CACHE_DIR = SATELLITE_DIR / "cache"
 
 # --- GEBCO API ---
 GEBCO_URL = "https://www.msil.go.jp/server/rest/services/msil-o/GEBCO_2025/ImageServer/identify"
+GEBCO_SAMPLES_URL = "https://www.msil.go.jp/server/rest/services/msil-o/GEBCO_2025/ImageServer/getSamples"
 BATHYMETRY_EXPORT_URL = "https://www.msil.go.jp/server/rest/services/msil-o/basemap_bathymetry/MapServer/export"
-
-
-def latlng_to_tile_float(lat, lng, zoom):
-    n = 2 ** zoom
-    x = (lng + 180.0) / 360.0 * n
-    lat_rad = math.radians(lat)
-    y = (1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * n
-    return x, y
-
-
-def latlng_to_pixel(lat, lng, zoom, tx_min, ty_min):
-    tx, ty = latlng_to_tile_float(lat, lng, zoom)
-    return int((tx - tx_min) * 256), int((ty - ty_min) * 256)
-
-
-def pixel_to_latlng(px, py, zoom, tx_min, ty_min):
-    """ピクセル座標 → 緯度経度（latlng_to_pixelの逆変換）"""
-    tx = tx_min + px / 256
-    ty = ty_min + py / 256
-    n = 2 ** zoom
-    lng = tx / n * 360.0 - 180.0
-    lat_rad = math.atan(math.sinh(math.pi * (1 - 2 * ty / n)))
-    lat = math.degrees(lat_rad)
-    return lat, lng
-
-
-def to_web_mercator(lat, lng):
-    x = lng * 20037508.34 / 180
-    y_rad = math.log(math.tan((90 + lat) * math.pi / 360)) / (math.pi / 180)
-    y = y_rad * 20037508.34 / 180
-    return x, y
-
-
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371000
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = (math.sin(dlat / 2) ** 2
-         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2))
-         * math.sin(dlon / 2) ** 2)
-    return R * 2 * math.asin(math.sqrt(a))
+# getSamples 1リクエストあたりの点数（ImageServer の既定上限 1000）と並列数
+GEBCO_SAMPLE_BATCH = 1000
+GEBCO_WORKERS = 8
 
 
 # --- GEBCO水深取得 ---
@@ -83,30 +58,85 @@ def fetch_gebco_depth(lat, lng):
         return None
 
 
-def fetch_depth_grid(bbox, cache_key=""):
-    """範囲内のグリッド水深を取得"""
-    cache_file = CACHE_DIR / f"{cache_key}_gebco_grid.json"
+def _parse_depth(value):
+    if value in (None, "NoData", ""):
+        return None
+    return int(float(value))
+
+
+def _fetch_gebco_samples(points):
+    """
+    getSamples（マルチポイント）で最大 GEBCO_SAMPLE_BATCH 点を1リクエストで取得。
+    points は [(lat, lng), ...]、返り値は同じ順の水深（NoData は None）。
+    """
+    x, y = to_web_mercator_array([p[0] for p in points], [p[1] for p in points])
+    geometry = json.dumps({
+        "points": [[round(a, 2), round(b, 2)] for a, b in zip(x.tolist(), y.tolist())],
+        "spatialReference": {"wkid": 3857},
+    })
+    body = urllib.parse.urlencode({
+        "geometry": geometry,
+        "geometryType": "esriGeometryMultipoint",
+        "returnFirstValueOnly": "true",
+        "f": "json",
+    }).encode()
+    req = urllib.request.Request(GEBCO_SAMPLES_URL, data=body, headers={"User-Agent": "TsuriSpot/1.0"})
+    with urllib.request.urlopen(req, timeout=30) as resp:
+        data = json.loads(resp.read())
+    if "error" in data:
+        raise RuntimeError(data["error"].get("message", data["error"]))
+    depths = [None] * len(points)
+    for sample in data.get("samples", []):
+        depths[sample["locationId"]] = _parse_depth(sample.get("value"))
+    return depths
+
+
+def fetch_gebco_depths(points):
+    """
+    複数点の水深をまとめて取得（[(lat, lng), ...] → 同じ順の水深のリスト）。
+
+    GEBCO_SAMPLE_BATCH 点ずつ getSamples で並列に取得するので、リクエスト数は
+    点数 / GEBCO_SAMPLE_BATCH。getSamples が使えない場合は identify を
+    GEBCO_WORKERS 並列で1点ずつ問い合わせる。
+    """
+    points = list(points)
+    if not points:
+        return []
+    batches = [points[i:i + GEBCO_SAMPLE_BATCH] for i in range(0, len(points), GEBCO_SAMPLE_BATCH)]
+    try:
+        with ThreadPoolExecutor(max_workers=min(GEBCO_WORKERS, len(batches))) as pool:
+            return [d for depths in pool.map(_fetch_gebco_samples, batches) for d in depths]
+    except Exception as e:
+        print(f"  GEBCO getSamples失敗（identifyで取得）: {e}")
+    with ThreadPoolExecutor(max_workers=GEBCO_WORKERS) as pool:
+        return list(pool.map(lambda p: fetch_gebco_depth(*p), points))
+
+
+def fetch_depth_grid(bbox, cache_key="", lat_step=0.001, lng_step=0.0012):
+    """
+    範囲内のグリッド水深を取得（既定は約100m間隔）。
+    キャッシュは bbox と間隔ごと（cache_key はファイル名の接頭辞）。
+    """
+    south, west, north, east = bbox
+    name = f"{south:.5f}_{west:.5f}_{north:.5f}_{east:.5f}_{lat_step:g}x{lng_step:g}"
+    cache_file = CACHE_DIR / f"{cache_key + '_' if cache_key else ''}gebco_grid_{name}.json"
     if cache_file.exists():
         print(f"  GEBCOキャッシュ使用: {cache_file.name}")
         with open(cache_file, "r") as f:
             return json.load(f)
 
-    south, west, north, east = bbox
-    # 約100m間隔のグリッド
-    lat_step = 0.001  # ~111m
-    lng_step = 0.0012  # ~100m
-    points = []
-    lat = south
-    while lat <= north:
-        lng = west
-        while lng <= east:
-            depth = fetch_gebco_depth(lat, lng)
-            if depth is not None:
-                points.append({"lat": lat, "lng": lng, "depth": depth})
-            lng += lng_step
-        lat += lat_step
-
-    print(f"  GEBCO: {len(points)} points")
+    # south から north まで lat_step 刻み（west→east も同様）
+    lats = south + np.arange(int(math.floor((north - south) / lat_step + 1e-9)) + 1) * lat_step
+    lngs = west + np.arange(int(math.floor((east - west) / lng_step + 1e-9)) + 1) * lng_step
+    grid = [(lat, lng) for lat in lats.tolist() for lng in lngs.tolist()]
+    depths = fetch_gebco_depths(grid)
+    points = [
+        {"lat": lat, "lng": lng, "depth": depth}
+        for (lat, lng), depth in zip(grid, depths)
+        if depth is not None
+    ]
+
+    print(f"  GEBCO: {len(points)}/{len(grid)} points")
     CACHE_DIR.mkdir(parents=True, exist_ok=True)
     with open(cache_file, "w") as f:
         json.dump(points, f)
@@ -136,113 +166,65 @@ def fetch_bathymetry_image(bbox, width=800, height=400):
 
 
 # --- OSMデータ読み込み ---
-def load_cached_coastline(slug):
-    cache_file = CACHE_DIR / f"{slug}_coastline.json"
+def load_cached_osm(slug, layer):
+    """
+    analyze_coastline が取得済みのOSMデータ（OverpassArrays）を返す（ネットワークなし）。
+    osm_cache に記録された bbox を優先し、なければ従来の {slug}_{layer}.json をストリーミングで読む。
+    """
+    with OverpassCache() as cache:
+        cached = cache.cached(f"{slug}_{layer}")
+    if cached is not None:
+        return cached
+    cache_file = CACHE_DIR / f"{slug}_{layer}.json"
     if not cache_file.exists():
-        return []
-    with open(cache_file, "r") as f:
-        data = json.load(f)
-    nodes = {}
-    ways = []
-    for e in data["elements"]:
-        if e["type"] == "node":
-            nodes[e["id"]] = (e["lat"], e["lon"])
-        elif e["type"] == "way":
-            ways.append(e)
-    coastlines = []
-    for w in ways:
-        coords = [nodes[nid] for nid in w.get("nodes", []) if nid in nodes]
-        if coords:
-            coastlines.append(coords)
-    return coastlines
+        return OverpassArrays.empty()
+    return OverpassArrays.load(cache_file)
 
 
-def load_cached_park(slug):
-    cache_file = CACHE_DIR / f"{slug}_park.json"
-    if not cache_file.exists():
-        return None
-    with open(cache_file, "r") as f:
-        data = json.load(f)
-    nodes = {}
-    ways = []
-    for e in data["elements"]:
-        if e["type"] == "node":
-            nodes[e["id"]] = (e["lat"], e["lon"])
-        elif e["type"] == "way":
-            ways.append(e)
-    if not ways:
+def load_cached_coastline(slug):
+    return load_cached_osm(slug, "coastline").coastlines()
+
+
+def load_cached_park_way(slug):
+    """キャッシュ済みの公園から1つ選ぶ（URL付きwayを優先）。(way ID, ノード座標列)"""
+    parks = load_cached_osm(slug, "park")
+    if not len(parks):
         return None
-    # URL付きwayを優先
-    best = None
-    for w in ways:
-        tags = w.get("tags", {})
+    best = 0
+    for i, tags in enumerate(parks.way_tags):
         if tags.get("url") or tags.get("website"):
-            best = w
+            best = i
             break
-    if not best:
-        best = ways[0]
-    return [nodes[nid] for nid in best.get("nodes", []) if nid in nodes]
+    return int(parks.way_ids[best]), parks.coord_list(best)
 
 
-# --- 分類 ---
-def point_near_polygon(lat, lon, polygon, threshold_m=30):
-    """点がポリゴン辺からthreshold_m以内か"""
-    n = len(polygon)
-    # Ray casting
-    inside = False
-    j = n - 1
-    for i in range(n):
-        yi, xi = polygon[i]
-        yj, xj = polygon[j]
-        if ((yi > lon) != (yj > lon)) and (lat < (xj - xi) * (lon - yi) / (yj - yi) + xi):
-            inside = not inside
-        j = i
-    if inside:
-        return True
-    for i in range(len(polygon) - 1):
-        lat1, lon1 = polygon[i]
-        lat2, lon2 = polygon[i + 1]
-        dx = (lon2 - lon1) * math.cos(math.radians(lat1))
-        dy = lat2 - lat1
-        line_len_sq = dx * dx + dy * dy
-        if line_len_sq < 1e-12:
-            d = haversine(lat, lon, lat1, lon1)
-        else:
-            px = (lon - lon1) * math.cos(math.radians(lat1))
-            py = lat - lat1
-            t = max(0, min(1, (px * dx + py * dy) / line_len_sq))
-            proj_lon = lon1 + t * (lon2 - lon1)
-            proj_lat = lat1 + t * (lat2 - lat1)
-            d = haversine(lat, lon, proj_lat, proj_lon)
-        if d < threshold_m:
-            return True
-    return False
+def load_cached_park(slug):
+    park = load_cached_park_way(slug)
+    return park[1] if park else None
 
 
+# --- 分類 ---
 def classify_coastline(coords, park_polygon):
-    """海岸線を釣り場/テトラ/外に分類"""
-    segments = []
-    for i in range(len(coords) - 1):
-        lat1, lon1 = coords[i]
-        lat2, lon2 = coords[i + 1]
-        dist = haversine(lat1, lon1, lat2, lon2)
-        mid_lat = (lat1 + lat2) / 2
-        mid_lon = (lon1 + lon2) / 2
-        in_park = point_near_polygon(mid_lat, mid_lon, park_polygon, 30) if park_polygon else False
-        segments.append({
-            "start": coords[i], "end": coords[i + 1],
-            "dist": dist, "type": "platform" if in_park else "outside"
-        })
-    # テトラ帯検出
-    for i in range(len(segments)):
-        if segments[i]["type"] != "platform":
-            continue
-        if segments[i]["dist"] < 30:
-            short_count = sum(1 for j in range(max(0, i - 3), min(len(segments), i + 4))
-                              if segments[j]["dist"] < 50)
-            if short_count >= 3:
-                segments[i]["type"] = "tetrapod"
-    return segments
+    """海岸線を釣り場/テトラ/外に分類（coastline_segments.classify_array の従来形式ラッパー）"""
+    return to_segment_dicts(classify_array([coords], park_polygon))
+
+
+def load_classified_coastline(slug, coastlines, park_polygon, park_id=None):
+    """
+    海岸線セグメントの分類（従来形式の dict のリスト）。
+    公園があり osm_cache に取得範囲が記録されていれば、その公園（park_id）に対する分類を
+    分類ストア（coastline_store）から引く。
+    """
+    if park_polygon and park_id is not None:
+        with OverpassCache(offline=True) as cache:
+            bbox = cache.alias_bbox(f"{slug}_coastline")
+            if bbox:
+                with ClassifiedCoastline(osm=cache) as store:
+                    try:
+                        return to_segment_dicts(store.query(park_id, bbox))
+                    except KeyError:
+                        pass
+    return to_segment_dicts(classify_array(coastlines, park_polygon))
 
 
 def detect_coastline_from_image(img, hint_pts, scan_step=2):
@@ -365,50 +347,48 @@ def generate_combined_map(slug):
     with open(meta_path, "r") as f:
         meta = json.load(f)
 
-    zoom = meta["zoom"]
-    grid_size = meta["gridSize"]
-    half = grid_size // 2
-    tx_min = meta["tileCenter"]["x"] - half
-    ty_min = meta["tileCenter"]["y"] - half
+    transform = MosaicTransform.from_meta(meta)
 
     # --- 1. 航空写真を公園エリアにクロップ ---
     print("1. 航空写真クロップ...")
-    img_full = Image.open(str(SATELLITE_DIR / f"{slug}.jpg")).convert("RGB")
-
-    park_polygon = load_cached_park(slug)
-    coastlines = load_cached_coastline(slug)
+    # 全体はデコードせず、サイズだけ取得してクロップ範囲を決める
+    full_w, full_h = aerial_size(slug, SATELLITE_DIR)
+
+    park = load_cached_park_way(slug)
+    park_id, park_polygon = park if park else (None, None)
+    # wayを連結して簡略化（公園まわりの頂点は固定なので分類・護岸ラインは変わらない）
+    coastlines = simplify_coastlines(load_cached_coastline(slug), park_polygon=park_polygon or None)
+    # 分類は1回だけ（護岸ラインと海岸線描画で共用）
+    coast_segments = load_classified_coastline(slug, coastlines, park_polygon, park_id)
     zones = structure.get("zones", [])
 
     if park_polygon:
-        park_pixels = [latlng_to_pixel(lat, lon, zoom, tx_min, ty_min) for lat, lon in park_polygon]
-        min_px = min(p[0] for p in park_pixels)
-        max_px = max(p[0] for p in park_pixels)
-        min_py = min(p[1] for p in park_pixels)
-        max_py = max(p[1] for p in park_pixels)
+        park_pixels = transform.coords_to_pixels(park_polygon)
+        min_px, min_py = (int(v) for v in park_pixels.min(axis=0))
+        max_px, max_py = (int(v) for v in park_pixels.max(axis=0))
         # パディング（釣り範囲: 護岸+沖150m程度 = 約600px@0.25m/px）
         pad_land = 100
         pad_sea = 350  # 沖150m ≒ 350px（投げ釣り射程圏内）
         pad_lr = 60
         crop_left = max(0, min_px - pad_lr)
         crop_top = max(0, min_py - pad_land)
-        crop_right = min(img_full.width, max_px + pad_lr)
-        crop_bottom = min(img_full.height, max_py + pad_sea)
+        crop_right = min(full_w, max_px + pad_lr)
+        crop_bottom = min(full_h, max_py + pad_sea)
     else:
-        w_px = latlng_to_pixel(west_ep["lat"], west_ep["lng"], zoom, tx_min, ty_min)
-        e_px = latlng_to_pixel(east_ep["lat"], east_ep["lng"], zoom, tx_min, ty_min)
+        w_px = transform.to_pixel(west_ep["lat"], west_ep["lng"])
+        e_px = transform.to_pixel(east_ep["lat"], east_ep["lng"])
         crop_left = max(0, min(w_px[0], e_px[0]) - 100)
         crop_top = max(0, min(w_px[1], e_px[1]) - 80)
-        crop_right = min(img_full.width, max(w_px[0], e_px[0]) + 100)
-        crop_bottom = min(img_full.height, max(w_px[1], e_px[1]) + 600)
+        crop_right = min(full_w, max(w_px[0], e_px[0]) + 100)
+        crop_bottom = min(full_h, max(w_px[1], e_px[1]) + 600)
 
-    img = img_full.crop((crop_left, crop_top, crop_right, crop_bottom))
+    img = load_aerial(slug, (crop_left, crop_top, crop_right, crop_bottom), SATELLITE_DIR)
     w, h = img.size
     print(f"   クロップ: {w}x{h}px")
 
-    # ピクセル座標のオフセット関数
-    def to_px(lat, lng):
-        px, py = latlng_to_pixel(lat, lng, zoom, tx_min, ty_min)
-        return px - crop_left, py - crop_top
+    # クロップ画像上のピクセル座標
+    view = transform.cropped(crop_left, crop_top, w, h)
+    to_px = view.to_pixel
 
     # フォント
     try:
@@ -428,22 +408,22 @@ def generate_combined_map(slug):
     # GEBCO水深を取得（近沖の代表点）
     mid_lat = (west_ep["lat"] + east_ep["lat"]) / 2
     mid_lng = (west_ep["lng"] + east_ep["lng"]) / 2
-    depth_near = fetch_gebco_depth(mid_lat - 0.001, mid_lng)   # 護岸直下
-    depth_far = fetch_gebco_depth(mid_lat - 0.003, mid_lng)    # 沖300m
-    depth_west = fetch_gebco_depth(west_ep["lat"] - 0.001, west_ep["lng"])
-    depth_east = fetch_gebco_depth(east_ep["lat"] - 0.001, east_ep["lng"])
+    depth_near, depth_far, depth_west, depth_east = fetch_gebco_depths([
+        (mid_lat - 0.001, mid_lng),                    # 護岸直下
+        (mid_lat - 0.003, mid_lng),                    # 沖300m
+        (west_ep["lat"] - 0.001, west_ep["lng"]),
+        (east_ep["lat"] - 0.001, east_ep["lng"]),
+    ])
     print(f"   GEBCO: 近={depth_near}m, 沖={depth_far}m, 西={depth_west}m, 東={depth_east}m")
 
     # 護岸ラインのピクセル座標を求める（OSM海岸線の実形状を使用）
     coast_pts = []
     if coastlines and park_polygon:
         # OSM海岸線から公園内セグメントの頂点を集める
-        for coords in coastlines:
-            segments = classify_coastline(coords, park_polygon)
-            for seg in segments:
-                if seg["type"] in ("platform", "tetrapod"):
-                    coast_pts.append(to_px(*seg["start"]))
-                    coast_pts.append(to_px(*seg["end"]))
+        for seg in coast_segments:
+            if seg["type"] in ("platform", "tetrapod"):
+                coast_pts.append(to_px(*seg["start"]))
+                coast_pts.append(to_px(*seg["end"]))
         # X座標順にソート（重複は保持して精度を維持）
         coast_pts = sorted(coast_pts, key=lambda p: p[0])
     if len(coast_pts) < 3:
@@ -689,17 +669,16 @@ def generate_combined_map(slug):
     img_rgba = Image.alpha_composite(img_rgba, struct_overlay)
 
     # テトラ座標を緯度経度に変換してJSONに保存
-    def from_px(px_x, py):
-        return pixel_to_latlng(px_x + crop_left, py + crop_top, zoom, tx_min, ty_min)
-
     tetrapod_geo = []
-    for tx, ty, brt in tetrapod_markers:
-        lat, lng = from_px(tx, ty)
-        tetrapod_geo.append({
-            "lat": round(lat, 6),
-            "lng": round(lng, 6),
-            "brightness": round(brt, 1),
-        })
+    if tetrapod_markers:
+        marker_px, marker_py, _ = zip(*tetrapod_markers)
+        marker_lat, marker_lng = view.to_latlng_array(marker_px, marker_py)
+        for lat, lng, (_, _, brt) in zip(marker_lat, marker_lng, tetrapod_markers):
+            tetrapod_geo.append({
+                "lat": round(float(lat), 6),
+                "lng": round(float(lng), 6),
+                "brightness": round(brt, 1),
+            })
 
     # 構造JSONにdetectedTetrapodsを追加
     structure["detectedTetrapods"] = tetrapod_geo
@@ -714,21 +693,19 @@ def generate_combined_map(slug):
     platform_m = 0
     tetrapod_m = 0
 
-    for coords in coastlines:
-        segments = classify_coastline(coords, park_polygon)
-        for seg in segments:
-            if seg["type"] not in ("platform", "tetrapod"):
-                continue
-            px1, py1 = to_px(*seg["start"])
-            px2, py2 = to_px(*seg["end"])
-            if seg["type"] == "platform":
-                draw.line([(px1, py1), (px2, py2)], fill=(255, 255, 255), width=10)
-                draw.line([(px1, py1), (px2, py2)], fill=(0, 230, 80), width=7)
-                platform_m += seg["dist"]
-            else:
-                draw.line([(px1, py1), (px2, py2)], fill=(255, 255, 255), width=8)
-                draw.line([(px1, py1), (px2, py2)], fill=(255, 60, 40), width=5)
-                tetrapod_m += seg["dist"]
+    for seg in coast_segments:
+        if seg["type"] not in ("platform", "tetrapod"):
+            continue
+        px1, py1 = to_px(*seg["start"])
+        px2, py2 = to_px(*seg["end"])
+        if seg["type"] == "platform":
+            draw.line([(px1, py1), (px2, py2)], fill=(255, 255, 255), width=10)
+            draw.line([(px1, py1), (px2, py2)], fill=(0, 230, 80), width=7)
+            platform_m += seg["dist"]
+        else:
+            draw.line([(px1, py1), (px2, py2)], fill=(255, 255, 255), width=8)
+            draw.line([(px1, py1), (px2, py2)], fill=(255, 60, 40), width=5)
+            tetrapod_m += seg["dist"]
 
     # --- 5. 水深表示（直感的: 少数の代表ラベル + カラーバー）---
     print("5. 水深ラベル配置...")
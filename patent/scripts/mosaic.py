@@ -0,0 +1,629 @@
+#!/usr/bin/env python3
+"""
+mosaic.py
+
+航空写真モザイクのタイル分割フォーマット（{slug}.mosaic）。
+
+1枚の巨大JPEG（18x18グリッドで4608x4608px）にすると、クロップしか使わない
+処理でも全体をデコードすることになる。.mosaic は取得したタイルのJPEGを
+再エンコードせずにそのまま連結し、末尾に索引を置いた単一ファイル:
+
+    [MAGIC][タイル0のJPEG][タイル1のJPEG]...[ヘッダJSON][JSON位置 u64][JSON長 u32][MAGIC]
+
+ヘッダJSONに zoom / 左上タイル座標 / 列数・行数 / 各タイルの (offset, length)
+（行優先、length=0 は欠損タイル）を持つ。読み出し側は指定範囲に掛かる
+タイルだけをデコードする。
+
+書き込み時はJPEGのマーカー部だけを走査し（エントロピー符号部はデコードしない）、
+タイルサイズ通りのJPEGはそのまま格納する。サイズ違い（@2x等）やPNGなど
+揃っていないタイルだけをデコードしてタイルサイズのJPEGに正規化する。
+
+ピラミッド: z18 の {slug}.mosaic から1段ずつ1/2に縮小した {slug}.z17.mosaic,
+{slug}.z16.mosaic を作る（build_pyramid）。下位レベルのタイルは上位4タイルを
+JPEGのDCTスケーリング（draft）で1/2デコードして並べるだけなので、縮小のために
+全体をフル解像度でデコードし直すことはない。各レベルの変換は meta.json の
+"levels" に記録され、利用側は select_level で必要十分な最小レベルを選ぶ。
+
+使用方法:
+    python mosaic.py export <slug> [--zoom Z] [--scale N]  # satellite/{slug}.mosaic → {slug}.jpg
+    python mosaic.py thumb <slug> [--scale 8]   # 縮小デコードでサムネイル {slug}_thumb.jpg
+    python mosaic.py info <slug>
+    python mosaic.py pyramid <slug> [levels]    # 既存モザイクから下位レベルを作成
+"""
+
+import sys
+import json
+import struct
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+from projection import MosaicTransform, latlng_to_tile_float
+
+
+SATELLITE_DIR = Path(__file__).parent / "satellite"
+
+MOSAIC_MAGIC = b"TSMOSAIC"
+_TRAILER = struct.Struct("<QI")
+TILE_SIZE = 256
+NORMALIZE_QUALITY = 95
+# 既定のピラミッド段数（z18 → z17, z16）
+PYRAMID_LEVELS = 2
+# 取得しなかったセル（海岸線から遠いタイル等）を埋める中立色
+PLACEHOLDER_COLOR = (128, 128, 128)
+
+# JPEGのフレーム開始マーカー（SOF0-3: ベースライン/拡張/プログレッシブ/可逆）
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3}
+
+
+def jpeg_frame(data: bytes) -> dict | None:
+    """
+    JPEGのマーカー列だけを走査してフレーム情報を返す（JPEGでなければNone）。
+
+    {"sof": 0xC0, "width": 256, "height": 256, "components": 3}
+    """
+    if not data.startswith(b"\xff\xd8"):
+        return None
+    pos = 2
+    n = len(data)
+    while pos + 4 <= n:
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        if marker in _SOF_MARKERS:
+            if pos + 10 > n:
+                return None
+            height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+            return {
+                "sof": marker,
+                "width": width,
+                "height": height,
+                "components": data[pos + 9],
+            }
+        if marker == 0xDA:
+            return None
+        pos += 2 + length
+    return None
+
+
+def is_aligned_tile(data: bytes, tile_size: int = TILE_SIZE) -> bool:
+    """そのまま格納できるタイルか（tile_size角のRGB/グレーのJPEG）"""
+    frame = jpeg_frame(data)
+    return (
+        frame is not None
+        and frame["width"] == tile_size
+        and frame["height"] == tile_size
+        and frame["components"] in (1, 3)
+    )
+
+
+def decode_scaled(data: bytes | str | Path, size: int | tuple[int, int] | None = None,
+                  scale: int = 1) -> Image.Image:
+    """
+    JPEGを縮小デコードしてRGBで返す。
+
+    size（目標サイズ）または scale（2/4/8）を指定すると、デコーダのdraftモード
+    （DCTスケーリング）で1/2・1/4・1/8のままデコードするので、フル解像度で
+    デコードしてから縮小するより数倍速い。端数が出た場合だけ BOX で合わせる。
+    """
+    img = Image.open(BytesIO(data) if isinstance(data, bytes) else data)
+    if size is None:
+        size = (-(-img.width // scale), -(-img.height // scale))
+    elif isinstance(size, int):
+        size = (size, size)
+    if size != img.size:
+        img.draft("RGB", size)
+    img = img.convert("RGB")
+    if img.size != size:
+        img = img.resize(size, Image.BOX)
+    return img
+
+
+def normalize_tile(data: bytes, tile_size: int = TILE_SIZE) -> bytes:
+    """揃っていないタイルをデコードし、tile_size角のRGB JPEGに作り直す"""
+    img = Image.open(BytesIO(data)).convert("RGB")
+    if img.size != (tile_size, tile_size):
+        img = img.resize((tile_size, tile_size), Image.LANCZOS)
+    out = BytesIO()
+    img.save(out, "JPEG", quality=NORMALIZE_QUALITY)
+    return out.getvalue()
+
+
+class MosaicWriter:
+    """タイルを1枚ずつ追記する（メモリには1タイル分しか載らない）"""
+
+    def __init__(
+        self,
+        path: str | Path,
+        zoom: int,
+        x_min: int,
+        y_min: int,
+        cols: int,
+        rows: int,
+        tile_size: int = TILE_SIZE,
+    ):
+        self.path = Path(path)
+        self.header = {
+            "version": 1,
+            "format": "jpeg",
+            "zoom": zoom,
+            "tileMin": {"x": x_min, "y": y_min},
+            "cols": cols,
+            "rows": rows,
+            "tileSize": tile_size,
+        }
+        self._index = [[0, 0] for _ in range(cols * rows)]
+        self._tmp = self.path.with_suffix(".mosaic.tmp")
+        self._f = open(self._tmp, "wb")
+        self._f.write(MOSAIC_MAGIC)
+        self.count = 0
+        self.normalized = 0
+        self.placeholders = 0
+        self._placeholder = None
+
+    def write_tile(self, tx: int, ty: int, data: bytes) -> bytes:
+        """
+        タイル座標 (tx, ty) のタイルを追記し、実際に格納したバイト列を返す。
+
+        揃ったJPEGはデコードせずにそのまま格納し、それ以外だけ正規化する。
+        """
+        col = tx - self.header["tileMin"]["x"]
+        row = ty - self.header["tileMin"]["y"]
+        if not (0 <= col < self.header["cols"] and 0 <= row < self.header["rows"]):
+            raise ValueError(f"グリッド外のタイル: x={tx} y={ty}")
+        if not is_aligned_tile(data, self.header["tileSize"]):
+            data = normalize_tile(data, self.header["tileSize"])
+            self.normalized += 1
+        offset = self._f.tell()
+        self._f.write(data)
+        self._index[row * self.header["cols"] + col] = [offset, len(data)]
+        self.count += 1
+        return data
+
+    def write_placeholder(self, tx: int, ty: int):
+        """
+        取得しなかったセルを中立色のタイルで埋める。
+        本体は最初の1回だけ書き、以降のセルは同じ (offset, length) を参照する。
+        """
+        col = tx - self.header["tileMin"]["x"]
+        row = ty - self.header["tileMin"]["y"]
+        if not (0 <= col < self.header["cols"] and 0 <= row < self.header["rows"]):
+            raise ValueError(f"グリッド外のタイル: x={tx} y={ty}")
+        if self._placeholder is None:
+            ts = self.header["tileSize"]
+            buf = BytesIO()
+            Image.new("RGB", (ts, ts), PLACEHOLDER_COLOR).save(buf, "JPEG", quality=NORMALIZE_QUALITY)
+            self._placeholder = [self._f.tell(), len(buf.getvalue())]
+            self._f.write(buf.getvalue())
+        self._index[row * self.header["cols"] + col] = list(self._placeholder)
+        self.placeholders += 1
+
+    def close(self):
+        header = dict(self.header, index=self._index, normalized=self.normalized)
+        if self._placeholder is not None:
+            header["placeholder"] = self._placeholder
+        blob = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        offset = self._f.tell()
+        self._f.write(blob)
+        self._f.write(_TRAILER.pack(offset, len(blob)))
+        self._f.write(MOSAIC_MAGIC)
+        self._f.close()
+        self._tmp.replace(self.path)
+
+    def abort(self):
+        self._f.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+class TiledMosaic:
+    """.mosaic の読み出し（範囲指定で必要なタイルだけデコード）"""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._f = open(self.path, "rb")
+        self._f.seek(-(_TRAILER.size + len(MOSAIC_MAGIC)), 2)
+        tail = self._f.read()
+        if tail[-len(MOSAIC_MAGIC):] != MOSAIC_MAGIC:
+            raise ValueError(f"モザイク形式ではありません: {self.path}")
+        offset, length = _TRAILER.unpack(tail[:_TRAILER.size])
+        self._f.seek(offset)
+        header = json.loads(self._f.read(length))
+
+        self.zoom = header["zoom"]
+        self.tile_x_min = header["tileMin"]["x"]
+        self.tile_y_min = header["tileMin"]["y"]
+        self.cols = header["cols"]
+        self.rows = header["rows"]
+        self.tile_size = header["tileSize"]
+        self._index = header["index"]
+        self.normalized = header.get("normalized", 0)
+        self._placeholder = header.get("placeholder")
+
+    @property
+    def width(self) -> int:
+        return self.cols * self.tile_size
+
+    @property
+    def height(self) -> int:
+        return self.rows * self.tile_size
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.width, self.height
+
+    def tile_bytes(self, col: int, row: int) -> bytes | None:
+        """グリッド内 (col, row) のJPEG生データ（欠損ならNone）"""
+        offset, length = self._index[row * self.cols + col]
+        if length == 0:
+            return None
+        self._f.seek(offset)
+        return self._f.read(length)
+
+    def is_placeholder(self, col: int, row: int) -> bool:
+        """取得せず中立色で埋めたセルか"""
+        return self._placeholder is not None and self._index[row * self.cols + col] == self._placeholder
+
+    def read_tile(self, col: int, row: int, scale: int = 1) -> Image.Image | None:
+        """タイル1枚をデコード（scale=2/4/8 ならJPEGのDCTスケーリングで縮小デコード）"""
+        data = self.tile_bytes(col, row)
+        if data is None:
+            return None
+        return decode_scaled(data, self.tile_size // scale)
+
+    def read_window(
+        self, left: int, top: int, right: int, bottom: int, scale: int = 1
+    ) -> Image.Image:
+        """
+        ピクセル範囲 [left, right) x [top, bottom) を切り出す（欠損タイルは黒）。
+        scale 指定時は 1/scale 画像として読み、範囲もその座標で指定する。
+        """
+        ts = self.tile_size // scale
+        left, top = max(0, left), max(0, top)
+        right, bottom = min(self.cols * ts, right), min(self.rows * ts, bottom)
+        out = Image.new("RGB", (max(0, right - left), max(0, bottom - top)))
+        if right <= left or bottom <= top:
+            return out
+
+        for row in range(top // ts, (bottom - 1) // ts + 1):
+            for col in range(left // ts, (right - 1) // ts + 1):
+                tile = self.read_tile(col, row, scale)
+                if tile is not None:
+                    out.paste(tile, (col * ts - left, row * ts - top))
+        return out
+
+    @property
+    def transform(self) -> MosaicTransform:
+        return MosaicTransform(
+            self.zoom, self.tile_x_min, self.tile_y_min, self.width, self.height
+        )
+
+    def latlng_to_pixel(self, lat: float, lng: float) -> tuple[int, int]:
+        tx, ty = latlng_to_tile_float(lat, lng, self.zoom)
+        return (
+            int((tx - self.tile_x_min) * self.tile_size),
+            int((ty - self.tile_y_min) * self.tile_size),
+        )
+
+    def read_latlng_window(
+        self, south: float, west: float, north: float, east: float
+    ) -> tuple[Image.Image, tuple[int, int]]:
+        """緯度経度範囲を切り出し、(画像, 左上のモザイク上ピクセル座標) を返す"""
+        left, top = self.latlng_to_pixel(north, west)
+        right, bottom = self.latlng_to_pixel(south, east)
+        left, top = max(0, left), max(0, top)
+        return self.read_window(left, top, right + 1, bottom + 1), (left, top)
+
+    def read_full(self, scale: int = 1) -> Image.Image:
+        return self.read_window(0, 0, self.width // scale, self.height // scale, scale)
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def mosaic_path(
+    slug: str, satellite_dir: str | Path = SATELLITE_DIR, zoom: int | None = None
+) -> Path:
+    """基準モザイク（zoom=None）またはピラミッドの下位レベルのパス"""
+    if zoom is None:
+        return Path(satellite_dir) / f"{slug}.mosaic"
+    return Path(satellite_dir) / f"{slug}.z{zoom}.mosaic"
+
+
+def level_path(base_path: str | Path, zoom: int) -> Path:
+    base_path = Path(base_path)
+    return base_path.with_name(f"{base_path.stem}.z{zoom}.mosaic")
+
+
+def _downsample_tile(src: TiledMosaic, tx: int, ty: int) -> bytes | None:
+    """
+    1段下のズームのタイル (tx, ty) を上位の4タイルから作る。
+    子が全て欠損ならNone、全て中立色のセルなら b"" （下位でも中立色のセルにする）。
+    """
+    ts = src.tile_size
+    half = ts // 2
+    children = [
+        (dx, dy, 2 * tx + dx - src.tile_x_min, 2 * ty + dy - src.tile_y_min)
+        for dy in range(2)
+        for dx in range(2)
+    ]
+    children = [c for c in children if 0 <= c[2] < src.cols and 0 <= c[3] < src.rows]
+    if children and all(src.is_placeholder(col, row) for _, _, col, row in children):
+        return b""
+    out = None
+    for dx, dy, col, row in children:
+        data = src.tile_bytes(col, row)
+        if data is None:
+            continue
+        # DCTスケーリングで1/2サイズを直接デコード
+        child = decode_scaled(data, half)
+        if out is None:
+            out = Image.new("RGB", (ts, ts))
+        out.paste(child, (dx * half, dy * half))
+    if out is None:
+        return None
+    buf = BytesIO()
+    out.save(buf, "JPEG", quality=NORMALIZE_QUALITY)
+    return buf.getvalue()
+
+
+def level_entry(
+    m: TiledMosaic, resolution_m: float, valid: tuple[int, int, int, int]
+) -> dict:
+    """meta.json の "levels" 1件分"""
+    left, top, right, bottom = valid
+    return {
+        "zoom": m.zoom,
+        "tileMin": {"x": m.tile_x_min, "y": m.tile_y_min},
+        "cols": m.cols,
+        "rows": m.rows,
+        "resolution_m": resolution_m,
+        "imageSize": {"width": m.width, "height": m.height},
+        # 基準モザイクの範囲に当たる部分（外側は縮小時のタイル境界合わせの余白）
+        "valid": {"left": left, "top": top, "right": right, "bottom": bottom},
+        "mosaic": m.path.name,
+    }
+
+
+def build_pyramid(
+    base_path: str | Path, levels: int = PYRAMID_LEVELS, resolution_m: float = 0.25
+) -> list[dict]:
+    """
+    基準モザイクから下位ズームのモザイクを levels 段作り、各レベルの情報を返す
+    （先頭は基準レベル）。各段は直前の段から作る。
+    """
+    src = TiledMosaic(base_path)
+    valid = (0, 0, src.width, src.height)
+    entries = [level_entry(src, resolution_m, valid)]
+    try:
+        for _ in range(levels):
+            ts = src.tile_size
+            zoom = src.zoom - 1
+            x_min, y_min = src.tile_x_min // 2, src.tile_y_min // 2
+            cols = (src.tile_x_min + src.cols - 1) // 2 - x_min + 1
+            rows = (src.tile_y_min + src.rows - 1) // 2 - y_min + 1
+            path = level_path(base_path, zoom)
+            writer = MosaicWriter(path, zoom, x_min, y_min, cols, rows, ts)
+            try:
+                for ty in range(y_min, y_min + rows):
+                    for tx in range(x_min, x_min + cols):
+                        data = _downsample_tile(src, tx, ty)
+                        if data == b"":
+                            writer.write_placeholder(tx, ty)
+                        elif data is not None:
+                            writer.write_tile(tx, ty, data)
+            except BaseException:
+                writer.abort()
+                raise
+            writer.close()
+
+            # 上位グリッドの左上は下位グリッド内で (奇数タイル分) ずれる
+            ox = (src.tile_x_min - 2 * x_min) * ts
+            oy = (src.tile_y_min - 2 * y_min) * ts
+            valid = (
+                (valid[0] + ox) // 2,
+                (valid[1] + oy) // 2,
+                (valid[2] + ox + 1) // 2,
+                (valid[3] + oy + 1) // 2,
+            )
+            resolution_m *= 2
+            src.close()
+            src = TiledMosaic(path)
+            entries.append(level_entry(src, resolution_m, valid))
+    finally:
+        src.close()
+    return entries
+
+
+def select_level(
+    meta: dict, max_resolution_m: float | None = None, min_size: int | None = None
+) -> dict:
+    """
+    meta.json の "levels" から条件を満たす最小（最も安い）レベルを返す。
+
+    max_resolution_m: 1pxあたりの地上距離の上限
+    min_size: 有効範囲の短辺に必要なピクセル数
+    どのレベルも満たさなければ基準レベル。levels のない旧メタデータは基準のみ。
+    """
+    size = meta["imageSize"]
+    levels = meta.get("levels") or [{
+        "zoom": meta["zoom"],
+        "resolution_m": meta.get("resolution_m", 0.25),
+        "imageSize": size,
+        "valid": {"left": 0, "top": 0, "right": size["width"], "bottom": size["height"]},
+        "mosaic": meta.get("mosaic"),
+    }]
+    for level in sorted(levels, key=lambda lv: lv["zoom"]):
+        v = level["valid"]
+        if max_resolution_m is not None and level["resolution_m"] > max_resolution_m:
+            continue
+        if min_size is not None and min(v["right"] - v["left"], v["bottom"] - v["top"]) < min_size:
+            continue
+        return level
+    return max(levels, key=lambda lv: lv["zoom"])
+
+
+def content_box(meta: dict, level: dict | None = None) -> tuple[int, int, int, int]:
+    """
+    実データのある範囲 (left, top, right, bottom)。
+
+    meta.json の "coverage"（海岸線帯だけ取得した場合）があればその外接矩形、
+    なければ画像全体。level（select_level の戻り値）指定時はそのレベルの座標。
+    """
+    size = meta["imageSize"]
+    box = meta.get("coverage", {}).get("bbox") or {
+        "left": 0, "top": 0, "right": size["width"], "bottom": size["height"],
+    }
+    if level is None or level["zoom"] == meta["zoom"]:
+        return box["left"], box["top"], box["right"], box["bottom"]
+    scale = 2 ** (meta["zoom"] - level["zoom"])
+    v = level["valid"]
+    return (
+        v["left"] + box["left"] // scale,
+        v["top"] + box["top"] // scale,
+        v["left"] + -(-box["right"] // scale),
+        v["top"] + -(-box["bottom"] // scale),
+    )
+
+
+def has_aerial(slug: str, satellite_dir: str | Path = SATELLITE_DIR) -> bool:
+    """航空写真（.mosaic または従来の .jpg）があるか"""
+    return (
+        mosaic_path(slug, satellite_dir).exists()
+        or (Path(satellite_dir) / f"{slug}.jpg").exists()
+    )
+
+
+def aerial_size(slug: str, satellite_dir: str | Path = SATELLITE_DIR) -> tuple[int, int]:
+    """航空写真全体のピクセルサイズ（デコードせずに取得）"""
+    path = mosaic_path(slug, satellite_dir)
+    if path.exists():
+        with TiledMosaic(path) as m:
+            return m.size
+    with Image.open(Path(satellite_dir) / f"{slug}.jpg") as img:
+        return img.size
+
+
+def load_aerial(
+    slug: str,
+    box: tuple[int, int, int, int] | None = None,
+    satellite_dir: str | Path = SATELLITE_DIR,
+    zoom: int | None = None,
+    scale: int = 1,
+) -> Image.Image:
+    """
+    航空写真を読み込む。box=(left, top, right, bottom) 指定時はその範囲のみ。
+
+    .mosaic があれば掛かるタイルだけをデコードし、なければ従来の {slug}.jpg を使う。
+    zoom 指定時はそのズームのピラミッドレベル（box もそのレベルのピクセル座標）。
+    scale=2/4/8 なら縮小デコード（box は縮小後の座標）。
+    """
+    path = mosaic_path(slug, satellite_dir)
+    if zoom is not None and mosaic_path(slug, satellite_dir, zoom).exists():
+        path = mosaic_path(slug, satellite_dir, zoom)
+    if path.exists():
+        with TiledMosaic(path) as m:
+            if zoom is not None and m.zoom != zoom:
+                raise FileNotFoundError(f"z{zoom} のレベルがありません: {slug}")
+            return m.read_window(*box, scale) if box else m.read_full(scale)
+    if zoom is not None:
+        raise FileNotFoundError(f"z{zoom} のレベルがありません: {slug}")
+    img = decode_scaled(Path(satellite_dir) / f"{slug}.jpg", scale=scale)
+    return img.crop(box) if box else img
+
+
+def load_aerial_scaled(
+    slug: str,
+    scale: int,
+    box: tuple[int, int, int, int] | None = None,
+    satellite_dir: str | Path = SATELLITE_DIR,
+) -> tuple[Image.Image, MosaicTransform]:
+    """
+    1/scale で航空写真を読み込み、(画像, その画像用の座標変換) を返す。
+    プレビュー・サムネイル・粗い一次処理向け（box は縮小後の座標）。
+    """
+    with open(Path(satellite_dir) / f"{slug}.meta.json", "r", encoding="utf-8") as f:
+        transform = MosaicTransform.from_meta(json.load(f)).scaled(scale)
+    img = load_aerial(slug, box, satellite_dir, scale=scale)
+    if box:
+        transform = transform.cropped(box[0], box[1], *img.size)
+    return img, transform
+
+
+def main():
+    args = sys.argv[1:]
+    zoom = None
+    if "--zoom" in args:
+        i = args.index("--zoom")
+        zoom = int(args[i + 1])
+        del args[i:i + 2]
+    scale = None
+    if "--scale" in args:
+        i = args.index("--scale")
+        scale = int(args[i + 1])
+        del args[i:i + 2]
+
+    if len(args) == 2 and args[0] == "export":
+        slug = args[1]
+        img = load_aerial(slug, zoom=zoom, scale=scale or 1)
+        output_path = SATELLITE_DIR / (f"{slug}.z{zoom}.jpg" if zoom else f"{slug}.jpg")
+        img.save(output_path, "JPEG", quality=95)
+        print(f"出力: {output_path} ({img.size[0]}x{img.size[1]}px)")
+    elif len(args) == 2 and args[0] == "thumb":
+        slug = args[1]
+        img = load_aerial(slug, scale=scale or 8)
+        output_path = SATELLITE_DIR / f"{slug}_thumb.jpg"
+        img.save(output_path, "JPEG", quality=85)
+        print(f"出力: {output_path} ({img.size[0]}x{img.size[1]}px)")
+    elif len(args) == 2 and args[0] == "info":
+        with TiledMosaic(mosaic_path(args[1])) as m:
+            present = sum(1 for _, length in m._index if length)
+            print(f"zoom={m.zoom} tileMin=({m.tile_x_min}, {m.tile_y_min})")
+            print(f"グリッド: {m.cols}x{m.rows} ({present}/{m.cols * m.rows}タイル)")
+            print(f"画像サイズ: {m.width}x{m.height}px")
+            print(f"正規化タイル: {m.normalized}（他は取得したJPEGを無変換で格納）")
+            skipped = sum(
+                1 for row in range(m.rows) for col in range(m.cols) if m.is_placeholder(col, row)
+            )
+            if skipped:
+                print(f"未取得（中立色）: {skipped}セル")
+        for path in sorted(SATELLITE_DIR.glob(f"{args[1]}.z*.mosaic")):
+            with TiledMosaic(path) as m:
+                print(f"  レベル z={m.zoom}: {m.width}x{m.height}px ({path.name})")
+    elif len(args) in (2, 3) and args[0] == "pyramid":
+        slug = args[1]
+        levels = int(args[2]) if len(args) == 3 else PYRAMID_LEVELS
+        meta_path = SATELLITE_DIR / f"{slug}.meta.json"
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        meta["levels"] = build_pyramid(
+            mosaic_path(slug), levels, meta.get("resolution_m", 0.25)
+        )
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        for level in meta["levels"]:
+            size = level["imageSize"]
+            print(f"  z={level['zoom']}: {size['width']}x{size['height']}px ({level['mosaic']})")
+    else:
+        print("使用方法:")
+        print("  python mosaic.py export <slug> [--zoom Z] [--scale N]")
+        print("  python mosaic.py thumb <slug> [--scale N]")
+        print("  python mosaic.py info <slug>")
+        print("  python mosaic.py pyramid <slug> [levels]")
+
+
+if __name__ == "__main__":
+    main()
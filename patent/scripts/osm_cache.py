@@ -0,0 +1,637 @@
+#!/usr/bin/env python3
+"""
+osm_cache.py
+
+Overpass API 応答のローカルキャッシュ（bbox で引ける SQLite + R-tree）。
+
+従来は応答を丸ごと {slug}_coastline.json / {slug}_park.json に保存していたため、
+近接スポットで重なる範囲を何度も取得・保存していた。ここでは
+  - ノード・wayを1回だけ格納（way の外接矩形を R-tree に登録）
+  - 取得済み範囲をレイヤー（coastline / park）ごとに CELL_DEG 格子のセルで記録（TTL付き）
+  - 新しい bbox は、未取得・期限切れのセルだけを矩形にまとめて Overpass に問い合わせ、
+    残りは手元のジオメトリから答える
+ことで、Overpass のレート制限に当たる回数を減らす。
+
+Overpass がタイムアウト・メモリ不足で処理を打ち切った応答（HTTP 200 + remark "runtime error"）は
+格納せず、取得済みにもしない（手元の way を削除済みと誤認しないため）。
+
+bbox はすべて (south, west, north, east)。返す way は外接矩形が bbox と交わるもの
+（Overpass の bbox 検索と同じく、bbox 外のノードも含めて way 全体を返す）。
+
+使用方法:
+    python osm_cache.py stats                          # 件数・取得済みセル数
+    python osm_cache.py query <layer> <s> <w> <n> <e>  # bbox の way 数（必要なら取得）
+    python osm_cache.py expire [layer]                 # 取得済み範囲を期限切れにする
+
+多数のスポットを取り込むときは prefetch（近いスポットの bbox をクラスターにまとめ、
+クラスターごとに coastline / park を1回の union クエリで取得）を先に呼ぶと、
+県単位でも Overpass への問い合わせは数回で済む。以後のスポットごとの query は手元で答える。
+"""
+
+import re
+import sys
+import json
+import math
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.request import urlopen, Request
+
+import numpy as np
+
+from osm_stream import OverpassArrays
+
+
+DEFAULT_DB_PATH = Path(__file__).parent / "satellite" / "cache" / "osm.sqlite"
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+
+# 取得済み範囲を記録する格子（約1km）
+CELL_DEG = 0.01
+
+# レイヤーごとのOverpassクエリ（{bbox} に "south,west,north,east"）と有効期限
+LAYERS = {
+    "coastline": {
+        "query": 'way["natural"="coastline"]({bbox});',
+        "ttl_days": 90,
+    },
+    "park": {
+        "query": (
+            '('
+            'way["leisure"~"park|fishing"]["name"~"釣|つり|フィッシング|海づり"]({bbox});'
+            'way["leisure"~"park|fishing"]["url"]({bbox});'
+            ');'
+        ),
+        "ttl_days": 30,
+    },
+}
+
+MAX_RETRIES = 3
+
+# prefetch: 近いスポットの bbox をまとめて1回の union クエリにする
+CLUSTER_GAP_DEG = 0.2       # これより離れたスポットは別クラスター（約20km）
+MAX_CLUSTER_CELLS = 800     # 1クエリで取得するセル数（レイヤー合計）の上限
+BATCH_TIMEOUT_S = 180       # union クエリのサーバー側タイムアウト
+
+# LAYERS のクエリと同じ条件（エクストラクト取り込み時のタグ判定）
+PARK_LEISURE_RE = re.compile("park|fishing")
+PARK_NAME_RE = re.compile("釣|つり|フィッシング|海づり")
+
+
+def match_layers(tags: dict) -> list[str]:
+    """wayのタグが該当するレイヤー名"""
+    layers = []
+    if tags.get("natural") == "coastline":
+        layers.append("coastline")
+    if PARK_LEISURE_RE.search(tags.get("leisure", "")) and (
+        PARK_NAME_RE.search(tags.get("name", "")) or "url" in tags
+    ):
+        layers.append("park")
+    return layers
+
+
+class OverpassCache:
+    """レイヤー + bbox で引く Overpass キャッシュ（スレッドセーフ）"""
+
+    def __init__(
+        self,
+        path: str | Path = DEFAULT_DB_PATH,
+        url: str = OVERPASS_URL,
+        offline: bool = False,
+    ):
+        self.path = Path(path)
+        self.url = url
+        self.offline = offline
+        self.requests = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # 複数プロセス（analyze_coastline のバッチ等）から同時に開くので、WALで読み書きを並行させる
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS nodes (
+                id INTEGER PRIMARY KEY,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS ways (
+                rid INTEGER PRIMARY KEY,
+                id INTEGER NOT NULL,
+                layer TEXT NOT NULL,
+                tags TEXT NOT NULL,
+                nodes TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                UNIQUE (layer, id)
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS way_bounds USING rtree(
+                rid, min_lat, max_lat, min_lon, max_lon
+            );
+            CREATE TABLE IF NOT EXISTS coverage (
+                layer TEXT NOT NULL,
+                cx INTEGER NOT NULL,
+                cy INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                source TEXT NOT NULL,
+                PRIMARY KEY (layer, cx, cy)
+            );
+            CREATE TABLE IF NOT EXISTS extracts (
+                layer TEXT NOT NULL,
+                source TEXT NOT NULL,
+                south REAL NOT NULL,
+                west REAL NOT NULL,
+                north REAL NOT NULL,
+                east REAL NOT NULL,
+                ingested_at REAL NOT NULL,
+                PRIMARY KEY (layer, source)
+            );
+            CREATE TABLE IF NOT EXISTS aliases (
+                key TEXT PRIMARY KEY,
+                layer TEXT NOT NULL,
+                south REAL NOT NULL,
+                west REAL NOT NULL,
+                north REAL NOT NULL,
+                east REAL NOT NULL
+            );
+            """
+        )
+        self._db.commit()
+
+    # ------------------------------------------------------------------
+    # 取得済み範囲
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def cells(bbox: tuple[float, float, float, float]) -> list[tuple[int, int]]:
+        south, west, north, east = bbox
+        return [
+            (cx, cy)
+            for cy in range(math.floor(south / CELL_DEG), math.floor(north / CELL_DEG) + 1)
+            for cx in range(math.floor(west / CELL_DEG), math.floor(east / CELL_DEG) + 1)
+        ]
+
+    def missing_cells(self, layer: str, bbox: tuple[float, float, float, float]) -> list[tuple[int, int]]:
+        """bbox のうち未取得・期限切れのセル（取り込み済みエクストラクトの範囲内は取得済み扱い）"""
+        cells = self.cells(bbox)
+        cutoff = time.time() - LAYERS[layer]["ttl_days"] * 86400
+        xs = [c[0] for c in cells]
+        ys = [c[1] for c in cells]
+        with self._lock:
+            fresh = {
+                (cx, cy)
+                for cx, cy in self._db.execute(
+                    """
+                    SELECT cx, cy FROM coverage
+                    WHERE layer = ? AND (fetched_at >= ? OR source != 'overpass')
+                      AND cx BETWEEN ? AND ? AND cy BETWEEN ? AND ?
+                    """,
+                    (layer, cutoff, min(xs), max(xs), min(ys), max(ys)),
+                )
+            }
+            extents = self._db.execute(
+                "SELECT south, west, north, east FROM extracts WHERE layer = ?", (layer,)
+            ).fetchall()
+        return [
+            (cx, cy) for cx, cy in cells
+            if (cx, cy) not in fresh and not any(
+                s <= cy * CELL_DEG and (cy + 1) * CELL_DEG <= n and w <= cx * CELL_DEG and (cx + 1) * CELL_DEG <= e
+                for s, w, n, e in extents
+            )
+        ]
+
+    def mark_covered(self, layer: str, cells, source: str = "overpass", fetched_at: float | None = None):
+        fetched_at = fetched_at or time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO coverage (layer, cx, cy, fetched_at, source) VALUES (?, ?, ?, ?, ?)",
+                [(layer, cx, cy, fetched_at, source) for cx, cy in cells],
+            )
+            self._db.commit()
+
+    def add_extract(self, layer: str, source: str, bbox: tuple[float, float, float, float]):
+        """取り込んだOSMエクストラクトの範囲を記録（範囲内はOverpassに問い合わせない）"""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO extracts (layer, source, south, west, north, east, ingested_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (layer, source) + tuple(bbox) + (time.time(),),
+            )
+            self._db.commit()
+
+    def extracts(self) -> list[tuple]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT layer, source, south, west, north, east, ingested_at FROM extracts ORDER BY layer"
+            ).fetchall()
+
+    def expire(self, layer: str | None = None) -> int:
+        """取得済み範囲を期限切れにする（次回の問い合わせで再取得）"""
+        with self._lock:
+            if layer:
+                cur = self._db.execute(
+                    "UPDATE coverage SET fetched_at = 0 WHERE layer = ? AND source = 'overpass'", (layer,)
+                )
+            else:
+                cur = self._db.execute("UPDATE coverage SET fetched_at = 0 WHERE source = 'overpass'")
+            self._db.commit()
+            return cur.rowcount
+
+    # ------------------------------------------------------------------
+    # 格納
+    # ------------------------------------------------------------------
+
+    def store(self, layer: str, arrays: OverpassArrays, fetched_at: float | None = None) -> int:
+        """Overpass 応答（OverpassArrays）のノード・wayを格納し、格納した way 数を返す"""
+        fetched_at = fetched_at or time.time()
+        bounds = arrays.way_bounds()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO nodes (id, lat, lon) VALUES (?, ?, ?)",
+                zip(arrays.node_ids.tolist(), arrays.node_lat.tolist(), arrays.node_lon.tolist()),
+            )
+            count = 0
+            for i, way_id in enumerate(arrays.way_ids.tolist()):
+                if np.isnan(bounds[i, 0]):
+                    continue
+                row = self._db.execute(
+                    "SELECT rid FROM ways WHERE layer = ? AND id = ?", (layer, way_id)
+                ).fetchone()
+                values = (json.dumps(arrays.way_tags[i], ensure_ascii=False),
+                          json.dumps(arrays.way_refs_of(i).tolist()), fetched_at)
+                if row:
+                    rid = row[0]
+                    self._db.execute(
+                        "UPDATE ways SET tags = ?, nodes = ?, fetched_at = ? WHERE rid = ?", values + (rid,)
+                    )
+                    self._db.execute("DELETE FROM way_bounds WHERE rid = ?", (rid,))
+                else:
+                    rid = self._db.execute(
+                        "INSERT INTO ways (id, layer, tags, nodes, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                        (way_id, layer) + values,
+                    ).lastrowid
+                self._db.execute(
+                    "INSERT INTO way_bounds (rid, min_lat, max_lat, min_lon, max_lon) VALUES (?, ?, ?, ?, ?)",
+                    (rid,) + tuple(bounds[i].tolist()),
+                )
+                count += 1
+            self._db.commit()
+        return count
+
+    def _drop_stale_ways(self, layer: str, bbox: tuple[float, float, float, float], before: float):
+        """再取得した範囲に収まるのに応答に含まれなかった way（OSMで削除済み）を消す"""
+        south, west, north, east = bbox
+        with self._lock:
+            self._db.execute(
+                """
+                DELETE FROM ways WHERE rid IN (
+                    SELECT w.rid FROM ways w JOIN way_bounds b ON b.rid = w.rid
+                    WHERE w.layer = ? AND w.fetched_at < ?
+                      AND b.min_lat >= ? AND b.max_lat <= ? AND b.min_lon >= ? AND b.max_lon <= ?
+                )
+                """,
+                (layer, before, south, north, west, east),
+            )
+            self._db.execute("DELETE FROM way_bounds WHERE rid NOT IN (SELECT rid FROM ways)")
+            self._db.commit()
+
+    # ------------------------------------------------------------------
+    # 問い合わせ
+    # ------------------------------------------------------------------
+
+    def query(
+        self, layer: str, bbox: tuple[float, float, float, float], key: str | None = None
+    ) -> OverpassArrays:
+        """
+        bbox のノード・wayを返す。未取得の範囲だけ Overpass に問い合わせる。
+        key を付けると bbox を別名で記録し、cached(key) でネットワークなしに引き直せる。
+        """
+        missing = self.missing_cells(layer, bbox)
+        if missing and not self.offline:
+            for rect, cells in cells_to_rects(missing):
+                self._fetch(layer, rect, cells)
+        elif missing:
+            print(f"  オフライン: {layer} の未取得セル {len(missing)}個は空として扱います")
+        if key:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO aliases (key, layer, south, west, north, east) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, layer) + tuple(bbox),
+                )
+                self._db.commit()
+        return self.lookup(layer, bbox)
+
+    def alias_bbox(self, key: str) -> tuple[float, float, float, float] | None:
+        """別名で記録した bbox（未記録なら None）"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT south, west, north, east FROM aliases WHERE key = ?", (key,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def cached(self, key: str) -> OverpassArrays | None:
+        """別名で記録した bbox をネットワークなしで引く（未記録なら None）"""
+        with self._lock:
+            row = self._db.execute("SELECT layer FROM aliases WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return self.lookup(row[0], self.alias_bbox(key))
+
+    def lookup(self, layer: str, bbox: tuple[float, float, float, float]) -> OverpassArrays:
+        """手元のジオメトリだけで bbox に交わる way とそのノードを返す"""
+        south, west, north, east = bbox
+        with self._lock:
+            rows = self._db.execute(
+                """
+                SELECT w.id, w.tags, w.nodes FROM way_bounds b JOIN ways w ON w.rid = b.rid
+                WHERE w.layer = ? AND b.min_lat <= ? AND b.max_lat >= ? AND b.min_lon <= ? AND b.max_lon >= ?
+                ORDER BY w.id
+                """,
+                (layer, north, south, east, west),
+            ).fetchall()
+            way_refs = [json.loads(nids) for _, _, nids in rows]
+            node_ids = sorted({nid for refs in way_refs for nid in refs})
+            nodes = []
+            for i in range(0, len(node_ids), 10000):
+                chunk = node_ids[i:i + 10000]
+                nodes.extend(self._db.execute(
+                    f"SELECT id, lat, lon FROM nodes WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ))
+        node_cols = list(zip(*nodes)) or [[], [], []]
+        return OverpassArrays(
+            node_cols[0], node_cols[1], node_cols[2],
+            [wid for wid, _, _ in rows],
+            np.concatenate(([0], np.cumsum([len(refs) for refs in way_refs], dtype=np.int64))),
+            [nid for refs in way_refs for nid in refs],
+            [json.loads(tags) for _, tags, _ in rows],
+        )
+
+    def _fetch(self, layer: str, bbox: tuple[float, float, float, float], cells):
+        """Overpass から bbox（cells を覆う矩形）を取得して格納し、セルを取得済みにする"""
+        south, west, north, east = bbox
+        started = time.time()
+        body = LAYERS[layer]["query"].format(bbox=f"{south},{west},{north},{east}")
+        print(f"  Overpass取得: {layer} bbox=({south:.3f},{west:.3f},{north:.3f},{east:.3f})")
+        # 不完全な応答は overpass_request が例外にするので、ここから先は完全な応答だけ
+        # （削除済み way の掃除・取得済みの記録は完全な応答のときだけ行う）
+        self.requests += 1
+        arrays = overpass_request(f"{body}(._;>;);out body;", self.url)
+        count = self.store(layer, arrays, started)
+        self._drop_stale_ways(layer, bbox, started)
+        self.mark_covered(layer, cells, fetched_at=started)
+        print(f"    → {count} ways")
+
+    def prefetch(self, bboxes: dict[str, tuple[float, float, float, float]], layers=tuple(LAYERS)) -> int:
+        """
+        複数スポットの bbox（{key: bbox}）をまとめて取得し、問い合わせ回数を返す。
+
+        近い bbox をクラスターにまとめ、クラスター内の未取得セルを全レイヤー分
+        1回の union クエリで取得する。応答は way のタグでレイヤーに振り分けて格納し
+        （R-tree に入るので、スポットごとの切り出しは lookup の bbox 検索になる）、
+        各スポットの別名 {key}_{layer} も記録する。不完全な応答で取得できなかった範囲は
+        未取得のまま残すので、スポットごとの query が取り直す。
+        """
+        before = self.requests
+        if self.offline:
+            print("  オフライン: prefetch は行いません")
+        else:
+            missing = {
+                key: {layer: set(self.missing_cells(layer, bbox)) for layer in layers}
+                for key, bbox in bboxes.items()
+            }
+            clusters = cluster_bboxes(
+                {key: bbox for key, bbox in bboxes.items() if any(missing[key].values())}
+            )
+            for i, members in enumerate(clusters, 1):
+                cells = {
+                    layer: sorted(set().union(*(missing[key][layer] for key in members)))
+                    for layer in layers
+                }
+                print(f"  クラスター {i}/{len(clusters)}: {len(members)}スポット")
+                try:
+                    self._fetch_union({layer: cells[layer] for layer in layers if cells[layer]})
+                except (RuntimeError, OSError) as e:
+                    # 取得できなかったセルは未取得のまま（スポットごとの query で取り直す）
+                    print(f"    クラスター {i} の取得に失敗: {e}")
+
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO aliases (key, layer, south, west, north, east) VALUES (?, ?, ?, ?, ?, ?)",
+                [(f"{key}_{layer}", layer) + tuple(bbox) for key, bbox in bboxes.items() for layer in layers],
+            )
+            self._db.commit()
+        return self.requests - before
+
+    def _fetch_union(self, cells_by_layer: dict[str, list[tuple[int, int]]]):
+        """
+        レイヤーごとの未取得セルを1回の union クエリで取得し、タグでレイヤーに振り分けて格納。
+
+        クラスター全体のクエリはタイムアウト・メモリ不足になりやすい。応答が不完全なら
+        何も格納・記録せず、矩形の列を半分ずつに（1矩形ならセルを半分ずつに）分けて取り直す。
+        1セルでも不完全なら RuntimeError（それまでに取得できた範囲は格納・記録済み、
+        残りは未取得のまま）。
+        """
+        items = [
+            (layer, rect, cells)
+            for layer, layer_cells in cells_by_layer.items()
+            for rect, cells in cells_to_rects(layer_cells)
+        ]
+        self._fetch_rects(items)
+
+    def _fetch_rects(self, items: list[tuple[str, tuple[float, float, float, float], list]]):
+        started = time.time()
+        body = "".join(
+            LAYERS[layer]["query"].format(bbox=",".join(str(v) for v in rect)) for layer, rect, _ in items
+        )
+        counts = {}
+        for layer, _, _ in items:
+            counts[layer] = counts.get(layer, 0) + 1
+        print(f"  Overpass取得（union）: " + ", ".join(f"{layer} {n}矩形" for layer, n in counts.items()))
+        self.requests += 1
+        try:
+            arrays = overpass_request(f"({body});(._;>;);out body;", self.url, BATCH_TIMEOUT_S, 0)
+        except RuntimeError as e:
+            print(f"    {e}")
+            if len(items) > 1:
+                half = len(items) // 2
+                parts = [items[:half], items[half:]]
+                print(f"    → {len(items)}矩形を {half} + {len(items) - half} に分けて取り直します")
+            else:
+                layer, _, cells = items[0]
+                if len(cells) == 1:
+                    raise
+                half = len(cells) // 2
+                parts = [
+                    [(layer, rect, part) for rect, part in cells_to_rects(cells[:half])],
+                    [(layer, rect, part) for rect, part in cells_to_rects(cells[half:])],
+                ]
+                print(f"    → {len(cells)}セルを {half} + {len(cells) - half} に分けて取り直します")
+            # 分けた片方も取れなければ、残りは試さずに諦める（Overpass を叩き続けない）
+            for part in parts:
+                self._fetch_rects(part)
+            return
+
+        # ここから先は完全な応答だけ（削除済み way の掃除・取得済みの記録）
+        layers_of = [match_layers(tags) for tags in arrays.way_tags]
+        for layer in counts:
+            selected = [i for i, names in enumerate(layers_of) if layer in names]
+            count = self.store(layer, arrays.select(selected), started) if selected else 0
+            for item_layer, rect, cells in items:
+                if item_layer == layer:
+                    self._drop_stale_ways(layer, rect, started)
+                    self.mark_covered(layer, cells, fetched_at=started)
+            print(f"    → {layer}: {count} ways")
+
+    def stats(self) -> dict:
+        with self._lock:
+            nodes = self._db.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+            layers = {
+                layer: {"ways": ways}
+                for layer, ways in self._db.execute("SELECT layer, COUNT(*) FROM ways GROUP BY layer")
+            }
+            for layer, cells in self._db.execute("SELECT layer, COUNT(*) FROM coverage GROUP BY layer"):
+                layers.setdefault(layer, {"ways": 0})["cells"] = cells
+        size = self.path.stat().st_size if self.path.exists() else 0
+        return {"nodes": nodes, "layers": layers, "bytes": size}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def cells_to_rects(cells) -> list[tuple[tuple[float, float, float, float], list[tuple[int, int]]]]:
+    """
+    セルの集合を矩形にまとめる（行ごとの連続区間 → 同じ列範囲の隣接行を結合）。
+    [(bbox, その矩形に含まれるセル), ...] を返す。
+    """
+    rows: dict[int, list[int]] = {}
+    for cx, cy in cells:
+        rows.setdefault(cy, []).append(cx)
+    runs = []
+    for cy in sorted(rows):
+        xs = sorted(rows[cy])
+        start = prev = xs[0]
+        for cx in xs[1:] + [None]:
+            if cx is not None and cx == prev + 1:
+                prev = cx
+                continue
+            runs.append((cy, start, prev))
+            if cx is not None:
+                start = prev = cx
+    rects = []  # [cy0, cy1, cx0, cx1]
+    for cy, x0, x1 in runs:
+        for r in rects:
+            if r[1] == cy - 1 and r[2] == x0 and r[3] == x1:
+                r[1] = cy
+                break
+        else:
+            rects.append([cy, cy, x0, x1])
+    return [
+        (
+            (round(cy0 * CELL_DEG, 6), round(cx0 * CELL_DEG, 6),
+             round((cy1 + 1) * CELL_DEG, 6), round((cx1 + 1) * CELL_DEG, 6)),
+            [(cx, cy) for cy in range(cy0, cy1 + 1) for cx in range(cx0, cx1 + 1)],
+        )
+        for cy0, cy1, cx0, cx1 in rects
+    ]
+
+
+def cluster_bboxes(
+    bboxes: dict[str, tuple[float, float, float, float]],
+    gap_deg: float = CLUSTER_GAP_DEG,
+    max_cells: int = MAX_CLUSTER_CELLS,
+) -> list[list[str]]:
+    """
+    近い bbox をクラスターにまとめる（西から順に、外接矩形 + gap_deg に掛かる既存クラスターへ入れる）。
+    クラスターのセル数（bbox のセルの和集合）が max_cells を超える場合は新しいクラスターにする。
+    """
+    clusters = []  # [members, envelope(s, w, n, e), cells]
+    for key in sorted(bboxes, key=lambda k: (bboxes[k][1], bboxes[k][0])):
+        s, w, n, e = bboxes[key]
+        cells = set(OverpassCache.cells(bboxes[key]))
+        for cluster in clusters:
+            cs, cw, cn, ce = cluster[1]
+            near = s <= cn + gap_deg and n >= cs - gap_deg and w <= ce + gap_deg and e >= cw - gap_deg
+            if near and len(cluster[2] | cells) <= max_cells:
+                cluster[0].append(key)
+                cluster[1] = (min(cs, s), min(cw, w), max(cn, n), max(ce, e))
+                cluster[2] |= cells
+                break
+        else:
+            clusters.append([[key], (s, w, n, e), cells])
+    return [members for members, _, _ in clusters]
+
+
+def overpass_request(
+    query_body: str, url: str = OVERPASS_URL, timeout: int = 30, incomplete_retries: int = MAX_RETRIES
+) -> OverpassArrays:
+    """
+    Overpass API に1回問い合わせ、応答をストリーミングで列指向配列にする
+    （429/504 は Retry-After に従って再試行）。timeout はサーバー側のタイムアウト（秒）。
+
+    タイムアウト・メモリ不足では HTTP 200 のまま remark が "runtime error: ..." になり、
+    elements が途中まで（空のことも）しか返らない。これを結果として使うと手元の way を
+    「OSMで削除済み」と誤って消してしまうので、incomplete_retries 回まで再試行し、
+    それでも完全な応答が得られなければ RuntimeError にする（途中で切れた応答も同じ）。
+    """
+    query = f'[out:json][timeout:{timeout}];{query_body}'
+    http_attempt = incomplete_attempt = 0
+    while True:
+        req = Request(url, data=f'data={query}'.encode(), method='POST')
+        try:
+            with urlopen(req, timeout=timeout + 10) as resp:
+                arrays = OverpassArrays.parse(resp)
+        except HTTPError as e:
+            if e.code not in (429, 504) or http_attempt == MAX_RETRIES:
+                raise
+            http_attempt += 1
+            wait = float(e.headers.get("Retry-After") or 10 * http_attempt)
+            print(f"    Overpass {e.code}: {wait:.0f}秒待って再試行")
+            time.sleep(wait)
+            continue
+        except ValueError as e:
+            arrays = OverpassArrays.empty()
+            arrays.remark = f"runtime error: 応答を読めません（{e}）"
+        if not arrays.incomplete:
+            return arrays
+        if incomplete_attempt == incomplete_retries:
+            raise RuntimeError(f"Overpass の応答が不完全です: {arrays.remark}")
+        incomplete_attempt += 1
+        wait = 10 * incomplete_attempt
+        print(f"    Overpass 不完全な応答（{arrays.remark[:80]}）: {wait}秒待って再試行")
+        time.sleep(wait)
+
+
+def main():
+    args = sys.argv[1:]
+    if args == ["stats"]:
+        with OverpassCache() as cache:
+            s = cache.stats()
+        print(f"ノード: {s['nodes']}  容量: {s['bytes'] / 1024 ** 2:.1f}MB")
+        for layer, v in sorted(s["layers"].items()):
+            print(f"  {layer:<10} way {v.get('ways', 0):>6}  取得済みセル {v.get('cells', 0):>6}")
+    elif len(args) == 6 and args[0] == "query":
+        layer = args[1]
+        bbox = tuple(float(v) for v in args[2:])
+        with OverpassCache() as cache:
+            arrays = cache.query(layer, bbox)
+        print(f"{layer}: {len(arrays)} ways, {arrays.node_count} nodes")
+    elif args and args[0] == "expire" and len(args) <= 2:
+        with OverpassCache() as cache:
+            n = cache.expire(args[1] if len(args) == 2 else None)
+        print(f"期限切れにしたセル: {n}")
+    else:
+        print("使用方法:")
+        print("  python osm_cache.py stats")
+        print("  python osm_cache.py query <coastline|park> <south> <west> <north> <east>")
+        print("  python osm_cache.py expire [layer]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+osm_ingest.py
+
+地域のOSMエクストラクト（日本全体の .osm.pbf や Overpass JSON のダンプ）を1回読み込み、
+osm_cache の coastline / park レイヤーに取り込む。
+
+取り込んだ範囲はエクストラクトとして記録されるので、以後の fetch_coastline /
+fetch_park_polygon（analyze_coastline）はその範囲内ではOverpassに問い合わせず、
+R-tree の引き当てだけ（スポットあたり数ミリ秒）で答える。フリート全体をオフラインで回せる。
+
+  - .pbf: pyosmium（pip install osmium）でノード位置付きのwayを読む
+  - .json: Overpass の out body 形式（elements にノードとway）。osm_stream でストリーミング読み込み
+
+取り込み対象のタグ条件は osm_cache.match_layers（Overpassクエリと同じ条件）。
+
+使用方法:
+    python osm_ingest.py <japan-latest.osm.pbf | dump.json> [--bbox S,W,N,E] [--db PATH]
+    python osm_ingest.py status [--db PATH]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from osm_cache import DEFAULT_DB_PATH, LAYERS, OverpassCache, match_layers
+from osm_stream import OverpassArrays
+
+
+# 何wayごとにSQLiteへ書き出すか
+BATCH_WAYS = 20000
+
+
+class _Batcher:
+    """レイヤーごとにwayを溜めて BATCH_WAYS ごとに OverpassArrays として格納する"""
+
+    def __init__(self, cache: OverpassCache):
+        self.cache = cache
+        self.pending = {layer: [] for layer in LAYERS}
+        self.counts = {layer: 0 for layer in LAYERS}
+        self.bounds = [90.0, 180.0, -90.0, -180.0]  # south, west, north, east
+
+    def add(self, layer: str, way_id: int, tags: dict, node_ids: list[int], coords: list[tuple[float, float]]):
+        pending = self.pending[layer]
+        pending.append((way_id, tags, node_ids, coords))
+        for lat, lon in coords:
+            self.extend(lat, lon)
+        if len(pending) >= BATCH_WAYS:
+            self.flush(layer)
+
+    def add_arrays(self, layer: str, arrays: OverpassArrays):
+        """列指向のまま BATCH_WAYS ごとに格納"""
+        for start in range(0, len(arrays), BATCH_WAYS):
+            batch = arrays.select(np.arange(start, min(start + BATCH_WAYS, len(arrays))))
+            self.counts[layer] += self.cache.store(layer, batch)
+
+    def extend(self, lat: float, lon: float):
+        b = self.bounds
+        b[0], b[1], b[2], b[3] = min(b[0], lat), min(b[1], lon), max(b[2], lat), max(b[3], lon)
+
+    def flush(self, layer: str | None = None):
+        for name in [layer] if layer else list(self.pending):
+            pending = self.pending[name]
+            if not pending:
+                continue
+            refs = [nid for _, _, node_ids, _ in pending for nid in node_ids]
+            coords = [c for _, _, _, way_coords in pending for c in way_coords]
+            arrays = OverpassArrays(
+                refs, [c[0] for c in coords], [c[1] for c in coords],
+                [way_id for way_id, _, _, _ in pending],
+                np.concatenate(([0], np.cumsum([len(node_ids) for _, _, node_ids, _ in pending]))),
+                refs,
+                [tags for _, tags, _, _ in pending],
+            )
+            self.counts[name] += self.cache.store(name, arrays)
+            self.pending[name] = []
+
+
+def ingest_overpass_json(path: str | Path, batcher: _Batcher):
+    """Overpass JSON（out body）のダンプをストリーミングで読んで取り込む"""
+    arrays = OverpassArrays.load(path, keep_way=lambda tags: bool(match_layers(tags)))
+    if arrays.node_count:
+        batcher.extend(float(arrays.node_lat.min()), float(arrays.node_lon.min()))
+        batcher.extend(float(arrays.node_lat.max()), float(arrays.node_lon.max()))
+    layers_of = [match_layers(tags) for tags in arrays.way_tags]
+    for layer in LAYERS:
+        selected = [i for i, layers in enumerate(layers_of) if layer in layers]
+        if selected:
+            batcher.add_arrays(layer, arrays.select(selected))
+
+
+def ingest_pbf(path: str | Path, batcher: _Batcher):
+    """OSM PBF を pyosmium で読み、該当wayをノード位置付きで取り込む"""
+    try:
+        import osmium
+    except ImportError:
+        print("pyosmium未インストール。pip install osmium を実行してください。")
+        print("代替: Overpass JSON のダンプ（.json）も取り込めます。")
+        sys.exit(1)
+
+    class WayHandler(osmium.SimpleHandler):
+        def way(self, w):
+            tags = {t.k: t.v for t in w.tags}
+            layers = match_layers(tags)
+            if not layers:
+                return
+            node_ids = []
+            coords = []
+            for n in w.nodes:
+                if n.location.valid():
+                    node_ids.append(n.ref)
+                    coords.append((n.location.lat, n.location.lon))
+            for layer in layers:
+                batcher.add(layer, w.id, tags, node_ids, coords)
+
+    header_box = osmium.io.Reader(str(path)).header().box()
+    if header_box.valid():
+        batcher.extend(header_box.bottom_left.lat, header_box.bottom_left.lon)
+        batcher.extend(header_box.top_right.lat, header_box.top_right.lon)
+    # locations=True: ノード位置をインデックスしてwayに付ける（日本全体なら flex_mem で数GB以内）
+    WayHandler().apply_file(str(path), locations=True, idx="flex_mem")
+
+
+def ingest(
+    path: str | Path,
+    db_path: str | Path = DEFAULT_DB_PATH,
+    bbox: tuple[float, float, float, float] | None = None,
+) -> dict:
+    """
+    エクストラクトを取り込み、レイヤーごとの way 数を返す。
+    bbox を省略するとエクストラクトのヘッダー範囲（なければノードの範囲）を取り込み範囲とする。
+    """
+    path = Path(path)
+    with OverpassCache(db_path, offline=True) as cache:
+        batcher = _Batcher(cache)
+        if path.suffix == ".json":
+            ingest_overpass_json(path, batcher)
+        else:
+            ingest_pbf(path, batcher)
+        batcher.flush()
+        extent = bbox or tuple(batcher.bounds)
+        if extent[0] <= extent[2] and extent[1] <= extent[3]:
+            for layer in LAYERS:
+                cache.add_extract(layer, path.name, extent)
+        return {"ways": batcher.counts, "bbox": extent}
+
+
+def main():
+    args = sys.argv[1:]
+    db_path = DEFAULT_DB_PATH
+    if "--db" in args:
+        i = args.index("--db")
+        db_path = Path(args[i + 1])
+        del args[i:i + 2]
+    bbox = None
+    if "--bbox" in args:
+        i = args.index("--bbox")
+        bbox = tuple(float(v) for v in args[i + 1].split(","))
+        del args[i:i + 2]
+
+    if args == ["status"]:
+        with OverpassCache(db_path, offline=True) as cache:
+            extracts = cache.extracts()
+            stats = cache.stats()
+        if not extracts:
+            print("取り込み済みのエクストラクトはありません")
+        for layer, source, s, w, n, e, at in extracts:
+            print(f"  {layer:<10} {source}  bbox=({s:.3f},{w:.3f},{n:.3f},{e:.3f})  "
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(at))}")
+        for layer, v in sorted(stats["layers"].items()):
+            print(f"  {layer:<10} way {v.get('ways', 0)}")
+    elif len(args) == 1:
+        start = time.perf_counter()
+        print(f"=== OSMエクストラクト取り込み: {args[0]} ===")
+        result = ingest(args[0], db_path, bbox)
+        s, w, n, e = result["bbox"]
+        for layer, count in result["ways"].items():
+            print(f"  {layer}: {count} ways")
+        print(f"  範囲: ({s:.3f},{w:.3f},{n:.3f},{e:.3f})")
+        print(f"  所要時間: {time.perf_counter() - start:.1f}s → {db_path}")
+    else:
+        print("使用方法:")
+        print("  python osm_ingest.py <japan-latest.osm.pbf | dump.json> [--bbox S,W,N,E] [--db PATH]")
+        print("  python osm_ingest.py status [--db PATH]")
+
+
+if __name__ == "__main__":
+    main()
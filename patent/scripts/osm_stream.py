@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+osm_stream.py
+
+Overpass JSON（out body）をストリーミングで読み、列指向のNumPy配列にするパーサー。
+
+json.load で応答全体を dict/list の木にしてから (lat, lon) タプルの dict を作ると、
+地域規模の bbox では数百MBの小さなオブジェクトになる。ここでは elements 配列を
+チャンクごとにデコードしてその場で配列に詰めるので、保持するのは
+  - ノード: id（昇順）/ lat / lon の3本の配列（IDで二分探索して引く）
+  - way: id / タグ / ノード参照の連結配列 + 各wayの開始位置（offsets）
+だけになる。ファイルでもHTTP応答（urlopen の戻り値）でもそのまま読める。
+デコードはチャンク（要素の境目で切る）ごとにCのJSONデコーダで行う。
+osm_cache.OverpassCache の問い合わせ結果も同じ形で返す。
+
+使用方法:
+    python osm_stream.py <overpass.json>     # 件数・所要時間・json.load との比較
+    python osm_stream.py check               # 合成応答（remark に括弧を含む等）で分割読みを確認
+"""
+
+import io
+import re
+import sys
+import json
+import time
+from array import array
+
+import numpy as np
+
+
+CHUNK_CHARS = 1 << 22
+# 処理が打ち切られたことを示す remark の接頭辞（タイムアウト・メモリ不足）
+INCOMPLETE_REMARKS = ("runtime error", "runtime remark")
+
+# 要素の先頭（Overpass は各要素を "type" → "id" の順で書く）。ここで切れば要素の途中では切れない
+_ELEMENT_START = re.compile(r'\{\s*"type"\s*:\s*"(?:node|way|relation|area)"\s*,\s*"id"')
+
+
+def _split_tail(buf: str) -> tuple[list, dict]:
+    """
+    最後のチャンク（要素の境目から始まる elements の残り + 閉じ括弧 + 後続のキー）を
+    (要素のリスト, 後続のキーの dict) に分ける。
+
+    後続の "remark" はクエリ文を引用するので括弧を含むことがある。末尾から括弧を探さず、
+    要素を先頭から1つずつデコードして、要素の外にある ] を閉じ括弧とする。
+    """
+    decoder = json.JSONDecoder()
+    elements = []
+    i, n = 0, len(buf)
+    while True:
+        while i < n and buf[i] in " \t\r\n,":
+            i += 1
+        if i >= n:
+            raise ValueError("elements 配列が閉じていません（応答が途中で切れています）")
+        if buf[i] == "]":
+            break
+        element, i = decoder.raw_decode(buf, i)
+        elements.append(element)
+    rest = buf[i + 1:].strip().lstrip(",").strip()
+    trailer = json.loads("{" + rest) if rest else {}
+    return elements, trailer
+
+
+def iter_batches(f, chunk_chars: int = CHUNK_CHARS, meta: dict | None = None):
+    """
+    Overpass JSON の elements 配列を、要素のリスト単位（チャンクごと）で返す。
+    f はテキスト/バイナリのファイル風オブジェクト。
+
+    チャンクを読み、最後の要素の先頭より前をまとめて json.loads するので、
+    デコード自体はCのJSONデコーダで1チャンク1回、保持するのは1チャンク分だけ。
+    meta を渡すと elements の後ろのキー（"remark" 等）をそこに入れる。
+    """
+    if not isinstance(f, io.TextIOBase):
+        f = io.TextIOWrapper(f, encoding="utf-8")
+    buf = ""
+    pos = -1
+    while pos < 0:
+        chunk = f.read(chunk_chars)
+        if not chunk:
+            # elements のない応答（エラー時は {"remark": ...} だけのことがある）
+            if meta is not None and buf.strip():
+                try:
+                    meta.update(json.loads(buf))
+                except ValueError:
+                    pass
+            return
+        buf += chunk
+        key = buf.find('"elements"')
+        if key >= 0:
+            pos = buf.find("[", key)
+    pos += 1
+    while True:
+        chunk = f.read(chunk_chars)
+        buf, pos = buf[pos:] + chunk, 0
+        if not chunk:
+            # elements 配列の閉じ括弧（後ろに "remark" 等が続くことがある）
+            elements, trailer = _split_tail(buf)
+            if meta is not None:
+                meta.update(trailer)
+            if elements:
+                yield elements
+            return
+        end = None
+        for m in _ELEMENT_START.finditer(buf, max(1, len(buf) - chunk_chars // 2)):
+            end = m.start()
+        if end is None:
+            continue  # 1要素がチャンクより大きい: もっと読む
+        body = buf[:end].strip().rstrip(",")
+        pos = end
+        if body:
+            yield json.loads(f"[{body}]")
+
+
+def iter_elements(f, chunk_chars: int = CHUNK_CHARS):
+    """elements 配列の要素を1つずつ返す"""
+    for batch in iter_batches(f, chunk_chars):
+        yield from batch
+
+
+class OverpassArrays:
+    """Overpass 応答の列指向表現"""
+
+    def __init__(self, node_ids, node_lat, node_lon, way_ids, way_offsets, way_refs, way_tags):
+        order = np.argsort(node_ids, kind="stable")
+        self.node_ids = np.asarray(node_ids, dtype=np.int64)[order]
+        self.node_lat = np.asarray(node_lat, dtype=np.float64)[order]
+        self.node_lon = np.asarray(node_lon, dtype=np.float64)[order]
+        self.way_ids = np.asarray(way_ids, dtype=np.int64)
+        self.way_offsets = np.asarray(way_offsets, dtype=np.int64)
+        self.way_refs = np.asarray(way_refs, dtype=np.int64)
+        self.way_tags = way_tags
+        # 応答の "remark"（Overpass はタイムアウト・メモリ不足でも 200 で返し、ここに書く）
+        self.remark = None
+
+    @classmethod
+    def parse(cls, f, keep_way=None) -> "OverpassArrays":
+        """
+        ストリームから読む。keep_way(tags) を渡すと、False のwayは配列に入れない
+        （ノードはwayより先に来ることがあるので全て保持する）。応答の remark は .remark に入る。
+        """
+        node_ids, node_lat, node_lon = array("q"), array("d"), array("d")
+        way_ids, way_offsets, way_refs = array("q"), array("q", [0]), array("q")
+        way_tags = []
+        meta = {}
+        for batch in iter_batches(f, meta=meta):
+            nodes = [e for e in batch if e["type"] == "node"]
+            node_ids.extend([e["id"] for e in nodes])
+            node_lat.extend([e["lat"] for e in nodes])
+            node_lon.extend([e["lon"] for e in nodes])
+            for e in batch:
+                if e["type"] != "way":
+                    continue
+                tags = e.get("tags", {})
+                if keep_way is not None and not keep_way(tags):
+                    continue
+                way_ids.append(e["id"])
+                way_refs.extend(e.get("nodes", []))
+                way_offsets.append(len(way_refs))
+                way_tags.append(tags)
+        arrays = cls(node_ids, node_lat, node_lon, way_ids, way_offsets, way_refs, way_tags)
+        arrays.remark = meta.get("remark")
+        return arrays
+
+    @property
+    def incomplete(self) -> bool:
+        """サーバー側で処理が打ち切られた応答か（elements は途中まで・空のことがある）"""
+        return bool(self.remark) and self.remark.startswith(INCOMPLETE_REMARKS)
+
+    @classmethod
+    def empty(cls) -> "OverpassArrays":
+        return cls([], [], [], [], [0], [], [])
+
+    @classmethod
+    def load(cls, path, keep_way=None) -> "OverpassArrays":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.parse(f, keep_way)
+
+    def __len__(self) -> int:
+        return len(self.way_ids)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.node_ids)
+
+    def resolve(self, refs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """ノードID配列 → (ノード配列上の位置, 見つかったか)"""
+        if len(self.node_ids) == 0:
+            return np.zeros(len(refs), dtype=np.int64), np.zeros(len(refs), dtype=bool)
+        idx = np.searchsorted(self.node_ids, refs)
+        idx = np.minimum(idx, len(self.node_ids) - 1)
+        return idx, self.node_ids[idx] == refs
+
+    def way_refs_of(self, i: int) -> np.ndarray:
+        return self.way_refs[self.way_offsets[i]:self.way_offsets[i + 1]]
+
+    def way_coords(self, i: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """way i の (ノードID, lat, lon)（応答に含まれないノードは除く）"""
+        refs = self.way_refs_of(i)
+        idx, found = self.resolve(refs)
+        idx = idx[found]
+        return refs[found], self.node_lat[idx], self.node_lon[idx]
+
+    def coord_list(self, i: int) -> list[tuple[float, float]]:
+        _, lat, lon = self.way_coords(i)
+        return list(zip(lat.tolist(), lon.tolist()))
+
+    def coastlines(self) -> list[list[tuple[float, float]]]:
+        """全wayの座標列（ノードが1つもないwayは除く）"""
+        return [coords for coords in (self.coord_list(i) for i in range(len(self))) if coords]
+
+    def way_bounds(self) -> np.ndarray:
+        """各wayの (min_lat, max_lat, min_lon, max_lon)（ノードがないwayは NaN）"""
+        idx, found = self.resolve(self.way_refs)
+        lat = np.where(found, self.node_lat[idx], np.nan)
+        lon = np.where(found, self.node_lon[idx], np.nan)
+        out = np.full((len(self), 4), np.nan)
+        starts = self.way_offsets[:-1]
+        nonempty = self.way_offsets[1:] > starts
+        if nonempty.any():
+            s = starts[nonempty]
+            with np.errstate(invalid="ignore"):
+                out[nonempty, 0] = np.fmin.reduceat(lat, s)
+                out[nonempty, 1] = np.fmax.reduceat(lat, s)
+                out[nonempty, 2] = np.fmin.reduceat(lon, s)
+                out[nonempty, 3] = np.fmax.reduceat(lon, s)
+        return out
+
+    def select(self, indices) -> "OverpassArrays":
+        """指定したwayだけを持つ配列（ノードはそれらが参照するものだけ）"""
+        indices = np.asarray(indices, dtype=np.int64)
+        starts, ends = self.way_offsets[indices], self.way_offsets[indices + 1]
+        refs = (np.concatenate([self.way_refs[a:b] for a, b in zip(starts, ends)])
+                if len(indices) else np.zeros(0, dtype=np.int64))
+        idx, found = self.resolve(np.unique(refs))
+        idx = idx[found]
+        return OverpassArrays(
+            self.node_ids[idx], self.node_lat[idx], self.node_lon[idx],
+            self.way_ids[indices], np.concatenate(([0], np.cumsum(ends - starts))), refs,
+            [self.way_tags[i] for i in indices],
+        )
+
+    def node_dict(self) -> dict:
+        """従来の {id: (lat, lon)} 形式（小さい応答向け）"""
+        return dict(zip(self.node_ids.tolist(), zip(self.node_lat.tolist(), self.node_lon.tolist())))
+
+    def way_dicts(self) -> list[dict]:
+        """従来の Overpass way 要素形式"""
+        return [
+            {"type": "way", "id": int(self.way_ids[i]), "tags": self.way_tags[i],
+             "nodes": self.way_refs_of(i).tolist()}
+            for i in range(len(self))
+        ]
+
+
+# ---------------------------------------------------------------------------
+# 検証
+# ---------------------------------------------------------------------------
+
+def check_parser(seed: int = 0) -> bool:
+    """合成応答を小さいチャンクで読み、json.load と同じ要素・後続キーになるか確認"""
+    rng = np.random.default_rng(seed)
+    nodes = [{"type": "node", "id": int(i), "lat": float(35 + rng.random()), "lon": float(139 + rng.random())}
+             for i in range(1, 301)]
+    ways = [{"type": "way", "id": 1000 + w, "nodes": list(range(w * 10 + 1, w * 10 + 11)),
+             "tags": {"natural": "coastline", "note": "[a] {b} \"c\" ]}"}} for w in range(30)]
+    header = {"version": 0.6, "generator": "Overpass API", "osm3s": {"copyright": "ODbL"}}
+    cases = {
+        "remark なし": {**header, "elements": nodes + ways},
+        "remark に括弧": {**header, "elements": nodes + ways,
+                        "remark": 'runtime error: Query timed out in "query" at line 1: way["natural"="coastline"](1,2,3,4); [x]}'},
+        "要素なし + remark": {**header, "elements": [],
+                            "remark": "runtime remark: Timeout [180] ]}"},
+        "elements なし": {"remark": "runtime error: out of memory [x]"},
+    }
+
+    print("=== Overpass JSON パーサーチェック ===")
+    ok = True
+    for name, doc in cases.items():
+        text = json.dumps(doc, ensure_ascii=False, indent=1)
+        for chunk_chars in (64, 1000, CHUNK_CHARS):
+            meta = {}
+            try:
+                elements = [e for batch in iter_batches(io.StringIO(text), chunk_chars, meta) for e in batch]
+                good = elements == doc.get("elements", []) and meta.get("remark") == doc.get("remark")
+            except ValueError as e:
+                good, elements = False, [e]
+            ok &= good
+            if not good or chunk_chars == CHUNK_CHARS:
+                print(f"  {name:<14} chunk={chunk_chars:<8} 要素 {len(elements)}  {'OK' if good else 'NG'}")
+    return ok
+
+
+def main():
+    args = sys.argv[1:]
+    if args == ["check"]:
+        ok = check_parser()
+        print("=== OK ===" if ok else "=== NG ===")
+        sys.exit(0 if ok else 1)
+    if len(args) != 1:
+        print("使用方法:")
+        print("  python osm_stream.py <overpass.json>")
+        print("  python osm_stream.py check")
+        return
+    start = time.perf_counter()
+    arrays = OverpassArrays.load(args[0])
+    streamed = time.perf_counter() - start
+    print(f"ストリーミング: {streamed:.2f}s  ノード {arrays.node_count}  way {len(arrays)}")
+    nbytes = sum(a.nbytes for a in (arrays.node_ids, arrays.node_lat, arrays.node_lon,
+                                     arrays.way_ids, arrays.way_offsets, arrays.way_refs))
+    print(f"  配列: {nbytes / 1024 ** 2:.1f}MB")
+
+    start = time.perf_counter()
+    with open(args[0], "r", encoding="utf-8") as f:
+        data = json.load(f)
+    nodes = {e["id"]: (e["lat"], e["lon"]) for e in data["elements"] if e["type"] == "node"}
+    print(f"json.load + dict: {time.perf_counter() - start:.2f}s  ノード {len(nodes)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+polygon_index.py
+
+公園ポリゴンの「内側、または境界から buffer_m 以内か」判定を高速化する空間インデックス。
+
+従来の point_near_polygon は1点ごとにポリゴン全周のRay castingと全辺への距離計算を
+行っていたため、海岸線セグメント数 × ポリゴン辺数 の計算量だった。
+
+PolygonIndex はポリゴン中心の局所平面（メートル）で一様グリッドを作り、
+  - 各セルに「buffer_m 以内に入りうる辺」を登録（距離判定はセル内の候補辺だけ）
+  - 各行（緯度方向の帯）にその帯を跨ぐ辺を登録（Ray castingは帯内の辺だけ）
+しておくので、1点あたりの判定は近傍の数辺で済む。グリッド外の点は即 False。
+
+使用方法:
+    python polygon_index.py check      # 総当たりとの一致・速度比較
+"""
+
+import sys
+import math
+import time
+
+import numpy as np
+
+from projection import split_latlng
+
+
+EARTH_RADIUS_M = 6371000
+DEFAULT_BUFFER_M = 30
+
+
+class PolygonIndex:
+    """ポリゴン（[(lat, lng), ...]、閉じていなくてもよい）の buffer_m 付き包含判定"""
+
+    def __init__(self, polygon, buffer_m: float = DEFAULT_BUFFER_M, cell_m: float | None = None):
+        lat, lng = split_latlng(polygon)
+        if len(lat) < 2:
+            raise ValueError("ポリゴンの頂点が足りません")
+        if lat[0] != lat[-1] or lng[0] != lng[-1]:
+            lat, lng = np.append(lat, lat[0]), np.append(lng, lng[0])
+        self.buffer_m = buffer_m
+
+        # 局所平面（正距円筒）: ポリゴン程度の範囲なら誤差は無視できる
+        self._lat0 = float(lat.mean())
+        self._lng0 = float(lng.mean())
+        self._ky = EARTH_RADIUS_M * math.pi / 180
+        self._kx = self._ky * math.cos(math.radians(self._lat0))
+        x, y = self._local(lat, lng)
+        self._ax, self._ay, self._bx, self._by = x[:-1], y[:-1], x[1:], y[1:]
+
+        lengths = np.hypot(self._bx - self._ax, self._by - self._ay)
+        self.cell_m = cell_m or max(buffer_m, float(np.median(lengths)), 1.0)
+        self._x0 = float(x.min()) - buffer_m
+        self._y0 = float(y.min()) - buffer_m
+        self._cols = int((x.max() + buffer_m - self._x0) // self.cell_m) + 1
+        self._rows = int((y.max() + buffer_m - self._y0) // self.cell_m) + 1
+
+        cells: dict[int, list[int]] = {}
+        bands: dict[int, list[int]] = {}
+        for i in range(len(self._ax)):
+            x_lo, x_hi = sorted((self._ax[i], self._bx[i]))
+            y_lo, y_hi = sorted((self._ay[i], self._by[i]))
+            c0, c1 = self._cell(x_lo - buffer_m, self._x0), self._cell(x_hi + buffer_m, self._x0)
+            r0, r1 = self._cell(y_lo - buffer_m, self._y0), self._cell(y_hi + buffer_m, self._y0)
+            for r in range(r0, r1 + 1):
+                for c in range(c0, c1 + 1):
+                    cells.setdefault(r * self._cols + c, []).append(i)
+            for r in range(self._cell(y_lo, self._y0), self._cell(y_hi, self._y0) + 1):
+                bands.setdefault(r, []).append(i)
+        self._cells = {k: np.array(v) for k, v in cells.items()}
+        self._bands = {k: np.array(v) for k, v in bands.items()}
+
+    def _local(self, lat, lng) -> tuple[np.ndarray, np.ndarray]:
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        return (lng - self._lng0) * self._kx, (lat - self._lat0) * self._ky
+
+    def _cell(self, v: float, origin: float) -> int:
+        return int((v - origin) // self.cell_m)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self._ax)
+
+    def near(self, lat: float, lng: float) -> bool:
+        """点がポリゴン内、または辺から buffer_m 未満か"""
+        return bool(self.near_array([lat], [lng])[0])
+
+    def near_array(self, lat, lng) -> np.ndarray:
+        """near の配列版（bool配列）"""
+        px, py = self._local(lat, lng)
+        px, py = np.atleast_1d(px), np.atleast_1d(py)
+        out = np.zeros(len(px), dtype=bool)
+        col = np.floor((px - self._x0) / self.cell_m).astype(np.int64)
+        row = np.floor((py - self._y0) / self.cell_m).astype(np.int64)
+        inside_grid = (col >= 0) & (col < self._cols) & (row >= 0) & (row < self._rows)
+
+        # 境界から buffer_m 未満（セルごとに候補辺だけを見る）
+        idx = np.nonzero(inside_grid)[0]
+        keys = row[idx] * self._cols + col[idx]
+        for key in np.unique(keys):
+            edges = self._cells.get(int(key))
+            if edges is None:
+                continue
+            pts = idx[keys == key]
+            d = self._distances(px[pts], py[pts], edges)
+            out[pts] = (d < self.buffer_m).any(axis=1)
+
+        # ポリゴン内（同じ帯の辺だけでRay casting）
+        idx = np.nonzero(inside_grid & ~out)[0]
+        for r in np.unique(row[idx]):
+            edges = self._bands.get(int(r))
+            if edges is None:
+                continue
+            pts = idx[row[idx] == r]
+            out[pts] = self._crossings(px[pts], py[pts], edges) % 2 == 1
+        return out
+
+    def _distances(self, px: np.ndarray, py: np.ndarray, edges: np.ndarray) -> np.ndarray:
+        """点 × 辺 の最短距離（m）"""
+        ax, ay = self._ax[edges], self._ay[edges]
+        dx, dy = self._bx[edges] - ax, self._by[edges] - ay
+        len_sq = dx * dx + dy * dy
+        rx, ry = px[:, None] - ax, py[:, None] - ay
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = np.where(len_sq > 0, (rx * dx + ry * dy) / len_sq, 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        return np.hypot(rx - t * dx, ry - t * dy)
+
+    def _crossings(self, px: np.ndarray, py: np.ndarray, edges: np.ndarray) -> np.ndarray:
+        """点から +x 方向の半直線が横切る辺の数"""
+        ax, ay = self._ax[edges], self._ay[edges]
+        bx, by = self._bx[edges], self._by[edges]
+        spans = (ay > py[:, None]) != (by > py[:, None])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            x_cross = (bx - ax) * (py[:, None] - ay) / (by - ay) + ax
+        return (spans & (px[:, None] < x_cross)).sum(axis=1)
+
+
+def point_near_polygon(
+    lat: float, lng: float, polygon: list[tuple[float, float]], threshold_m: float = DEFAULT_BUFFER_M
+) -> bool:
+    """
+    点がポリゴン内、または辺から threshold_m 以内か（1点だけの判定用）。
+    多数の点を判定するときは PolygonIndex を1回作って使い回す。
+    """
+    return PolygonIndex(polygon, threshold_m).near(lat, lng)
+
+
+# ---------------------------------------------------------------------------
+# 検証
+# ---------------------------------------------------------------------------
+
+def _brute_force(index: PolygonIndex, lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    """全辺を見る判定（インデックスなし）"""
+    px, py = index._local(lat, lng)
+    all_edges = np.arange(index.edge_count)
+    near = index._distances(px, py, all_edges).min(axis=1) < index.buffer_m
+    inside = index._crossings(px, py, all_edges) % 2 == 1
+    return near | inside
+
+
+def check_index(samples: int = 20000, vertices: int = 2000, seed: int = 0) -> bool:
+    """ギザギザの星形ポリゴンで総当たりと一致するか・どれだけ速いかを確認"""
+    rng = np.random.default_rng(seed)
+    lat0, lng0 = 36.39, 140.62
+    theta = np.sort(rng.uniform(0, 2 * np.pi, vertices))
+    radius = 0.004 * (1 + 0.5 * rng.random(vertices))
+    polygon = list(zip(lat0 + radius * np.sin(theta), lng0 + radius * np.cos(theta)))
+    lat = lat0 + rng.uniform(-0.008, 0.008, samples)
+    lng = lng0 + rng.uniform(-0.008, 0.008, samples)
+
+    print("=== PolygonIndex チェック ===")
+    start = time.perf_counter()
+    index = PolygonIndex(polygon)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    fast = index.near_array(lat, lng)
+    indexed = time.perf_counter() - start
+    start = time.perf_counter()
+    slow = _brute_force(index, lat, lng)
+    brute = time.perf_counter() - start
+
+    ok = bool((fast == slow).all())
+    print(f"  辺 {index.edge_count}本 / 点 {samples}個 / セル {index.cell_m:.1f}m")
+    print(f"  構築 {built * 1000:.1f}ms  インデックス {indexed * 1000:.1f}ms  総当たり {brute * 1000:.1f}ms")
+    print(f"  判定一致: {'OK' if ok else 'NG'} (該当 {int(fast.sum())}点)")
+    scalar = all(index.near(a, b) == f for a, b, f in zip(lat[:200], lng[:200], fast[:200]))
+    print(f"  スカラー版 = 配列版: {'OK' if scalar else 'NG'}")
+    return ok and scalar
+
+
+def main():
+    args = sys.argv[1:]
+    if args == ["check"]:
+        ok = check_index()
+        print("=== OK ===" if ok else "=== NG ===")
+        sys.exit(0 if ok else 1)
+    print("使用方法:")
+    print("  python polygon_index.py check")
+
+
+if __name__ == "__main__":
+    main()
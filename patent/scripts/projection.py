@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+projection.py
+
+Webメルカトル（XYZタイル）の座標変換を1か所にまとめたモジュール。
+
+  - スカラー版: latlng_to_tile / latlng_to_tile_float / latlng_to_pixel /
+    pixel_to_latlng / to_web_mercator（従来各スクリプトにコピーされていたもの）
+  - 配列版（*_array）: 緯度経度の配列をまとめて変換（NumPy）
+  - MosaicTransform: モザイク1枚分の変換（meta.json から1回だけ作る）
+
+ピクセル座標はモザイク左上タイルの左上を原点とし、従来通り int() と同じ
+0方向への切り捨てで整数化する。
+
+使用方法:
+    python projection.py check      # 往復変換の精度チェック
+"""
+
+import sys
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+
+
+TILE_SIZE = 256
+# EPSG:3857 の赤道半周長（m）
+MERCATOR_HALF_EXTENT = 20037508.34
+# Webメルカトルで表現できる緯度の上限
+MAX_LATITUDE = 85.05112878
+
+
+# ---------------------------------------------------------------------------
+# スカラー版
+# ---------------------------------------------------------------------------
+
+def latlng_to_tile_float(lat: float, lng: float, zoom: int) -> tuple[float, float]:
+    """緯度経度 → タイル座標（小数付き）"""
+    n = 2 ** zoom
+    x = (lng + 180.0) / 360.0 * n
+    lat_rad = math.radians(lat)
+    y = (1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * n
+    return x, y
+
+
+def latlng_to_tile(lat: float, lng: float, zoom: int) -> tuple[int, int]:
+    """緯度経度 → タイル座標変換"""
+    x, y = latlng_to_tile_float(lat, lng, zoom)
+    return int(x), int(y)
+
+
+def tile_to_latlng(tx: float, ty: float, zoom: int) -> tuple[float, float]:
+    """タイル座標（小数可） → 緯度経度"""
+    n = 2 ** zoom
+    lng = tx / n * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+    return lat, lng
+
+
+def latlng_to_pixel(
+    lat: float, lng: float, zoom: int, tile_x_min: int, tile_y_min: int
+) -> tuple[int, int]:
+    """緯度経度 → 画像上のピクセル座標"""
+    tx, ty = latlng_to_tile_float(lat, lng, zoom)
+    px = int((tx - tile_x_min) * TILE_SIZE)
+    py = int((ty - tile_y_min) * TILE_SIZE)
+    return px, py
+
+
+def pixel_to_latlng(
+    px: float, py: float, zoom: int, tile_x_min: int, tile_y_min: int
+) -> tuple[float, float]:
+    """ピクセル座標 → 緯度経度（latlng_to_pixelの逆変換）"""
+    return tile_to_latlng(tile_x_min + px / TILE_SIZE, tile_y_min + py / TILE_SIZE, zoom)
+
+
+def to_web_mercator(lat: float, lng: float) -> tuple[float, float]:
+    """緯度経度 → EPSG:3857（m）"""
+    x = lng * MERCATOR_HALF_EXTENT / 180
+    y_rad = math.log(math.tan((90 + lat) * math.pi / 360)) / (math.pi / 180)
+    y = y_rad * MERCATOR_HALF_EXTENT / 180
+    return x, y
+
+
+# ---------------------------------------------------------------------------
+# 配列版
+# ---------------------------------------------------------------------------
+
+def latlng_to_tile_array(lat, lng, zoom: int) -> tuple[np.ndarray, np.ndarray]:
+    """緯度経度の配列 → タイル座標（小数付き）の配列"""
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    n = float(2 ** zoom)
+    x = (lng + 180.0) / 360.0 * n
+    lat_rad = np.radians(lat)
+    y = (1.0 - np.log(np.tan(lat_rad) + 1 / np.cos(lat_rad)) / np.pi) / 2.0 * n
+    return x, y
+
+
+def tile_to_latlng_array(tx, ty, zoom: int) -> tuple[np.ndarray, np.ndarray]:
+    """タイル座標の配列 → 緯度経度の配列"""
+    tx = np.asarray(tx, dtype=np.float64)
+    ty = np.asarray(ty, dtype=np.float64)
+    n = float(2 ** zoom)
+    lng = tx / n * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * ty / n))))
+    return lat, lng
+
+
+def latlng_to_pixel_array(
+    lat, lng, zoom: int, tile_x_min: int, tile_y_min: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """緯度経度の配列 → ピクセル座標（int64、0方向に切り捨て）"""
+    tx, ty = latlng_to_tile_array(lat, lng, zoom)
+    px = np.trunc((tx - tile_x_min) * TILE_SIZE).astype(np.int64)
+    py = np.trunc((ty - tile_y_min) * TILE_SIZE).astype(np.int64)
+    return px, py
+
+
+def pixel_to_latlng_array(
+    px, py, zoom: int, tile_x_min: int, tile_y_min: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """ピクセル座標の配列 → 緯度経度の配列"""
+    px = np.asarray(px, dtype=np.float64)
+    py = np.asarray(py, dtype=np.float64)
+    return tile_to_latlng_array(tile_x_min + px / TILE_SIZE, tile_y_min + py / TILE_SIZE, zoom)
+
+
+def to_web_mercator_array(lat, lng) -> tuple[np.ndarray, np.ndarray]:
+    """緯度経度の配列 → EPSG:3857（m）の配列"""
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    x = lng * MERCATOR_HALF_EXTENT / 180
+    y = np.log(np.tan((90 + lat) * np.pi / 360)) / (np.pi / 180) * MERCATOR_HALF_EXTENT / 180
+    return x, y
+
+
+def split_latlng(coords) -> tuple[np.ndarray, np.ndarray]:
+    """[(lat, lng), ...] → (lat配列, lng配列)"""
+    arr = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    return arr[:, 0], arr[:, 1]
+
+
+# ---------------------------------------------------------------------------
+# モザイク単位の変換
+# ---------------------------------------------------------------------------
+
+class MosaicTransform:
+    """
+    モザイク画像1枚の 緯度経度 ⇔ ピクセル 変換。
+
+    offset はクロップ画像用（元モザイク上の左上ピクセル座標、フル解像度）。
+    scale は縮小デコード用（1/2 なら 2、ピクセル座標はフル解像度の 1/scale）。
+    """
+
+    def __init__(
+        self,
+        zoom: int,
+        tile_x_min: int,
+        tile_y_min: int,
+        width: int = 0,
+        height: int = 0,
+        offset: tuple[int, int] = (0, 0),
+        scale: int = 1,
+    ):
+        self.zoom = zoom
+        self.tile_x_min = tile_x_min
+        self.tile_y_min = tile_y_min
+        self.width = width
+        self.height = height
+        self.offset = offset
+        self.scale = scale
+
+    @classmethod
+    def from_meta(cls, meta: dict, zoom: int | None = None) -> "MosaicTransform":
+        """
+        {slug}.meta.json の内容から作成（tileMin がない旧形式にも対応）。
+        zoom 指定時は "levels" の該当ピラミッドレベルの変換。
+        """
+        if zoom is not None and zoom != meta["zoom"]:
+            for level in meta.get("levels", []):
+                if level["zoom"] == zoom:
+                    size = level["imageSize"]
+                    return cls(
+                        zoom, level["tileMin"]["x"], level["tileMin"]["y"],
+                        size["width"], size["height"],
+                    )
+            raise KeyError(f"z{zoom} のレベルがメタデータにありません")
+        if "tileMin" in meta:
+            x_min, y_min = meta["tileMin"]["x"], meta["tileMin"]["y"]
+        else:
+            half = meta["gridSize"] // 2
+            x_min = meta["tileCenter"]["x"] - half
+            y_min = meta["tileCenter"]["y"] - half
+        size = meta.get("imageSize", {})
+        return cls(meta["zoom"], x_min, y_min, size.get("width", 0), size.get("height", 0))
+
+    @classmethod
+    def from_meta_file(cls, path: str | Path, zoom: int | None = None) -> "MosaicTransform":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_meta(json.load(f), zoom)
+
+    def cropped(self, left: int, top: int, width: int, height: int) -> "MosaicTransform":
+        """(left, top) から切り出した画像用の変換（left, top はこの変換のピクセル座標）"""
+        ox, oy = self.offset
+        return MosaicTransform(
+            self.zoom, self.tile_x_min, self.tile_y_min, width, height,
+            (ox + left * self.scale, oy + top * self.scale), self.scale,
+        )
+
+    def scaled(self, factor: int) -> "MosaicTransform":
+        """1/factor に縮小デコードした画像用の変換"""
+        return MosaicTransform(
+            self.zoom, self.tile_x_min, self.tile_y_min,
+            -(-self.width // factor), -(-self.height // factor),
+            self.offset, self.scale * factor,
+        )
+
+    def to_pixel(self, lat: float, lng: float) -> tuple[int, int]:
+        px, py = latlng_to_pixel(lat, lng, self.zoom, self.tile_x_min, self.tile_y_min)
+        return (px - self.offset[0]) // self.scale, (py - self.offset[1]) // self.scale
+
+    def to_latlng(self, px: float, py: float) -> tuple[float, float]:
+        return pixel_to_latlng(
+            px * self.scale + self.offset[0], py * self.scale + self.offset[1],
+            self.zoom, self.tile_x_min, self.tile_y_min,
+        )
+
+    def to_pixel_array(self, lat, lng) -> tuple[np.ndarray, np.ndarray]:
+        px, py = latlng_to_pixel_array(lat, lng, self.zoom, self.tile_x_min, self.tile_y_min)
+        return (px - self.offset[0]) // self.scale, (py - self.offset[1]) // self.scale
+
+    def to_latlng_array(self, px, py) -> tuple[np.ndarray, np.ndarray]:
+        return pixel_to_latlng_array(
+            np.asarray(px, dtype=np.float64) * self.scale + self.offset[0],
+            np.asarray(py, dtype=np.float64) * self.scale + self.offset[1],
+            self.zoom, self.tile_x_min, self.tile_y_min,
+        )
+
+    def coords_to_pixels(self, coords) -> np.ndarray:
+        """[(lat, lng), ...] → (N, 2) のピクセル座標配列"""
+        lat, lng = split_latlng(coords)
+        px, py = self.to_pixel_array(lat, lng)
+        return np.stack([px, py], axis=1)
+
+    def bounds(self) -> tuple[float, float, float, float]:
+        """画像範囲の (south, west, north, east)"""
+        north, west = self.to_latlng(0, 0)
+        south, east = self.to_latlng(self.width, self.height)
+        return south, west, north, east
+
+
+# ---------------------------------------------------------------------------
+# 精度チェック
+# ---------------------------------------------------------------------------
+
+def check_round_trip(samples: int = 100000, seed: int = 0) -> bool:
+    """配列版とスカラー版の一致、および往復変換の誤差を確認"""
+    rng = np.random.default_rng(seed)
+    # 日本周辺（スポットの存在範囲）+ 全球
+    lat = np.concatenate([rng.uniform(24, 46, samples // 2), rng.uniform(-84, 84, samples // 2)])
+    lng = np.concatenate([rng.uniform(122, 154, samples // 2), rng.uniform(-179, 179, samples // 2)])
+    ok = True
+
+    for zoom in (12, 16, 18, 20):
+        tx, ty = latlng_to_tile_array(lat, lng, zoom)
+        lat2, lng2 = tile_to_latlng_array(tx, ty, zoom)
+        err = max(np.abs(lat2 - lat).max(), np.abs(lng2 - lng).max())
+        # タイル → 緯度経度の往復は double 精度の丸め誤差程度
+        good = err < 1e-9
+        ok &= good
+        print(f"  z={zoom:2d} 緯度経度→タイル→緯度経度: 最大誤差 {err:.2e}°  {'OK' if good else 'NG'}")
+
+    zoom = 18
+    tx0, ty0 = latlng_to_tile(35.0, 135.0, zoom)
+    px, py = latlng_to_pixel_array(lat[:1000], lng[:1000], zoom, tx0, ty0)
+    scalar = [latlng_to_pixel(a, b, zoom, tx0, ty0) for a, b in zip(lat[:1000], lng[:1000])]
+    same = all(p == (int(x), int(y)) for p, x, y in zip(scalar, px, py))
+    ok &= same
+    print(f"  latlng_to_pixel 配列版 = スカラー版: {'OK' if same else 'NG'}")
+
+    # ピクセル整数化による誤差は1px以内（z18で約0.6m以下）
+    lat3, lng3 = pixel_to_latlng_array(px, py, zoom, tx0, ty0)
+    px3, py3 = latlng_to_pixel_array(lat3, lng3, zoom, tx0, ty0)
+    pix_err = max(np.abs(px3 - px).max(), np.abs(py3 - py).max())
+    good = pix_err <= 1
+    ok &= good
+    print(f"  ピクセル→緯度経度→ピクセル: 最大誤差 {pix_err}px  {'OK' if good else 'NG'}")
+
+    mx, my = to_web_mercator_array(lat[:1000], lng[:1000])
+    scalar_m = np.array([to_web_mercator(a, b) for a, b in zip(lat[:1000], lng[:1000])])
+    m_err = max(np.abs(mx - scalar_m[:, 0]).max(), np.abs(my - scalar_m[:, 1]).max())
+    good = m_err < 1e-6
+    ok &= good
+    print(f"  to_web_mercator 配列版 = スカラー版: 最大差 {m_err:.2e}m  {'OK' if good else 'NG'}")
+    return ok
+
+
+def main():
+    if len(sys.argv) == 2 and sys.argv[1] == "check":
+        print("=== 座標変換の精度チェック ===")
+        ok = check_round_trip()
+        print("=== OK ===" if ok else "=== NG ===")
+        sys.exit(0 if ok else 1)
+    print("使用方法: python projection.py check")
+
+
+if __name__ == "__main__":
+    main()
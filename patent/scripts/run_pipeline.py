@@ -8,6 +8,7 @@ GSI航空写真を入力として、構造物を自動検出しJSONを出力す
 使用方法:
     python run_pipeline.py                    # 全スポット処理
     python run_pipeline.py hiraiso-fishing-park  # 単一スポット処理
+    python run_pipeline.py [slug] --min-size 1024  # 短辺1024px以上の最小ピラミッドレベルで処理
 """
 
 import json
@@ -20,6 +21,9 @@ import numpy as np
 import torch
 from PIL import Image
 
+from mosaic import content_box, has_aerial, load_aerial, select_level
+from projection import TILE_SIZE, MosaicTransform
+
 # ---------------------------------------------------------------------------
 # 定数
 # ---------------------------------------------------------------------------
@@ -494,20 +498,89 @@ def estimate_fish(categories: list[str], current_flow: float) -> list[dict]:
     return result
 
 
+# ---------------------------------------------------------------------------
+# 座標の書き戻し
+# ---------------------------------------------------------------------------
+
+def processed_transform(
+    image_meta: dict,
+    box: tuple[int, int, int, int],
+    zoom: int | None = None,
+) -> MosaicTransform:
+    """
+    処理した画像（zoom のピラミッドレベルから box で切り出したもの）の変換。
+    offset/scale は基準ズームの元モザイクのピクセル。
+    """
+    transform = MosaicTransform.from_meta(image_meta)
+    if zoom is not None and zoom != transform.zoom:
+        level = MosaicTransform.from_meta(image_meta, zoom)
+        factor = 2 ** (transform.zoom - zoom)
+        transform = transform.cropped(
+            (level.tile_x_min * factor - transform.tile_x_min) * TILE_SIZE,
+            (level.tile_y_min * factor - transform.tile_y_min) * TILE_SIZE,
+            level.width * factor, level.height * factor,
+        ).scaled(factor)
+    left, top, right, bottom = box
+    return transform.cropped(left, top, right - left, bottom - top)
+
+
+def to_mosaic_pixels(
+    structures: list[dict],
+    zones: list[dict],
+    transform: MosaicTransform,
+    image_meta: dict,
+) -> tuple[list[dict], list[dict]]:
+    """
+    処理した画像基準の bbox / relativePosition / areaRatio / xRange を、
+    元モザイク全体（imageSize）基準に直す。
+    """
+    ox, oy = transform.offset
+    k = transform.scale
+    width, height = image_meta["imageSize"]["width"], image_meta["imageSize"]["height"]
+    area = transform.width * transform.height * k * k / (width * height)
+
+    out_structures = []
+    for s in structures:
+        b = s["bbox"]
+        bbox = {
+            "x": ox + b["x"] * k,
+            "y": oy + b["y"] * k,
+            "width": b["width"] * k,
+            "height": b["height"] * k,
+        }
+        out_structures.append({
+            **s,
+            "bbox": bbox,
+            "areaRatio": round(s["areaRatio"] * area, 4),
+            "relativePosition": round((bbox["x"] + bbox["width"] / 2) / width, 3),
+        })
+
+    out_zones = [
+        {**z, "xRange": [round((ox + x * transform.width * k) / width, 3) for x in z["xRange"]]}
+        for z in zones
+    ]
+    return out_structures, out_zones
+
+
 # ---------------------------------------------------------------------------
 # メイン処理
 # ---------------------------------------------------------------------------
 
-def process_spot(slug: str) -> dict | None:
-    """1スポットを処理"""
+def process_spot(slug: str, min_size: int | None = None) -> dict | None:
+    """
+    1スポットを処理。
+
+    min_size 指定時は、有効範囲の短辺が min_size px 以上ある最小のピラミッド
+    レベルを使う（SAM2は内部で縮小するため、基準解像度は不要なことが多い）。
+    出力のピクセル座標はどちらの場合も基準ズームの元モザイク全体の座標。
+    """
     spot = SPOTS.get(slug)
     if not spot:
         print(f"  エラー: スポット '{slug}' が見つかりません")
         return None
 
-    image_path = SATELLITE_DIR / f"{slug}.jpg"
-    if not image_path.exists():
-        print(f"  エラー: 画像が見つかりません: {image_path}")
+    if not has_aerial(slug, SATELLITE_DIR):
+        print(f"  エラー: 画像が見つかりません: {SATELLITE_DIR / slug}.mosaic")
         return None
 
     # メタデータ読み込み
@@ -519,9 +592,19 @@ def process_spot(slug: str) -> dict | None:
 
     # 1. 画像読み込み
     print("  [1/4] 画像読み込み...")
-    image = np.array(Image.open(str(image_path)).convert("RGB"))
+    zoom = None
+    resolution = image_meta.get("resolution_m", 0.25)
+    # 海岸線帯だけ取得したモザイクは、取得範囲の外接矩形だけを処理する
+    if min_size and image_meta:
+        level = select_level(image_meta, min_size=min_size)
+        zoom, resolution = level["zoom"], level["resolution_m"]
+        box = content_box(image_meta, level)
+        image = np.array(load_aerial(slug, box, SATELLITE_DIR, zoom))
+    else:
+        box = content_box(image_meta) if "coverage" in image_meta else None
+        image = np.array(load_aerial(slug, box, SATELLITE_DIR))
     h, w = image.shape[:2]
-    print(f"    サイズ: {w}x{h}")
+    print(f"    サイズ: {w}x{h}" + (f" (z{zoom})" if zoom else ""))
 
     # 2. SAM2セグメンテーション
     print("  [2/4] SAM2セグメンテーション...")
@@ -550,16 +633,38 @@ def process_spot(slug: str) -> dict | None:
     zones = generate_zones(structures, w)
     print(f"    ゾーン数: {len(zones)}")
 
+    metadata = {
+        "source": image_meta.get("source", "gsi-aerial"),
+        "date": image_meta.get("date", "2024"),
+        "resolution": image_meta.get("resolution_m", 0.25),
+        "imageSize": {"width": w, "height": h},
+        "zoom": image_meta.get("zoom", 18),
+    }
+    if "tileMin" in image_meta:
+        metadata["tileMin"] = image_meta["tileMin"]
+
+    # 切り出した範囲・縮小レベルのピクセル座標を、基準ズームの元モザイク全体
+    # （tileMin 基準）の座標に戻す
+    if box is not None:
+        transform = processed_transform(image_meta, box, zoom)
+        structures, zones = to_mosaic_pixels(structures, zones, transform, image_meta)
+        ox, oy = transform.offset
+        metadata["imageSize"] = image_meta["imageSize"]
+        metadata["analyzedBox"] = {
+            "left": ox,
+            "top": oy,
+            "right": ox + w * transform.scale,
+            "bottom": oy + h * transform.scale,
+        }
+        if zoom is not None:
+            metadata["analyzedZoom"] = zoom
+            metadata["analyzedResolution"] = resolution
+
     # 結果構築
     result = {
         "spotSlug": slug,
         "coordinates": {"lat": spot["lat"], "lng": spot["lng"]},
-        "imageMetadata": {
-            "source": image_meta.get("source", "gsi-aerial"),
-            "date": image_meta.get("date", "2024"),
-            "resolution": image_meta.get("resolution_m", 0.25),
-            "imageSize": {"width": w, "height": h},
-        },
+        "imageMetadata": metadata,
         "layoutType": spot["layoutType"],
         "structureEndpoints": spot["endpoints"],
         "structureLabel": "護岸",
@@ -599,14 +704,21 @@ def main():
         print("ダウンロード: python download_aerial.py でモデルを取得してください")
         sys.exit(1)
 
+    args = sys.argv[1:]
+    min_size = None
+    if "--min-size" in args:
+        i = args.index("--min-size")
+        min_size = int(args[i + 1])
+        del args[i:i + 2]
+
     # 処理対象スポットを決定
-    if len(sys.argv) > 1:
-        slugs = [sys.argv[1]]
+    if args:
+        slugs = [args[0]]
     else:
         # 画像がある全スポットを処理
         slugs = [
             slug for slug in SPOTS
-            if (SATELLITE_DIR / f"{slug}.jpg").exists()
+            if has_aerial(slug, SATELLITE_DIR)
         ]
 
     if not slugs:
@@ -623,7 +735,7 @@ def main():
         print(f"[{SPOTS[slug]['name']}] {slug}")
         print(f"{'='*40}")
 
-        result = process_spot(slug)
+        result = process_spot(slug, min_size)
         if result:
             output_path = OUTPUT_DIR / f"{slug}.json"
             with open(output_path, "w", encoding="utf-8") as f:
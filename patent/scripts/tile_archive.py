@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+tile_archive.py
+
+航空写真タイルの単一ファイルアーカイブ（MBTiles: SQLite 1ファイル）。
+
+タイルキャッシュ（satellite/tiles/ のblob群）やディレクトリ（{z}/{x}/{y}.jpg）は
+全スポット分で数万〜数十万ファイルになり、別マシンへの移動が遅い・inodeを食う。
+MBTilesなら z/x/y で随時読み書きでき、移動はファイル1つのコピーで済む。
+
+  - TileCache と同じ get / put / contains / validators / mark_validated を持つので、
+    download_aerial.py / fleet_plan.py の --archive でキャッシュの代わりに使える
+  - provider / 撮影年はアーカイブ単位（metadata テーブル）で1種類
+  - tile_row は MBTiles の仕様通り TMS（y反転）で格納
+
+使用方法:
+    python tile_archive.py import <archive.mbtiles> [--from-cache DIR | --from-dir DIR | --from-zip ZIP]
+    python tile_archive.py export <archive.mbtiles> [--to-cache DIR | --to-dir DIR]
+    python tile_archive.py info <archive.mbtiles>
+"""
+
+import sys
+import sqlite3
+import zipfile
+import threading
+from pathlib import Path
+
+from tile_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, TileCache
+
+
+# 一括取り込み・書き出しで1トランザクションにまとめる件数
+BULK_BATCH = 1000
+
+
+class MBTilesArchive:
+    """MBTilesファイル1つを TileCache 互換のタイルストアとして扱う（スレッドセーフ）"""
+
+    def __init__(self, path: str | Path, provider: str | None = None, date: str | None = None):
+        self.path = Path(path)
+        self.hits = 0
+        self.misses = 0
+        # 容量上限なし（fleet_plan の見積もり警告用に TileCache と揃える）
+        self.max_bytes = float("inf")
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS tiles (
+                zoom_level INTEGER NOT NULL,
+                tile_column INTEGER NOT NULL,
+                tile_row INTEGER NOT NULL,
+                tile_data BLOB NOT NULL
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS tile_index
+                ON tiles (zoom_level, tile_column, tile_row);
+            CREATE TABLE IF NOT EXISTS validators (
+                zoom_level INTEGER NOT NULL,
+                tile_column INTEGER NOT NULL,
+                tile_row INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                PRIMARY KEY (zoom_level, tile_column, tile_row)
+            );
+            """
+        )
+        meta = dict(self._db.execute("SELECT name, value FROM metadata"))
+        defaults = {"name": self.path.stem, "format": "jpg", "type": "baselayer"}
+        for name, value in defaults.items():
+            if name not in meta:
+                self._db.execute("INSERT INTO metadata (name, value) VALUES (?, ?)", (name, value))
+        self._db.commit()
+        # provider / 撮影年は書き込み（put・取り込み）で初めて metadata に確定する
+        self._source_saved = "provider" in meta
+        self.provider = meta.get("provider", provider)
+        self.date = meta.get("date", date)
+
+    @staticmethod
+    def _key(z: int, x: int, y: int) -> tuple[int, int, int]:
+        # XYZ → TMS（MBTilesは南が0）
+        return z, x, (1 << z) - 1 - y
+
+    def _check_source(self, provider: str, date: str) -> bool:
+        """アーカイブの provider / 撮影年と一致するか（未設定のアーカイブはどれとも一致）"""
+        if self.provider is None:
+            return True
+        return (provider, date) == (self.provider, self.date)
+
+    def save_source(self, provider: str | None = None, date: str | None = None):
+        """provider / 撮影年を metadata に確定する（未設定なら引数の値で。読み取りでは呼ばない）"""
+        with self._lock:
+            if self._source_saved:
+                return
+            if self.provider is None:
+                self.provider, self.date = provider, date
+            if self.provider is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO metadata (name, value) VALUES ('provider', ?)", (self.provider,)
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO metadata (name, value) VALUES ('date', ?)", (self.date,)
+            )
+            self._db.commit()
+            self._source_saved = True
+
+    # --- z/x/y の直接読み書き ---
+
+    def read(self, z: int, x: int, y: int) -> bytes | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                self._key(z, x, y),
+            ).fetchone()
+        return bytes(row[0]) if row else None
+
+    def write(
+        self,
+        z: int,
+        x: int,
+        y: int,
+        data: bytes,
+        etag: str | None = None,
+        last_modified: str | None = None,
+        commit: bool = True,
+    ) -> bool:
+        """タイルを書き込み、以前の内容と異なる（または新規）なら True"""
+        key = self._key(z, x, y)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                key,
+            ).fetchone()
+            changed = row is None or bytes(row[0]) != data
+            if changed:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data)"
+                    " VALUES (?, ?, ?, ?)",
+                    (*key, sqlite3.Binary(data)),
+                )
+            if etag or last_modified:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO validators"
+                    " (zoom_level, tile_column, tile_row, etag, last_modified)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (*key, etag, last_modified),
+                )
+            if commit:
+                self._db.commit()
+        return changed
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+    def iter_tiles(self):
+        """全タイルを (z, x, y, data) で返す（z, x, y 順。BULK_BATCH 件ずつロックを取って読む）"""
+        last = (-1, -1, -1)
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles"
+                    " WHERE (zoom_level, tile_column, tile_row) > (?, ?, ?)"
+                    " ORDER BY zoom_level, tile_column, tile_row LIMIT ?",
+                    (*last, BULK_BATCH),
+                ).fetchall()
+            if not rows:
+                return
+            for z, x, row, data in rows:
+                yield z, x, (1 << z) - 1 - row, bytes(data)
+            last = rows[-1][:3]
+
+    # --- TileCache 互換 ---
+
+    def get(self, provider: str, date: str, z: int, x: int, y: int) -> bytes | None:
+        data = self.read(z, x, y) if self._check_source(provider, date) else None
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def contains(self, provider: str, date: str, z: int, x: int, y: int) -> bool:
+        if not self._check_source(provider, date):
+            return False
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                self._key(z, x, y),
+            ).fetchone()
+        return row is not None
+
+    def put(
+        self,
+        provider: str,
+        date: str,
+        z: int,
+        x: int,
+        y: int,
+        data: bytes,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ) -> bool:
+        if not self._check_source(provider, date):
+            raise ValueError(
+                f"アーカイブは {self.provider}/{self.date} 用です（{provider}/{date} は書き込めません）"
+            )
+        if not self._source_saved:
+            self.save_source(provider, date)
+        return self.write(z, x, y, data, etag, last_modified)
+
+    def validators(
+        self, provider: str, date: str, z: int, x: int, y: int
+    ) -> tuple[str | None, str | None] | None:
+        if not self.contains(provider, date, z, x, y):
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified FROM validators"
+                " WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                self._key(z, x, y),
+            ).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    def mark_validated(
+        self,
+        provider: str,
+        date: str,
+        z: int,
+        x: int,
+        y: int,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ):
+        if not (etag or last_modified):
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO validators"
+                " (zoom_level, tile_column, tile_row, etag, last_modified)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (*self._key(z, x, y), etag, last_modified),
+            )
+            self._db.commit()
+
+    def tile_count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0
+        return (
+            f"アーカイブ: ヒット{self.hits} / ミス{self.misses} ({rate:.0f}%), "
+            f"{self.path.name}"
+        )
+
+    def finalize(self):
+        """一括書き込み後にズーム範囲・範囲をmetadataへ記録し、ファイルを詰める"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MIN(zoom_level), MAX(zoom_level) FROM tiles"
+            ).fetchone()
+            if row[0] is not None:
+                for name, value in (("minzoom", row[0]), ("maxzoom", row[1])):
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                        (name, str(value)),
+                    )
+            self._db.commit()
+            self._db.execute("VACUUM")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _iter_dir(root: Path):
+    for path in sorted(root.glob("*/*/*.jpg")):
+        z, x = int(path.parent.parent.name), int(path.parent.name)
+        yield z, x, int(path.stem), path.read_bytes()
+
+
+def _iter_zip(path: Path):
+    with zipfile.ZipFile(path) as zf:
+        for name in sorted(zf.namelist()):
+            parts = name.split("/")
+            if len(parts) == 3 and parts[2].endswith(".jpg"):
+                yield int(parts[0]), int(parts[1]), int(parts[2][:-4]), zf.read(name)
+
+
+def import_tiles(archive: MBTilesArchive, tiles) -> int:
+    """(z, x, y, data[, etag, last_modified]) の列をまとめて書き込む"""
+    count = 0
+    for tile in tiles:
+        archive.write(*tile[:4], *tile[4:6], commit=False)
+        count += 1
+        if count % BULK_BATCH == 0:
+            archive.commit()
+            print(f"  {count}タイル")
+    archive.commit()
+    if count:
+        archive.save_source()
+    archive.finalize()
+    return count
+
+
+def cmd_import(archive_path: str, source: str, path: str):
+    if source == "cache":
+        cache = TileCache(path)
+        pairs = sorted({(p, d) for p, d, *_ in cache.iter_tiles(with_data=False)})
+        if len(pairs) > 1:
+            print(f"  警告: キャッシュに複数のprovider/撮影年があります {pairs}、先頭のみ取り込みます")
+        if not pairs:
+            print("  キャッシュが空です")
+            return
+        provider, date = pairs[0]
+        with MBTilesArchive(archive_path, provider, date) as archive:
+            count = import_tiles(archive, (
+                (z, x, y, data, etag, last_modified)
+                for p, d, z, x, y, data, etag, last_modified in cache.iter_tiles()
+                if (p, d) == (provider, date)
+            ))
+        cache.close()
+    else:
+        tiles = _iter_dir(Path(path)) if source == "dir" else _iter_zip(Path(path))
+        with MBTilesArchive(archive_path) as archive:
+            count = import_tiles(archive, tiles)
+    size = Path(archive_path).stat().st_size
+    print(f"取り込み: {count}タイル → {archive_path} ({size / 1024 ** 2:.1f}MB)")
+
+
+def cmd_export(archive_path: str, target: str, path: str):
+    count = 0
+    with MBTilesArchive(archive_path) as archive:
+        if target == "cache":
+            if archive.provider is None:
+                print("エラー: アーカイブに provider / date がありません（--to-dir を使用）")
+                return
+            # 書き出し中にLRUで消えないよう、アーカイブ容量以上の上限で開く
+            max_bytes = max(DEFAULT_MAX_BYTES, archive.path.stat().st_size * 2)
+            cache = TileCache(path, max_bytes=max_bytes)
+            for z, x, y, data in archive.iter_tiles():
+                cache.put(archive.provider, archive.date, z, x, y, data)
+                count += 1
+            cache.close()
+        else:
+            root = Path(path)
+            for z, x, y, data in archive.iter_tiles():
+                out = root / str(z) / str(x) / f"{y}.jpg"
+                out.parent.mkdir(parents=True, exist_ok=True)
+                out.write_bytes(data)
+                count += 1
+    print(f"書き出し: {count}タイル → {path}")
+
+
+def cmd_info(archive_path: str):
+    with MBTilesArchive(archive_path) as archive:
+        meta = dict(archive._db.execute("SELECT name, value FROM metadata"))
+        print(f"タイル: {archive.tile_count()}件")
+        print(f"容量: {archive.path.stat().st_size / 1024 ** 2:.1f}MB")
+        for name, value in sorted(meta.items()):
+            print(f"  {name}: {value}")
+
+
+def main():
+    args = sys.argv[1:]
+    sources = {"--from-cache": "cache", "--from-dir": "dir", "--from-zip": "zip",
+               "--to-cache": "cache", "--to-dir": "dir"}
+    kind, path = "cache", str(DEFAULT_CACHE_DIR)
+    for flag, name in sources.items():
+        if flag in args:
+            i = args.index(flag)
+            kind, path = name, args[i + 1]
+            del args[i:i + 2]
+
+    if len(args) == 2 and args[0] == "import":
+        cmd_import(args[1], kind, path)
+    elif len(args) == 2 and args[0] == "export":
+        cmd_export(args[1], kind, path)
+    elif len(args) == 2 and args[0] == "info":
+        cmd_info(args[1])
+    else:
+        print("使用方法:")
+        print("  python tile_archive.py import <archive.mbtiles> [--from-cache DIR | --from-dir DIR | --from-zip ZIP]")
+        print("  python tile_archive.py export <archive.mbtiles> [--to-cache DIR | --to-dir DIR]")
+        print("  python tile_archive.py info <archive.mbtiles>")
+
+
+if __name__ == "__main__":
+    main()
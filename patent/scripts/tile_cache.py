@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+tile_cache.py
+
+航空写真タイルのローカルキャッシュ（内容アドレス方式 + 容量上限付きLRU）。
+
+  - キー: (provider, date, z, x, y) → タイル本体のSHA-256
+  - 本体: blobs/<hash先頭2文字>/<hash>.jpg に1回だけ保存
+    （海面だけのタイル等、同一内容のタイルは1ファイルを共有）
+  - 索引: index.sqlite（最終アクセス時刻でLRU管理）
+  - 検証子: タイルごとの ETag / Last-Modified（条件付きGETでの再検証用）
+
+近接スポット（akashi-port / akashi-shinhato 等）で重なるタイルや、
+コード修正後の再実行で同じタイルを取りに行かないためのもの。
+
+使用方法:
+    python tile_cache.py stats                 # 件数・容量を表示
+    python tile_cache.py prune <max_mb>        # 指定容量までLRUで削除
+"""
+
+import sys
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+
+
+DEFAULT_CACHE_DIR = Path(__file__).parent / "satellite" / "tiles"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 2GB
+
+
+class TileCache:
+    """z/x/y + provider + 撮影年で引くディスクキャッシュ（スレッドセーフ）"""
+
+    def __init__(
+        self,
+        root: str | Path = DEFAULT_CACHE_DIR,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        (self.root / "blobs").mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.root / "index.sqlite"), check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tiles (
+                provider TEXT NOT NULL,
+                date TEXT NOT NULL,
+                z INTEGER NOT NULL,
+                x INTEGER NOT NULL,
+                y INTEGER NOT NULL,
+                hash TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                PRIMARY KEY (provider, date, z, x, y)
+            );
+            CREATE INDEX IF NOT EXISTS tiles_hash ON tiles (hash);
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS blobs_lru ON blobs (last_access);
+            """
+        )
+        # 検証子列のない旧索引に列を追加
+        columns = {r[1] for r in self._db.execute("PRAGMA table_info(tiles)")}
+        for column in ("etag", "last_modified"):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE tiles ADD COLUMN {column} TEXT")
+        self._db.commit()
+        row = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        self.total_bytes = row[0]
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.root / "blobs" / digest[:2] / f"{digest}.jpg"
+
+    def get(self, provider: str, date: str, z: int, x: int, y: int) -> bytes | None:
+        """キャッシュ済みタイルを返す（なければNone）"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT hash FROM tiles WHERE provider=? AND date=? AND z=? AND x=? AND y=?",
+                (provider, date, z, x, y),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            digest = row[0]
+            try:
+                data = self._blob_path(digest).read_bytes()
+            except FileNotFoundError:
+                # 本体が手動削除された場合は索引も捨ててミス扱い
+                self._forget_blob(digest)
+                self._db.commit()
+                self.misses += 1
+                return None
+            self._db.execute(
+                "UPDATE blobs SET last_access=? WHERE hash=?", (time.time(), digest)
+            )
+            self._db.commit()
+            self.hits += 1
+            return data
+
+    def contains(self, provider: str, date: str, z: int, x: int, y: int) -> bool:
+        """キャッシュ済みか（ヒット/ミスの集計には含めない）"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM tiles WHERE provider=? AND date=? AND z=? AND x=? AND y=?",
+                (provider, date, z, x, y),
+            ).fetchone()
+            return row is not None
+
+    def validators(
+        self, provider: str, date: str, z: int, x: int, y: int
+    ) -> tuple[str | None, str | None] | None:
+        """キャッシュ済みタイルの (ETag, Last-Modified)（未キャッシュならNone）"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified FROM tiles"
+                " WHERE provider=? AND date=? AND z=? AND x=? AND y=?",
+                (provider, date, z, x, y),
+            ).fetchone()
+            return (row[0], row[1]) if row else None
+
+    def mark_validated(
+        self,
+        provider: str,
+        date: str,
+        z: int,
+        x: int,
+        y: int,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ):
+        """304で内容が変わっていないと確認できたタイルの確認時刻・検証子を更新"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE tiles SET fetched_at=?, etag=COALESCE(?, etag),"
+                " last_modified=COALESCE(?, last_modified)"
+                " WHERE provider=? AND date=? AND z=? AND x=? AND y=?",
+                (now, etag, last_modified, provider, date, z, x, y),
+            )
+            self._db.commit()
+
+    def put(
+        self,
+        provider: str,
+        date: str,
+        z: int,
+        x: int,
+        y: int,
+        data: bytes,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ) -> bool:
+        """
+        タイルを保存し、容量上限を超えたら古いものから削除。
+        以前の内容と異なる（または新規）なら True を返す。
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        now = time.time()
+        with self._lock:
+            previous = self._db.execute(
+                "SELECT hash FROM tiles WHERE provider=? AND date=? AND z=? AND x=? AND y=?",
+                (provider, date, z, x, y),
+            ).fetchone()
+            exists = self._db.execute(
+                "SELECT 1 FROM blobs WHERE hash=?", (digest,)
+            ).fetchone()
+            if exists:
+                self._db.execute(
+                    "UPDATE blobs SET last_access=? WHERE hash=?", (now, digest)
+                )
+            else:
+                path = self._blob_path(digest)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+                self._db.execute(
+                    "INSERT INTO blobs (hash, size, last_access) VALUES (?, ?, ?)",
+                    (digest, len(data), now),
+                )
+                self.total_bytes += len(data)
+            self._db.execute(
+                "INSERT OR REPLACE INTO tiles"
+                " (provider, date, z, x, y, hash, fetched_at, etag, last_modified)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (provider, date, z, x, y, digest, now, etag, last_modified),
+            )
+            if previous and previous[0] != digest:
+                # 差し替えで参照がなくなった旧内容はLRUを待たずに削除
+                orphan = self._db.execute(
+                    "SELECT 1 FROM tiles WHERE hash=? LIMIT 1", (previous[0],)
+                ).fetchone()
+                if orphan is None:
+                    self._blob_path(previous[0]).unlink(missing_ok=True)
+                    self._forget_blob(previous[0])
+            self._evict(self.max_bytes)
+            self._db.commit()
+        return previous is None or previous[0] != digest
+
+    def _forget_blob(self, digest: str):
+        row = self._db.execute("SELECT size FROM blobs WHERE hash=?", (digest,)).fetchone()
+        if row:
+            self.total_bytes -= row[0]
+        self._db.execute("DELETE FROM blobs WHERE hash=?", (digest,))
+        self._db.execute("DELETE FROM tiles WHERE hash=?", (digest,))
+
+    def _evict(self, limit: int):
+        while self.total_bytes > limit:
+            row = self._db.execute(
+                "SELECT hash FROM blobs ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            digest = row[0]
+            self._blob_path(digest).unlink(missing_ok=True)
+            self._forget_blob(digest)
+            self.evictions += 1
+
+    def prune(self, max_bytes: int):
+        """指定容量以下になるまでLRUで削除"""
+        with self._lock:
+            self._evict(max_bytes)
+            self._db.commit()
+
+    def iter_tiles(self, with_data: bool = True):
+        """
+        全タイルを (provider, date, z, x, y, data, etag, last_modified) で返す
+        （with_data=False なら data は None、本体が失われたタイルは飛ばす）。
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT provider, date, z, x, y, hash, etag, last_modified FROM tiles"
+                " ORDER BY provider, date, z, x, y"
+            ).fetchall()
+        for provider, date, z, x, y, digest, etag, last_modified in rows:
+            data = None
+            if with_data:
+                try:
+                    data = self._blob_path(digest).read_bytes()
+                except FileNotFoundError:
+                    continue
+            yield provider, date, z, x, y, data, etag, last_modified
+
+    def tile_count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0
+        return (
+            f"キャッシュ: ヒット{self.hits} / ミス{self.misses} ({rate:.0f}%), "
+            f"削除{self.evictions}, {self.total_bytes / 1024 ** 2:.1f}MB"
+            f"/{self.max_bytes / 1024 ** 2:.0f}MB"
+        )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "stats":
+        cache = TileCache()
+        print(f"タイル: {cache.tile_count()}件")
+        print(f"容量: {cache.total_bytes / 1024 ** 2:.1f}MB")
+        cache.close()
+    elif len(sys.argv) == 3 and sys.argv[1] == "prune":
+        cache = TileCache()
+        cache.prune(int(float(sys.argv[2]) * 1024 ** 2))
+        print(f"削除: {cache.evictions}件, 残り{cache.total_bytes / 1024 ** 2:.1f}MB")
+        cache.close()
+    else:
+        print("使用方法:")
+        print("  python tile_cache.py stats")
+        print("  python tile_cache.py prune <max_mb>")
+
+
+if __name__ == "__main__":
+    main()
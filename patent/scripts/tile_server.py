@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+tile_server.py
+
+GSIタイルサーバーのローカル・スタンドイン（XYZ: /{z}/{x}/{y}.jpg）。
+
+本番のGSIに触らずに、取得の並列度・再試行・スループットを計測したり、
+オフラインでパイプラインを回したりするためのもの。
+
+  - 配信元: ディレクトリ（{root}/{z}/{x}/{y}.jpg）、zip（読み取り専用）、または MBTiles（tile_archive.py）
+  - 障害注入: 応答遅延（--latency-ms / --jitter-ms）、エラー率（--error-rate → 503）、
+    レート制限（--rate-limit 毎秒リクエスト数、超過分は 429 + Retry-After）
+  - 条件付きGET: 応答に ETag（内容のハッシュ）を付け、If-None-Match が一致すれば 304
+  - 記録モード（--record URL）: 手元にないタイルは上流から取得して
+    ディレクトリに保存してから返す。以後は同じディレクトリを再生に使う
+
+使用方法:
+    python tile_server.py serve <dir|zip|mbtiles> [--port 8765] [--latency-ms 50] [--jitter-ms 20]
+                                [--error-rate 0.05] [--rate-limit 200] [--record URL]
+    python tile_server.py bench <dir|zip|mbtiles> [--workers 1,4,8,16] [--grid 12] [障害注入オプション]
+
+    取得側: python download_aerial.py <slug> --tile-url http://127.0.0.1:8765/{z}/{x}/{y}.jpg
+"""
+
+import re
+import sys
+import time
+import hashlib
+import random
+import zipfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.request import urlopen, Request
+
+from tile_archive import MBTilesArchive
+from download_aerial import (
+    GSI_TILE_URL,
+    USER_AGENT,
+    fetch_tiles,
+    pop_option,
+)
+
+
+DEFAULT_PORT = 8765
+_PATH_RE = re.compile(r"^/(\d+)/(\d+)/(\d+)\.(?:jpg|jpeg|png)$")
+
+
+class DirectorySource:
+    """{root}/{z}/{x}/{y}.jpg 形式のディレクトリ"""
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+
+    def _path(self, z: int, x: int, y: int) -> Path:
+        return self.root / str(z) / str(x) / f"{y}.jpg"
+
+    def get(self, z: int, x: int, y: int) -> bytes | None:
+        try:
+            return self._path(z, x, y).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, z: int, x: int, y: int, data: bytes):
+        path = self._path(z, x, y)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+
+
+class ZipSource:
+    """{z}/{x}/{y}.jpg をメンバーに持つ zip（読み取り専用）"""
+
+    def __init__(self, path: str | Path):
+        self._zip = zipfile.ZipFile(path)
+        self._names = set(self._zip.namelist())
+        self._lock = threading.Lock()
+
+    def get(self, z: int, x: int, y: int) -> bytes | None:
+        name = f"{z}/{x}/{y}.jpg"
+        if name not in self._names:
+            return None
+        with self._lock:
+            return self._zip.read(name)
+
+
+class MBTilesSource:
+    """MBTilesアーカイブ（記録モードでは取得したタイルを追記）"""
+
+    def __init__(self, path: str | Path):
+        self.archive = MBTilesArchive(path)
+
+    def get(self, z: int, x: int, y: int) -> bytes | None:
+        return self.archive.read(z, x, y)
+
+    def put(self, z: int, x: int, y: int, data: bytes):
+        self.archive.write(z, x, y, data)
+
+    def names(self) -> list[str]:
+        return [f"{z}/{x}/{y}.jpg" for z, x, y, _ in self.archive.iter_tiles()]
+
+
+def open_source(path: str | Path):
+    path = Path(path)
+    if path.suffix == ".zip":
+        return ZipSource(path)
+    if path.suffix == ".mbtiles":
+        return MBTilesSource(path)
+    return DirectorySource(path)
+
+
+class FaultInjector:
+    """遅延・エラー・レート制限の注入"""
+
+    def __init__(
+        self,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        error_rate: float = 0,
+        rate_limit: float = 0,
+        seed: int | None = None,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        # トークンバケット（容量 = 1秒分）
+        self._tokens = rate_limit
+        self._last = time.monotonic()
+
+    def delay(self):
+        if self.latency_ms or self.jitter_ms:
+            with self._lock:
+                jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+            time.sleep(max(0.0, self.latency_ms + jitter) / 1000)
+
+    def should_fail(self) -> bool:
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def throttled(self) -> bool:
+        if not self.rate_limit:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate_limit, self._tokens + (now - self._last) * self.rate_limit)
+            self._last = now
+            if self._tokens < 1:
+                return True
+            self._tokens -= 1
+            return False
+
+
+class TileServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, source, faults: FaultInjector, record_url: str | None = None):
+        super().__init__(address, TileRequestHandler)
+        self.source = source
+        self.faults = faults
+        self.record_url = record_url
+        self.stats = {"200": 0, "304": 0, "404": 0, "429": 0, "503": 0, "recorded": 0}
+        self._stats_lock = threading.Lock()
+
+    def count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def record(self, z: int, x: int, y: int) -> bytes | None:
+        """上流から取得してソースに保存（記録モード）"""
+        url = self.record_url.format(z=z, x=x, y=y)
+        try:
+            req = Request(url, headers={"User-Agent": USER_AGENT})
+            with urlopen(req, timeout=10) as resp:
+                data = resp.read()
+        except Exception as e:
+            print(f"  記録失敗: z={z} x={x} y={y} - {e}")
+            return None
+        self.source.put(z, x, y, data)
+        self.count("recorded")
+        return data
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: TileServer
+
+    def _send(self, status: int, body: bytes = b"", headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(str(status))
+
+    def do_GET(self):
+        m = _PATH_RE.match(self.path.split("?")[0])
+        if not m:
+            self._send(404)
+            return
+        z, x, y = (int(v) for v in m.groups())
+        faults = self.server.faults
+
+        if faults.throttled():
+            self._send(429, headers={"Retry-After": "1"})
+            return
+        faults.delay()
+        if faults.should_fail():
+            self._send(503)
+            return
+
+        data = self.server.source.get(z, x, y)
+        if data is None and self.server.record_url:
+            data = self.server.record(z, x, y)
+        if data is None:
+            self._send(404)
+            return
+        etag = f'"{hashlib.sha1(data).hexdigest()}"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, headers={"ETag": etag})
+            return
+        self._send(200, data, {"Content-Type": "image/jpeg", "ETag": etag})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(
+    source_path: str | Path,
+    port: int = DEFAULT_PORT,
+    faults: FaultInjector | None = None,
+    record_url: str | None = None,
+) -> TileServer:
+    """バックグラウンドスレッドでサーバーを起動（ベンチマーク・他スクリプトからの利用向け）"""
+    server = TileServer(
+        ("127.0.0.1", port), open_source(source_path), faults or FaultInjector(), record_url
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def local_tile_url(server: TileServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/{{z}}/{{x}}/{{y}}.jpg"
+
+
+def run_bench(server: TileServer, worker_counts: list[int], grid: int):
+    """ソース中央の grid x grid を各並列度で取得して計測"""
+    zoom, cx, cy = source_center(server.source)
+    half = grid // 2
+    coords = [(cx - half + dx, cy - half + dy) for dy in range(grid) for dx in range(grid)]
+    url = local_tile_url(server)
+
+    print(f"=== ベンチマーク: z={zoom} {grid}x{grid} ({len(coords)}タイル) ===")
+    for workers in worker_counts:
+        start = time.perf_counter()
+        ok = sum(1 for _, _, data in fetch_tiles(zoom, coords, workers, None, url) if data)
+        elapsed = time.perf_counter() - start
+        print(f"  workers={workers:>3}: {elapsed:6.2f}s  {len(coords) / elapsed:7.1f} tiles/s  "
+              f"取得{ok}/{len(coords)}")
+    print(f"  サーバー応答: {server.stats}")
+
+
+def source_center(source) -> tuple[int, int, int]:
+    """ソース内タイルの中央（最多ズームでのx・yの中央値）"""
+    if isinstance(source, ZipSource):
+        names = source._names
+    elif isinstance(source, MBTilesSource):
+        names = source.names()
+    else:
+        names = (
+            str(p.relative_to(source.root)).replace("\\", "/")
+            for p in source.root.glob("*/*/*.jpg")
+        )
+    tiles = [tuple(int(v) for v in m.groups()) for m in (_PATH_RE.match("/" + n) for n in names) if m]
+    if not tiles:
+        raise SystemExit("エラー: ソースにタイルがありません")
+    zooms = [t[0] for t in tiles]
+    zoom = max(set(zooms), key=zooms.count)
+    xs = sorted(t[1] for t in tiles if t[0] == zoom)
+    ys = sorted(t[2] for t in tiles if t[0] == zoom)
+    return zoom, xs[len(xs) // 2], ys[len(ys) // 2]
+
+
+def main():
+    args = sys.argv[1:]
+    port = int(pop_option(args, "--port", str(DEFAULT_PORT)))
+    faults = FaultInjector(
+        latency_ms=float(pop_option(args, "--latency-ms", "0")),
+        jitter_ms=float(pop_option(args, "--jitter-ms", "0")),
+        error_rate=float(pop_option(args, "--error-rate", "0")),
+        rate_limit=float(pop_option(args, "--rate-limit", "0")),
+    )
+    record_url = pop_option(args, "--record")
+    if record_url == "gsi":
+        record_url = GSI_TILE_URL
+    worker_counts = [int(v) for v in pop_option(args, "--workers", "1,4,8,16").split(",")]
+    grid = int(pop_option(args, "--grid", "12"))
+
+    if record_url and len(args) == 2 and Path(args[1]).suffix == ".zip":
+        print("エラー: zipアーカイブには記録できません（--record にはディレクトリか .mbtiles を指定）")
+        sys.exit(2)
+
+    if len(args) == 2 and args[0] == "serve":
+        server = TileServer(("127.0.0.1", port), open_source(args[1]), faults, record_url)
+        print(f"配信中: {local_tile_url(server)}  （Ctrl+Cで終了）")
+        if record_url:
+            print(f"  記録モード: 未保持タイルは {record_url} から取得して {args[1]} に保存")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            print(f"\n応答集計: {server.stats}")
+    elif len(args) == 2 and args[0] == "bench":
+        server = start_server(args[1], port, faults, record_url)
+        try:
+            run_bench(server, worker_counts, grid)
+        finally:
+            server.shutdown()
+            server.server_close()
+    else:
+        print("使用方法:")
+        print("  python tile_server.py serve <dir|zip|mbtiles> [--port N] [--latency-ms MS] [--jitter-ms MS]")
+        print("                              [--error-rate P] [--rate-limit RPS] [--record URL|gsi]")
+        print("  python tile_server.py bench <dir|zip|mbtiles> [--workers 1,4,8,16] [--grid N] [障害注入オプション]")
+
+
+if __name__ == "__main__":
+    main()